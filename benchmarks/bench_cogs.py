@@ -0,0 +1,504 @@
+#!/usr/bin/env python3
+"""
+Offline throughput benchmark for the booru cogs.
+
+Drives the real cogs with synthetic Discord messages and favorite NOTIFY events,
+against a local fake Danbooru (see fake_danbooru.py) and a local Postgres (the usual
+DB_* env vars). Nothing talks to Discord, SauceNAO or a real booru, so this runs in CI.
+
+    python benchmarks/bench_cogs.py --messages 200 --output bench_output.txt
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import logging
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(BENCH_DIR)
+sys.path.append(os.path.join(os.path.dirname(BENCH_DIR), "boorubot"))
+
+from fake_danbooru import FakeDanbooru  # noqa: E402
+from discord_fakes import (  # noqa: E402
+    FakeAttachment,
+    FakeBot,
+    FakeInteraction,
+    FakeMessage,
+    FakeReference,
+    FakeUser,
+    OfflineSauce,
+    dispatched,
+)
+
+COGS = (
+    "cogs.booru_uploads",
+    "cogs.booru_background",
+    "cogs.booru_deletions",
+    "cogs.booru_favorites",
+    "cogs.booru_jobs",
+    "cogs.post_mirror",
+    "cogs.message_dispatch",
+)
+
+CONTRIBUTOR_ROLE = 4242
+
+
+def percentile(samples, pct):
+    from utilities.loop_watchdog import percentile as _percentile
+
+    return _percentile(samples, pct)
+
+
+class FlowResult:
+    def __init__(self, name):
+        self.name = name
+        self.latencies = []
+        self.errors = 0
+        self.wall = 0.0
+
+    def summary(self):
+        count = len(self.latencies)
+        return {
+            "flow": self.name,
+            "count": count,
+            "errors": self.errors,
+            "per_sec": count / self.wall if self.wall else 0.0,
+            "p50_ms": percentile(self.latencies, 50) * 1000,
+            "p99_ms": percentile(self.latencies, 99) * 1000,
+        }
+
+
+async def timed(result, coro):
+    start = time.perf_counter()
+    try:
+        await coro
+    except Exception:
+        logging.exception(f"{result.name} event failed")
+        result.errors += 1
+        return
+    result.latencies.append(time.perf_counter() - start)
+
+
+async def run_flow(name, events, concurrency):
+    """Push `events` (coroutine factories) through with bounded concurrency, like the
+    gateway would when a channel gets busy."""
+    result = FlowResult(name)
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one(factory):
+        async with gate:
+            await timed(result, factory())
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(factory) for factory in events))
+    result.wall = time.perf_counter() - start
+    return result
+
+
+async def drain_jobs(result, timeout=120):
+    """Wait for the job queue to empty, counting the wait in the flow's wall time, so
+    throughput numbers include the work the listeners only queued."""
+    from utilities import jobs
+
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        depth = await asyncio.to_thread(jobs.queue_depth)
+        if not depth.get("pending") and not depth.get("running"):
+            break
+        await asyncio.sleep(0.05)
+    result.wall += time.perf_counter() - start
+    return result
+
+
+def message_listeners(bot):
+    listeners = []
+    for cog in bot.cogs.values():
+        for name, func in cog.get_listeners():
+            if name == "on_message":
+                listeners.append(func)
+    return listeners
+
+
+def deliver(bot, message):
+    """What the gateway does for a MESSAGE_CREATE: every on_message listener runs, and
+    the delivery is done once the events they dispatched are handled too."""
+    listeners = message_listeners(bot)
+
+    async def run():
+        tasks = []
+        dispatched.set(tasks)  # run() is a task of its own, so this stays in here
+        await asyncio.gather(*(listener(message) for listener in listeners))
+        while tasks:
+            await tasks.pop()
+
+    return run
+
+
+async def bench_listener_cost(bot, channel, count):
+    """What the on_message listeners cost for plain chat, which is most messages and
+    nothing acts on. Every listener is a task, as it is when the gateway dispatches."""
+    chatter = FakeUser("chatter")
+    messages = [
+        FakeMessage(channel, chatter, f"just chatting {i}") for i in range(count)
+    ]
+    listeners = message_listeners(bot)
+
+    start = time.perf_counter()
+    for message in messages:
+        await asyncio.gather(*(listener(message) for listener in listeners))
+    elapsed = time.perf_counter() - start
+    return {"listeners": len(listeners), "us_per_message": elapsed / count * 1e6}
+
+
+def setup_env(booru_url, upload_channel, maintenance_channel):
+    os.environ["BOORU_URL"] = booru_url
+    os.environ.setdefault("BOORU_KEY", "bench")
+    os.environ.setdefault("BOORU_USER", "DiscordBot")
+    os.environ["BOORU_AUTO_UPLOAD"] = str(upload_channel.id)
+    os.environ["BOORU_MAINTENANCE"] = str(maintenance_channel.id)
+    os.environ["CONTRIBUTOR_ROLES"] = str(CONTRIBUTOR_ROLE)
+    os.environ["SAUCENAO_API_KEY"] = ""
+
+    # The fake "Danbooru DB" for favorites lives in the bench database
+    os.environ.setdefault("DB_HOST", "localhost")
+    os.environ.setdefault("DB_PORT", "5438")
+    os.environ.setdefault("DB_USER", "postgres")
+    os.environ.setdefault("DB_PASS", "postgres")
+    os.environ.setdefault("DB_NAME", "boorubot_db")
+    os.environ["DANBOORU_DB_NAME"] = os.environ["DB_NAME"]
+    os.environ.setdefault("DANBOORU_DB_READS", "true")
+
+
+def prepare_danbooru_tables():
+    from utilities.danbooru_db import connect
+
+    with connect() as conn:
+        # Scratch database, start each run with an empty queue so the once-per-slot
+        # sweep jobs from an earlier run don't swallow this one's
+        conn.execute("TRUNCATE jobs")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS users (id INTEGER PRIMARY KEY, name TEXT);
+            CREATE TABLE IF NOT EXISTS posts (
+                id INTEGER PRIMARY KEY, tag_string TEXT, rating CHAR(1)
+            );
+            ALTER TABLE posts
+                ADD COLUMN IF NOT EXISTS is_deleted BOOLEAN NOT NULL DEFAULT FALSE,
+                ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP NOT NULL DEFAULT now(),
+                ADD COLUMN IF NOT EXISTS source TEXT NOT NULL DEFAULT '',
+                ADD COLUMN IF NOT EXISTS is_pending BOOLEAN NOT NULL DEFAULT FALSE,
+                ADD COLUMN IF NOT EXISTS uploader_id INTEGER,
+                ADD COLUMN IF NOT EXISTS md5 TEXT,
+                ADD COLUMN IF NOT EXISTS file_ext TEXT;
+            CREATE TABLE IF NOT EXISTS tags (name TEXT PRIMARY KEY, category INTEGER);
+            """)
+        # The posts here mirror the fake booru's, which starts empty every run
+        conn.execute("TRUNCATE posts, post_mirror")
+        conn.execute(
+            "DELETE FROM key_value_store WHERE key LIKE %s", ("%post_mirror_synced_at",)
+        )
+
+
+def copy_fake_posts(fake):
+    """Write the fake booru's posts into the Danbooru DB tables, where the post index
+    and mirror sync from."""
+    from utilities.danbooru_db import connect
+
+    rows = [
+        (
+            p["id"],
+            p["tag_string"],
+            p["rating"],
+            p["source"],
+            p["is_pending"],
+            p["is_deleted"],
+            p["uploader_id"],
+        )
+        for p in fake.posts.values()
+    ]
+    with connect() as conn:
+        with conn.cursor() as cur:
+            cur.executemany(
+                """
+                INSERT INTO posts (id, tag_string, rating, source, is_pending,
+                    is_deleted, uploader_id)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                ON CONFLICT (id) DO UPDATE SET
+                    tag_string = EXCLUDED.tag_string, rating = EXCLUDED.rating,
+                    source = EXCLUDED.source, is_pending = EXCLUDED.is_pending,
+                    is_deleted = EXCLUDED.is_deleted, updated_at = now()
+                """,
+                rows,
+            )
+
+
+async def bench_uploads(bot, fake, channel, count, concurrency):
+    contributor = FakeUser("contributor", roles=[CONTRIBUTOR_ROLE])
+    events = []
+    for i in range(count):
+        filename = f"bench_{time.time_ns()}_{i}.png"
+        attachment = FakeAttachment(f"{fake.url}/cdn/{filename}", filename)
+        message = FakeMessage(channel, contributor, attachments=[attachment])
+        events.append(deliver(bot, message))
+    return await drain_jobs(await run_flow("upload", events, concurrency))
+
+
+async def bench_chat(bot, channel, count, concurrency):
+    chatter = FakeUser("chatter")
+    events = [
+        deliver(bot, FakeMessage(channel, chatter, f"just chatting {i}"))
+        for i in range(count)
+    ]
+    return await run_flow("chat", events, concurrency)
+
+
+async def bench_tag_replies(bot, fake, channel, count, concurrency):
+    tagger = FakeUser("tagger")
+    fake.tags.update({"cute", "canine", "outdoors"})
+
+    events = []
+    for i in range(count):
+        post_id = fake.add_post("tagme discord_archive missing_source")
+        prompt = FakeMessage(
+            channel, bot.user, f"{post_id}\n\n{fake.url}/posts/{post_id}"
+        )
+        reply = FakeMessage(
+            channel,
+            tagger,
+            f"cute canine outdoors source:https://example.com/{i}",
+            reference=FakeReference(prompt),
+        )
+        events.append(deliver(bot, reply))
+    return await drain_jobs(await run_flow("tag_reply", events, concurrency))
+
+
+RANDOM_VOCAB = ["canine", "feline", "cute", "outdoors", "solo", "duo", "comic"]
+
+
+async def bench_random(bot, fake, channel, count, concurrency, corpus=5000):
+    """/random over a corpus of posts that are both on the fake booru and in the
+    Danbooru DB, so the local post index is in play."""
+    rng = random.Random(1)
+    for _ in range(corpus):
+        fake.add_post(" ".join(rng.sample(RANDOM_VOCAB, 3)), rating=rng.choice("gsqe"))
+    await asyncio.to_thread(copy_fake_posts, fake)
+
+    cog = bot.get_cog("BooruCog")
+    await cog.sync_post_index.coro(cog)
+
+    user = FakeUser("randomer")
+    events = []
+    for _ in range(count):
+        tags = " ".join(rng.sample(RANDOM_VOCAB, 2))
+        interaction = FakeInteraction(channel, user)
+        events.append(lambda i=interaction, t=tags: cog.random.callback(cog, i, t))
+    return await run_flow("random", events, concurrency)
+
+
+async def bench_favorites(bot, channel, count, timeout=60):
+    from utilities.danbooru_db import FAVORITE_NOTIFY_CHANNEL, connect_async
+
+    result = FlowResult("favorite_announce")
+    sent_at = {}
+    done = asyncio.Event()
+
+    def on_send(message):
+        for post_id, start in list(sent_at.items()):
+            if f"/posts/{post_id}" in message.content:
+                result.latencies.append(time.perf_counter() - start)
+                del sent_at[post_id]
+        if len(result.latencies) == count:
+            done.set()
+
+    channel.on_send = on_send
+
+    # Give the LISTEN connection a moment to come up
+    cog = bot.get_cog("FavoriteWatcherCog")
+    await cog.on_leader_elected()
+    await asyncio.sleep(1)
+
+    base = 900_000 + int(time.time()) % 50_000 * 10
+    async with await connect_async() as conn:
+        await conn.execute(
+            "INSERT INTO users (id, name) VALUES (1, 'Vixi') ON CONFLICT DO NOTHING"
+        )
+        start = time.perf_counter()
+        for i in range(count):
+            post_id = base + i
+            await conn.execute(
+                "INSERT INTO posts (id, tag_string, rating) VALUES (%s, %s, 'e') "
+                "ON CONFLICT (id) DO NOTHING",
+                (post_id, "cute canine"),
+            )
+            sent_at[post_id] = time.perf_counter()
+            payload = json.dumps({"user_id": 1, "post_id": post_id})
+            await conn.execute(
+                "SELECT pg_notify(%s, %s)", (FAVORITE_NOTIFY_CHANNEL, payload)
+            )
+
+        try:
+            await asyncio.wait_for(done.wait(), timeout)
+        except asyncio.TimeoutError:
+            result.errors += len(sent_at)
+        result.wall = time.perf_counter() - start
+
+    channel.on_send = None
+    cog._listen_task.cancel()
+    return result
+
+
+async def bench_deletions(bot, fake, count):
+    for _ in range(count):
+        fake.add_post("fayanna solo")
+    await asyncio.to_thread(copy_fake_posts, fake)
+    await bot.get_cog("PostMirrorCog").sync_mirror.coro(bot.get_cog("PostMirrorCog"))
+
+    cog = bot.get_cog("BooruDeletionsCog")
+    result = FlowResult("deletion_sweep")
+    start = time.perf_counter()
+    await timed(result, cog.check_and_delete_posts.coro(cog))
+    result.wall = time.perf_counter() - start
+    await drain_jobs(result)
+
+    # Report per deleted post rather than per sweep, that's the number that matters.
+    # The sweep only queues work, so the drain counts too.
+    deleted = sum(1 for p in fake.posts.values() if p["is_deleted"])
+    result.latencies = [result.wall / deleted] * deleted if deleted else []
+    return result
+
+
+async def main(args):
+    from utilities.loop_watchdog import LoopWatchdog
+    from utilities.migrations import run_migrations
+    from utilities.database import store_key
+    from utilities.booru_cache import shared_cache
+    from utilities.danbooru_db import close_pool
+    from utilities.media import media_pool
+
+    fake = FakeDanbooru(image_size=args.image_size)
+    booru_url = fake.start()
+
+    bot = FakeBot()
+    await bot.attach()
+    upload_channel = bot.add_channel("bench-uploads", latency=args.discord_latency)
+    chat_channel = bot.add_channel("bench-chat", latency=args.discord_latency)
+    fav_channel = bot.add_channel("bench-favs", latency=args.discord_latency)
+    maintenance_channel = bot.add_channel(
+        "bench-maintenance", latency=args.discord_latency
+    )
+
+    setup_env(booru_url, upload_channel, maintenance_channel)
+    await run_migrations()
+    prepare_danbooru_tables()
+    store_key("fav_ch", fav_channel.id)
+
+    for extension in COGS:
+        await bot.load_extension(extension)
+    for cog in bot.cogs.values():
+        if hasattr(cog, "sauce"):
+            cog.sauce = OfflineSauce()
+
+    # Stand in for the leader election without starting every background loop, so
+    # the deletion reports get announced here
+    bot.is_leader = True
+    await bot.get_cog("BooruJobsCog").on_ready()
+    # Spawning the media workers is an on_ready thing too
+    await asyncio.gather(*map(asyncio.wrap_future, media_pool().start()))
+
+    watchdog = LoopWatchdog(threshold=args.block_threshold / 1000)
+    watchdog.start()
+
+    n, c = args.messages, args.concurrency
+    listener_cost = await bench_listener_cost(bot, chat_channel, n * 50)
+    results = [
+        await bench_chat(bot, chat_channel, n, c),
+        await bench_uploads(bot, fake, upload_channel, n, c),
+        await bench_tag_replies(bot, fake, chat_channel, n, c),
+        await bench_random(bot, fake, chat_channel, n, c),
+        await bench_favorites(bot, fav_channel, n),
+        await bench_deletions(bot, fake, n),
+    ]
+
+    watchdog.stop()
+    await bot.close()
+    await shared_cache().close()
+    await close_pool()
+    fake.stop()
+
+    return {
+        "flows": [r.summary() for r in results],
+        "listener_cost": listener_cost,
+        "loop_lag": watchdog.stats(),
+        "blocking_reports": len(watchdog.drain()),
+        "booru_cache": shared_cache().stats(),
+        "fake_booru_misses": sorted(set(fake.misses)),
+    }
+
+
+def format_report(report):
+    lines = [
+        f"{'flow':<18} {'count':>6} {'errors':>6} {'per_sec':>9} {'p50_ms':>9} {'p99_ms':>9}"
+    ]
+    for flow in report["flows"]:
+        lines.append(
+            f"{flow['flow']:<18} {flow['count']:>6} {flow['errors']:>6} "
+            f"{flow['per_sec']:>9.1f} {flow['p50_ms']:>9.1f} {flow['p99_ms']:>9.1f}"
+        )
+    lag = report["loop_lag"]
+    cost = report["listener_cost"]
+    lines.append("")
+    lines.append(
+        f"chat message: {cost['us_per_message']:.1f}us in "
+        f"{cost['listeners']} on_message listeners"
+    )
+    lines.append(
+        f"loop lag: p50 {lag['p50_ms']:.1f}ms, p99 {lag['p99_ms']:.1f}ms, "
+        f"max {lag['max_ms']:.1f}ms ({report['blocking_reports']} blocking reports)"
+    )
+    cache = report["booru_cache"]
+    lines.append(
+        f"booru cache: {cache['hits']} hits, {cache['misses']} misses, "
+        f"{cache['revalidated']} revalidated, {cache['coalesced']} coalesced"
+    )
+    if report["fake_booru_misses"]:
+        lines.append("fake booru misses (teach fake_danbooru.py these):")
+        lines.extend(f"  {miss}" for miss in report["fake_booru_misses"])
+    return "\n".join(lines)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--messages", type=int, default=100, help="Events per flow")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--image-size", type=int, default=64 * 1024)
+    parser.add_argument(
+        "--discord-latency",
+        type=float,
+        default=0.0,
+        help="Simulated seconds per Discord API call",
+    )
+    parser.add_argument(
+        "--block-threshold",
+        type=float,
+        default=100,
+        help="Loop stall (ms) that counts as a blocking report",
+    )
+    parser.add_argument("--output", help="Also write the JSON report here")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    logging.basicConfig(
+        level=logging.WARNING, format="%(levelname)s:%(name)s: %(message)s"
+    )
+
+    report = asyncio.run(main(args))
+    print(format_report(report))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
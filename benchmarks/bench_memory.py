@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Memory footprint of an in-memory post cache, plain tag strings vs interned tag ids.
+
+Builds the same synthetic posts (Zipf-ish tag popularity, like a real booru) three ways
+and reports bytes per post from tracemalloc, plus how long a favorites style filter
+takes over all of them.
+
+    python benchmarks/bench_memory.py --posts 500000
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import itertools
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(os.path.dirname(BENCH_DIR), "boorubot"))
+
+from utilities.danbooru_db import post_matches_filter  # noqa: E402
+from utilities.tag_table import PostRecord, TagFilter, TagTable  # noqa: E402
+
+FILTER = "-vore -gore -scat -watersports -irl -rating:general"
+
+
+def synthetic_posts(count, vocab, tags_per_post, seed=1):
+    """(id, rating, tag_string) rows, generated on the fly so each representation
+    allocates its own strings while being measured."""
+    rng = random.Random(seed)
+    names = [f"tag_{n}" for n in range(vocab - 5)] + [
+        "vore",
+        "gore",
+        "scat",
+        "watersports",
+        "irl",
+    ]
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(vocab)))
+    for post_id in range(1, count + 1):
+        tags = rng.choices(names, cum_weights=cum_weights, k=tags_per_post)
+        yield post_id, rng.choice("gsqe"), " ".join(tags)
+
+
+def as_strings(rows):
+    return {post_id: (tag_string, rating) for post_id, rating, tag_string in rows}
+
+
+def as_sets(rows):
+    return {
+        post_id: (frozenset(tag_string.split()), rating)
+        for post_id, rating, tag_string in rows
+    }
+
+
+def as_records(rows):
+    table = TagTable()
+    posts = {
+        post_id: PostRecord.from_tag_string(table, post_id, rating, tag_string)
+        for post_id, rating, tag_string in rows
+    }
+    return table, posts
+
+
+def measure(name, build, rows, count):
+    tracemalloc.start()
+    start = time.perf_counter()
+    built = build(rows)
+    elapsed = time.perf_counter() - start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return built, {
+        "cache": name,
+        "bytes_per_post": size / count,
+        "total_mb": size / 1024 / 1024,
+        "build_s": elapsed,
+    }
+
+
+def time_filter(match, posts):
+    start = time.perf_counter()
+    hits = sum(1 for post in posts if match(post))
+    return hits, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--posts", type=int, default=500_000)
+    parser.add_argument("--vocab", type=int, default=50_000)
+    parser.add_argument("--tags-per-post", type=int, default=25)
+    args = parser.parse_args(argv)
+
+    def rows():
+        return synthetic_posts(args.posts, args.vocab, args.tags_per_post)
+
+    results = []
+    strings, result = measure("tag_string", as_strings, rows(), args.posts)
+    results.append(result)
+    strings_hits, strings_s = time_filter(
+        lambda post: post_matches_filter(post[0], post[1], FILTER), strings.values()
+    )
+    del strings
+
+    _, result = measure("tag sets", as_sets, rows(), args.posts)
+    results.append(result)
+
+    (table, records), result = measure("interned", as_records, rows(), args.posts)
+    results.append(result)
+    compiled = TagFilter(table, FILTER)
+    records_hits, records_s = time_filter(compiled.matches, records.values())
+    assert strings_hits == records_hits
+
+    print(
+        f"{'cache':<12} {'bytes/post':>11} {'total_mb':>9} {'build_s':>8}  "
+        f"({args.posts} posts, {args.tags_per_post} tags each, {len(table)} distinct)"
+    )
+    for r in results:
+        print(
+            f"{r['cache']:<12} {r['bytes_per_post']:>11.0f} "
+            f"{r['total_mb']:>9.1f} {r['build_s']:>8.1f}"
+        )
+    print(
+        f"\nfilter over all posts: tag_string {strings_s * 1000:.0f}ms, "
+        f"interned {records_s * 1000:.0f}ms ({records_hits} matches)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""
+Just enough of discord.py's objects to push synthetic events through the cogs
+without a gateway connection.
+"""
+
+import asyncio
+import itertools
+import contextvars
+
+import discord
+from discord.ext import commands
+
+_snowflakes = itertools.count(1_000_000)
+
+# Events dispatched while handling a delivered message, so the bench can wait for them
+dispatched = contextvars.ContextVar("dispatched", default=None)
+
+
+def snowflake():
+    return next(_snowflakes)
+
+
+class FakeRole:
+    def __init__(self, role_id):
+        self.id = role_id
+
+
+class FakeUser:
+    def __init__(self, name, bot=False, roles=(), user_id=None):
+        self.id = user_id or snowflake()
+        self.name = name
+        self.bot = bot
+        self.roles = [FakeRole(r) for r in roles]
+        self.mention = f"<@{self.id}>"
+
+    def __str__(self):
+        return self.name
+
+    def __eq__(self, other):
+        return getattr(other, "id", None) == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+
+class FakeReference:
+    def __init__(self, resolved):
+        self.resolved = resolved
+        self.message_id = resolved.id
+
+
+class FakeAttachment:
+    def __init__(self, url, filename, content_type="image/png"):
+        self.url = url
+        self.filename = filename
+        self.content_type = content_type
+
+    async def save(self, path):
+        import aiohttp
+
+        async with aiohttp.ClientSession() as session:
+            async with session.get(self.url) as resp:
+                with open(path, "wb") as f:
+                    f.write(await resp.read())
+
+
+class FakeMessage:
+    def __init__(
+        self, channel, author, content="", attachments=(), reference=None, guild=None
+    ):
+        self.id = snowflake()
+        self.channel = channel
+        self.author = author
+        self.content = content
+        self.attachments = list(attachments)
+        self.reference = reference
+        self.guild = guild
+        self.reactions = []
+        self.deleted = False
+
+    async def add_reaction(self, emoji):
+        if self not in self.channel.messages:
+            self.channel.messages.append(self)  # So job follow-ups can fetch it
+        await self.channel.api_call()
+        self.reactions.append(emoji)
+
+    async def reply(self, content=None, **kwargs):
+        return await self.channel.send(content, reference=FakeReference(self), **kwargs)
+
+    async def edit(self, content=None, **kwargs):
+        await self.channel.api_call()
+        self.content = content
+
+    async def delete(self):
+        await self.channel.api_call()
+        self.deleted = True
+
+
+class FakeChannel:
+    def __init__(self, bot, name, nsfw=True, latency=0.0):
+        self.id = snowflake()
+        self.name = name
+        self.nsfw = nsfw
+        self.mention = f"<#{self.id}>"
+        self.latency = latency  # Simulated round trip to Discord
+
+        self.bot = bot
+        self.messages = []
+        self.on_send = None  # Optional hook(message), used to time announcements
+
+    def __str__(self):
+        return self.name
+
+    async def api_call(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def send(self, content=None, reference=None, **kwargs):
+        await self.api_call()
+        message = FakeMessage(self, self.bot.user, content or "", reference=reference)
+        self.messages.append(message)
+        if self.on_send is not None:
+            self.on_send(message)
+        return message
+
+    async def fetch_message(self, message_id):
+        await self.api_call()
+        for message in self.messages:
+            if message.id == message_id:
+                return message
+        raise discord.NotFound(_FakeResponse(404), "Unknown Message")
+
+    async def history(self, limit=100):
+        for message in reversed(self.messages[-limit:]):
+            yield message
+
+
+class FakeInteractionResponse:
+    def __init__(self, channel):
+        self.channel = channel
+        self.sent = []
+
+    async def send_message(self, content=None, **kwargs):
+        await self.channel.api_call()
+        self.sent.append(content)
+
+
+class FakeInteraction:
+    """An app command invocation, for calling command callbacks directly."""
+
+    def __init__(self, channel, user):
+        self.channel = channel
+        self.user = user
+        self.response = FakeInteractionResponse(channel)
+
+
+class FakeBot(commands.Bot):
+    """A real commands.Bot (so cogs, listeners and the app command tree work) that
+    never logs in; channels and the bot user are all local."""
+
+    def __init__(self):
+        intents = discord.Intents(messages=True, reactions=True, guilds=True)
+        intents.message_content = True
+        super().__init__(command_prefix="^", intents=intents)
+
+        self.version = "bench"
+        self.channels = {}
+        self._fake_user = FakeUser("BooruBot", bot=True)
+        self._fake_closed = False
+
+    @property
+    def user(self):
+        return self._fake_user
+
+    async def attach(self):
+        """Bind to the running loop, which login() would normally do, so that
+        bot.dispatch() can schedule custom events like on_job_done."""
+        self.loop = asyncio.get_running_loop()
+
+    def add_channel(self, name, **kwargs):
+        channel = FakeChannel(self, name, **kwargs)
+        self.channels[channel.id] = channel
+        return channel
+
+    def get_channel(self, channel_id):
+        return self.channels.get(channel_id)
+
+    async def fetch_channel(self, channel_id):
+        channel = self.channels.get(channel_id)
+        if channel is None:
+            raise discord.NotFound(_FakeResponse(404), "Unknown Channel")
+        return channel
+
+    def _schedule_event(self, coro, event_name, *args, **kwargs):
+        task = super()._schedule_event(coro, event_name, *args, **kwargs)
+        tasks = dispatched.get()
+        if tasks is not None:
+            tasks.append(task)
+        return task
+
+    async def wait_until_ready(self):
+        return
+
+    def is_closed(self):
+        return self._fake_closed
+
+    async def change_presence(self, **kwargs):
+        return
+
+    async def close(self):
+        self._fake_closed = True
+
+
+class _FakeResponse:
+    def __init__(self, status):
+        self.status = status
+        self.reason = "fake"
+
+
+class OfflineSauce:
+    """Stands in for saucenao_api.SauceNao so nothing leaves the machine."""
+
+    def from_url(self, url):
+        return []
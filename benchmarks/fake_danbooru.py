@@ -0,0 +1,404 @@
+"""
+A tiny in-memory Danbooru (plus a fake Discord CDN) for offline benchmarks.
+
+Only implements the slice of the API that the bot and Booru_Scripts touch. Anything
+it doesn't know about is answered with a 404 and recorded in `misses`, so if the
+benchmark starts reporting misses the fake needs teaching a new endpoint.
+"""
+
+import json
+import random
+import asyncio
+import hashlib
+import itertools
+import threading
+
+from datetime import datetime, timezone
+
+from aiohttp import web
+
+RATING_NAMES = {"g": "general", "s": "sensitive", "q": "questionable", "e": "explicit"}
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def fake_image_bytes(name, size=64 * 1024):
+    """Deterministic, unique-per-name bytes that look enough like a PNG."""
+    seed = hashlib.md5(name.encode()).digest()
+    body = (seed * (size // len(seed) + 1))[:size]
+    return b"\x89PNG\r\n\x1a\n" + body
+
+
+class FakeDanbooru:
+    def __init__(self, image_size=64 * 1024):
+        self.image_size = image_size
+
+        self.posts = {}
+        self.tags = set()
+        self.comments = []
+        self.users = {1: "DiscordBot"}
+        self.uploads = {}
+        self.md5s = {}  # md5 -> post id
+
+        self.misses = []
+        self.request_counts = {}
+
+        self._ids = itertools.count(1)
+        self._runner = None
+        self._loop = None
+        self._thread = None
+        self.url = None
+
+    # Seeding helpers
+
+    def add_post(self, tag_string, rating="e", source="", is_pending=False, md5=None):
+        post_id = next(self._ids)
+        self.posts[post_id] = {
+            "id": post_id,
+            "tag_string": tag_string,
+            "tag_string_artist": " ".join(
+                t[4:] for t in tag_string.split() if t.startswith("art:")
+            ),
+            "source": source,
+            "rating": rating,
+            "is_pending": is_pending,
+            "is_deleted": False,
+            "uploader_id": 1,
+            "md5": md5 or hashlib.md5(str(post_id).encode()).hexdigest(),
+            "file_ext": "png",
+            "file_url": f"{self.url}/data/{post_id}.png",
+            "created_at": _now(),
+            "updated_at": _now(),
+        }
+        self.tags.update(tag_string.split())
+        self.md5s[self.posts[post_id]["md5"]] = post_id
+        return post_id
+
+    def add_comment(self, post_id, body, creator_id=1):
+        comment_id = len(self.comments) + 1
+        self.comments.append(
+            {
+                "id": comment_id,
+                "post_id": post_id,
+                "creator_id": creator_id,
+                "body": body,
+                "created_at": _now(),
+            }
+        )
+        return comment_id
+
+    # Server lifecycle
+
+    def start(self, host="127.0.0.1", port=0):
+        """
+        Serve from a thread with its own loop. Booru_Scripts makes blocking `requests`
+        calls from the bot's loop, so a server sharing that loop would deadlock.
+        """
+        self._loop = asyncio.new_event_loop()
+        ready = threading.Event()
+
+        def serve():
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self._serve(host, port))
+            ready.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=serve, name="fake-danbooru", daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self.url
+
+    async def _serve(self, host, port):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_route("*", "/{path:.*}", self.dispatch)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{port}"
+
+    def stop(self):
+        if self._runner is not None:
+            asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result(
+                timeout=10
+            )
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=10)
+
+    # Routing
+
+    async def dispatch(self, request):
+        path = "/" + request.match_info["path"]
+        if path.endswith(".json"):
+            path = path[:-5]
+        parts = [p for p in path.split("/") if p]
+        route = (request.method, tuple("{id}" if p.isdigit() else p for p in parts))
+
+        self.request_counts[route] = self.request_counts.get(route, 0) + 1
+
+        if parts and parts[0] == "cdn":
+            return await self.cdn(request)
+
+        handler = self.ROUTES.get(route)
+        if handler is None:
+            self.misses.append(f"{request.method} {request.path_qs}")
+            return web.json_response({"success": False}, status=404)
+
+        ids = [int(p) for p in parts if p.isdigit()]
+        return await handler(self, request, *ids)
+
+    async def _params(self, request):
+        params = dict(request.query)
+        if request.can_read_body and request.content_type != "multipart/form-data":
+            if request.content_type == "application/json":
+                params.update(_flatten(await request.json()))
+            else:
+                params.update(await request.post())
+        return params
+
+    # Posts
+
+    def _search(self, query):
+        terms = query.split()
+        posts = [p for p in self.posts.values() if not p["is_deleted"]]
+
+        if "OR" in terms or any(t.startswith("~") for t in terms):
+            wanted = {t.lstrip("~") for t in terms if t != "OR"}
+            return [p for p in posts if wanted & set(p["tag_string"].split())]
+
+        for term in terms:
+            posts = [p for p in posts if _matches(p, term)]
+        return posts
+
+    async def list_posts(self, request):
+        params = await self._params(request)
+        tags = params.get("tags", "")
+        limit = int(params.get("limit", 20))
+
+        posts = self._search(tags)
+        if params.get("random") in ("true", "1") or "order:random" in tags:
+            posts = random.sample(posts, min(limit, len(posts)))
+        else:
+            posts = sorted(posts, key=lambda p: p["id"], reverse=True)
+
+        return web.json_response(posts[:limit])
+
+    async def show_post(self, request, post_id):
+        post = self.posts.get(post_id)
+        if post is None:
+            return web.json_response({"success": False}, status=404)
+
+        etag = f'"{post_id}-{post["updated_at"]}-{len(post["tag_string"])}"'
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers={"ETag": etag})
+        return web.json_response(post, headers={"ETag": etag})
+
+    async def update_post(self, request, post_id):
+        post = self.posts.get(post_id)
+        if post is None:
+            return web.json_response({"success": False}, status=404)
+
+        params = await self._params(request)
+        tag_string = params.get("post[tag_string]")
+        if tag_string is not None:
+            # Like Danbooru, the tag string replaces the post's tags, and `-tag`
+            # tokens remove a tag even if it was listed. With `old_tag_string` it's
+            # merged instead: what changed relative to it is applied to the post's
+            # current tags.
+            tokens = tag_string.split()
+            old_tag_string = params.get("post[old_tag_string]")
+            if old_tag_string is not None:
+                old, current = old_tag_string.split(), post["tag_string"].split()
+                kept = [t for t in current if t in tokens]
+                tokens = [t for t in current + tokens if t not in old] + kept
+            removed = {t[1:] for t in tokens if t.startswith("-")}
+            current = [t for t in tokens if not t.startswith("-") and t not in removed]
+            post["tag_string"] = " ".join(dict.fromkeys(current))
+            self.tags.update(current)
+        if "post[source]" in params:
+            post["source"] = params["post[source]"]
+        if "post[rating]" in params:
+            post["rating"] = params["post[rating]"]
+
+        post["updated_at"] = _now()
+        return web.json_response(post)
+
+    async def delete_post(self, request, post_id):
+        post = self.posts.get(post_id)
+        if post is None:
+            return web.json_response({"success": False}, status=404)
+        post["is_deleted"] = True
+        return web.json_response(post)
+
+    async def create_post(self, request):
+        params = await self._params(request)
+        asset_id = int(
+            params.get("upload_media_asset_id")
+            or params.get("post[upload_media_asset_id]")
+            or 0
+        )
+        upload = self.uploads.get(asset_id)
+        if upload is None:
+            return web.json_response({"success": False}, status=422)
+
+        post_id = self.add_post(
+            params.get("post[tag_string]", params.get("tag_string", "tagme")),
+            rating=params.get("post[rating]", params.get("rating", "e")),
+            source=params.get("post[source]", ""),
+            md5=upload["md5"],
+        )
+        return web.json_response(self.posts[post_id], status=201)
+
+    # Uploads
+
+    async def _read_file(self, request):
+        data = b""
+        params = {}
+        reader = await request.multipart()
+        async for part in reader:
+            if part.filename:
+                data = await part.read(decode=False)
+            else:
+                params[part.name] = await part.text()
+        return data, params
+
+    async def create_upload(self, request):
+        if request.content_type == "multipart/form-data":
+            data, _ = await self._read_file(request)
+        else:
+            # A source upload, fetched server side. Only our own CDN is reachable.
+            params = await self._params(request)
+            name = params.get("upload[source]", "").rsplit("/cdn/", 1)[-1]
+            data = fake_image_bytes(name, self.image_size)
+
+        upload_id = len(self.uploads) + 1
+        md5 = hashlib.md5(data).hexdigest()
+        self.uploads[upload_id] = {"id": upload_id, "md5": md5, "size": len(data)}
+        asset = {"id": upload_id, "media_asset_id": upload_id, "md5": md5}
+        return web.json_response(
+            {
+                "id": upload_id,
+                "status": "completed",
+                "upload_media_assets": [asset],
+                "media_assets": [{"id": upload_id, "md5": md5}],
+            },
+            status=201,
+        )
+
+    async def show_upload(self, request, upload_id):
+        upload = self.uploads.get(upload_id)
+        if upload is None:
+            return web.json_response({"success": False}, status=404)
+        asset = {"id": upload_id, "media_asset_id": upload_id, "md5": upload["md5"]}
+        return web.json_response(
+            {"id": upload_id, "status": "completed", "upload_media_assets": [asset]}
+        )
+
+    async def iqdb_query(self, request):
+        if request.content_type == "multipart/form-data":
+            data, _ = await self._read_file(request)
+        else:
+            data = b""
+        post_id = self.md5s.get(hashlib.md5(data).hexdigest())
+        if post_id is None:
+            return web.json_response([])
+        return web.json_response(
+            [{"post_id": post_id, "score": 100, "post": self.posts[post_id]}]
+        )
+
+    # Tags, comments, users
+
+    async def list_tags(self, request):
+        params = await self._params(request)
+        name = params.get("search[name]") or params.get("search[name_matches]", "")
+        names = [t for t in name.split(",") if t in self.tags]
+        return web.json_response(
+            [{"id": i, "name": n, "post_count": 1} for i, n in enumerate(names, 1)]
+        )
+
+    async def list_comments(self, request):
+        params = await self._params(request)
+        id_gt = int(params.get("search[id_gt]", 0) or 0)
+        limit = int(params.get("limit", 20))
+        comments = [c for c in self.comments if c["id"] > id_gt]
+        comments.sort(key=lambda c: c["id"], reverse=True)
+        return web.json_response(comments[:limit])
+
+    async def show_user(self, request, user_id):
+        name = self.users.get(user_id, f"user_{user_id}")
+        return web.json_response({"id": user_id, "name": name})
+
+    async def list_users(self, request):
+        params = await self._params(request)
+        user_id = int(params.get("search[id]", 0) or 0)
+        return web.json_response(
+            [{"id": user_id, "name": self.users.get(user_id, f"user_{user_id}")}]
+        )
+
+    # Discord CDN
+
+    async def cdn(self, request):
+        name = request.match_info["path"]
+        return web.Response(
+            body=fake_image_bytes(name, self.image_size), content_type="image/png"
+        )
+
+    ROUTES = {
+        ("GET", ("posts",)): list_posts,
+        ("POST", ("posts",)): create_post,
+        ("GET", ("posts", "{id}")): show_post,
+        ("PUT", ("posts", "{id}")): update_post,
+        ("PATCH", ("posts", "{id}")): update_post,
+        ("DELETE", ("posts", "{id}")): delete_post,
+        ("POST", ("posts", "{id}", "delete")): delete_post,
+        ("POST", ("uploads",)): create_upload,
+        ("GET", ("uploads", "{id}")): show_upload,
+        ("GET", ("iqdb_queries",)): iqdb_query,
+        ("POST", ("iqdb_queries",)): iqdb_query,
+        ("GET", ("tags",)): list_tags,
+        ("GET", ("comments",)): list_comments,
+        ("GET", ("users",)): list_users,
+        ("GET", ("users", "{id}")): show_user,
+    }
+
+
+def _matches(post, term):
+    negate = term.startswith("-")
+    term = term.lstrip("-")
+
+    if term.startswith("order:"):
+        return True
+    if term.startswith("status:"):
+        status = term[7:]
+        if status == "pending":
+            hit = post["is_pending"]
+        elif status == "deleted":
+            hit = post["is_deleted"]
+        else:
+            hit = True
+    elif term.startswith("rating:"):
+        rating = term[7:]
+        hit = rating in (post["rating"], RATING_NAMES.get(post["rating"]))
+    elif term.startswith("id:>"):
+        hit = post["id"] > int(term[4:])
+    elif term.startswith("md5:"):
+        hit = post["md5"] == term[4:]
+    else:
+        hit = term in post["tag_string"].split()
+
+    return not hit if negate else hit
+
+
+def _flatten(data, prefix=""):
+    """{"post": {"tag_string": "x"}} -> {"post[tag_string]": "x"}"""
+    flat = {}
+    for key, value in data.items():
+        name = f"{prefix}[{key}]" if prefix else key
+        if isinstance(value, dict):
+            flat.update(_flatten(value, name))
+        else:
+            flat[name] = value if isinstance(value, str) else json.dumps(value)
+    return flat
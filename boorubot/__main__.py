@@ -1,8 +1,22 @@
 # BooruBot
 
+import sys
 
-from .main import BooruBot
 
-bot = BooruBot()
+def main():
+    # `python -m boorubot worker` runs a job worker with no Discord connection
+    if len(sys.argv) > 1 and sys.argv[1] == "worker":
+        from .worker import run_worker
 
-bot.run()
+        run_worker()
+        return
+
+    from .main import BooruBot
+
+    bot = BooruBot()
+
+    bot.run()
+
+
+if __name__ == "__main__":
+    main()
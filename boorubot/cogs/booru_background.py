@@ -1,26 +1,26 @@
 import os
 import json
-import importlib.util
+import time
 import discord
 import logging
 import aiohttp
 import asyncio
+import psycopg
 
 from datetime import datetime
 from typing import Optional
 from discord import app_commands
 from discord.ext import commands, tasks
 
-from saucenao_api import SauceNao
-from saucenao_api.errors import SauceNaoApiError
-
+from utilities import jobs, post_mirror
+from utilities.booru_cache import shared_cache
+from utilities.booru_scripts import booru_scripts
+from utilities.config import config
+from utilities import danbooru_db
 from utilities.database import retrieve_key, store_key
-
-# Load booru_scripts module using importlib
-_script_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "scripts", "Booru_Scripts", "booru_utils.py")
-spec = importlib.util.spec_from_file_location("booru_scripts", _script_path)
-booru_scripts = importlib.util.module_from_spec(spec)
-spec.loader.exec_module(booru_scripts)
+from utilities.outbox import shared_outbox
+from utilities.sharding import shard_of
+from utilities.throttle import BOORU_READ, SAUCENAO, ServiceUnavailable, service
 
 
 class BackgroundBooru(commands.Cog, name="BooruBackgroundCog"):
@@ -28,28 +28,39 @@ class BackgroundBooru(commands.Cog, name="BooruBackgroundCog"):
         self.bot = bot
 
         # Configure options and secrets
-        self.api_key = os.environ.get("BOORU_KEY", "")
-        self.api_user = os.environ.get("BOORU_USER", "")
-        self.api_url = os.environ.get("BOORU_URL", "")
+        self.api_key = config().booru_key
+        self.api_user = config().booru_user
+        self.api_url = config().booru_url
 
         # Configure SauceNAO
-        self.sauce_api_key = os.environ.get("SAUCENAO_API_KEY", "")
-        self.sauce = SauceNao(api_key=self.sauce_api_key)
+        self.sauce_api_key = config().saucenao_api_key
+        self.sauce = None  # Created on first use, saucenao_api is slow to import
+
+    def _tasks(self):
+        return (
+            self.update_status,
+            self.check_new_comments,
+            self.check_and_report_posts,
+            self.check_modqueue,
+        )
 
-        # Get channels
-        _booru_channels = str(os.environ.get("BOORU_AUTO_UPLOAD")).split(",")
-        self.fav_ch = _booru_channels[0]  # First channel in list is where favs go
-        self.maintenance_channel_id = str(os.environ.get("BOORU_MAINTENANCE"))
-        self.alert_channel_id = str(os.environ.get("ALERT_CHAN_ID", ""))
-        self.tag_help_thread_id = str(os.environ.get("TAG_HELP_THREAD", ""))
+    # None of these are tied to a guild, and they'd double post if every replica ran
+    # them, so they only run on the leader (see cogs/leader.py)
+    @commands.Cog.listener()
+    async def on_leader_elected(self):
+        for task in self._tasks():
+            if not task.is_running():
+                task.start()
 
     @commands.Cog.listener()
-    async def on_ready(self):
-        # Start tasks
-        self.update_status.start()
-        self.check_new_comments.start()
-        self.check_and_report_posts.start()
-        self.check_modqueue.start()
+    async def on_leader_deposed(self):
+        for task in self._tasks():
+            task.cancel()
+
+    async def cog_unload(self):
+        for task in self._tasks():
+            task.cancel()
+        await shared_outbox().flush()
 
     def check_reply(self, message):
         try:
@@ -84,10 +95,8 @@ class BackgroundBooru(commands.Cog, name="BooruBackgroundCog"):
             return False
 
     @commands.Cog.listener()
-    async def on_message(self, message):
-        if message.author.bot:
-            return
-
+    async def on_bot_reply(self, message):
+        # Only replies to us get here, see cogs/message_dispatch.py
         if self.check_reply(message):
             logging.info("Checked reply")
             referenced_message = message.reference.resolved
@@ -102,10 +111,6 @@ class BackgroundBooru(commands.Cog, name="BooruBackgroundCog"):
 
             # Extract tags from the user's reply
             tags = message.content.split(" ")
-            applied_tags = await self.append_tags(post_id, tags)
-
-            # Thanks!
-            await message.add_reaction("🙏")
 
             # Check if source was provided
             source_url = None
@@ -113,116 +118,94 @@ class BackgroundBooru(commands.Cog, name="BooruBackgroundCog"):
                 if tag.startswith("source:"):
                     source_url = tag.split(":", 1)[
                         1
-                    ]  # Get the URL part after "source:"
+                    ].strip()  # Get the URL part after "source:"
 
-            if source_url:
-                booru_scripts.append_source_to_post(
-                    post_id,
-                    source_url.strip(),
-                    self.api_url,
-                    self.api_key,
-                    self.api_user,
-                )
-
-                booru_scripts.append_post_tags(
-                    post_id,
-                    "",
-                    self.api_url,
-                    self.api_key,
-                    self.api_user,
-                    [
-                        "missing_source"
-                    ],  # Will remove missing_source tag if we apply a source
-                )
+            # Tags and source go to the booru together
+            applied_tags = await self.append_tags(
+                post_id, tags, message, source=source_url
+            )
 
-                logging.info(f"Source URL {source_url} appended to post {post_id}")
-                await message.add_reaction(
-                    "🔗"
-                )  # React with a link emoji to indicate the source was added
+            # Thanks!
+            await message.add_reaction("🙏")
 
-            # No tagme? yayy
-            if "tagme" not in booru_scripts.get_post_tags(
-                post_id,
-                self.api_url,
-                self.api_key,
-                self.api_user,
-            ):
-                await message.add_reaction("✨")
+            if source_url:
+                # React with a link emoji to indicate the source was added
+                await message.add_reaction("🔗")
+                logging.info(f"Source URL {source_url} queued for post {post_id}")
 
-    async def append_tags(self, post_id, tags):
+    async def append_tags(self, post_id, tags, message=None, source=None):
         real_tags = []
 
         for tag in tags:
-            if (
-                booru_scripts.tag_exists(
-                    tag,
-                    self.api_url,
-                    self.api_key,
-                    self.api_user,
-                )
-                or "art:" in tag
-            ):
+            if tag.startswith("source:"):
+                continue
+            if "art:" in tag or await shared_cache().tag_exists(tag):
                 real_tags.append(tag)
 
-        booru_scripts.append_post_tags(
-            post_id,
-            real_tags,
-            self.api_url,
-            self.api_key,
-            self.api_user,
+        payload = {
+            "post_id": post_id,
+            "add": " ".join(real_tags),
+            # If the number of tags is over 8 we can clear the `tagme`
+            "clear_tagme_over": 8,
+        }
+        if source:
+            payload["source"] = source
+        if message is not None:
+            payload["channel_id"] = message.channel.id
+            payload["message_id"] = message.id
+
+        await asyncio.to_thread(
+            jobs.enqueue,
+            jobs.TAG_EDIT,
+            payload,
+            idempotency_key=f"tag_reply:{message.id}" if message else None,
+            shard=shard_of(message) if message else None,
         )
 
-        logging.info(f"Added {real_tags} to {post_id}")
+        logging.info(f"Queued {real_tags} for {post_id}")
+        return real_tags
 
-        # If the number of tags is over 8 we can clear the `tagme`
-        if (
-            len(
-                booru_scripts.get_post_tags(
-                    post_id,
-                    self.api_url,
-                    self.api_key,
-                    self.api_user,
-                )
-            )
-            > 8
-        ):
-            logging.info("Clearing tagme")
-            booru_scripts.append_post_tags(
-                post_id,
-                real_tags,
-                self.api_url,
-                self.api_key,
-                self.api_user,
-                ["tagme"],
-            )
+    @commands.Cog.listener()
+    async def on_job_done(self, job):
+        if job.kind == jobs.MAINTENANCE_SWEEP:
+            await self.report_maintenance(job)
+            return
+        if job.kind != jobs.TAG_EDIT or "message_id" not in job.payload:
+            return
+        if job.status != "done":
+            logging.error(f"Tag reply {job} failed: {job.last_error}")
+            return
 
-        return real_tags
+        # No tagme? yayy
+        if "tagme" in job.result["tags"]:
+            return
 
-    async def add_source_to_post(self, post_id, source_url, message):
-        booru_scripts.append_source_to_post(
-            post_id, source_url, self.api_url, self.api_key, self.api_user
-        )
-        booru_scripts.append_post_tags(
-            post_id, "", self.api_url, self.api_key, self.api_user, ["missing_source"]
-        )
-        await message.add_reaction("🔗")
+        channel = self.bot.get_channel(int(job.payload["channel_id"]))
+        if channel is None:
+            return
+        try:
+            message = await channel.fetch_message(int(job.payload["message_id"]))
+            await message.add_reaction("✨")
+        except discord.HTTPException as e:
+            logging.warning(f"Could not react to tag reply for {job}: {e}")
 
     @tasks.loop(minutes=10)
     async def update_status(self):
-        maintenance_channel_id = str(os.environ.get("BOORU_MAINTENANCE"))
+        settings = config()
+        maintenance_channel_id = settings.maintenance_channel_id
         if not maintenance_channel_id:
             return
 
         # Prefer TAG_HELP_THREAD if set (reduces spam in maintenance channel)
-        if self.tag_help_thread_id:
-            channel = self.bot.get_channel(int(self.tag_help_thread_id))
+        if settings.tag_help_thread_id:
+            channel = self.bot.get_channel(settings.tag_help_thread_id)
             if not channel:
                 logging.warn(
-                    f"Could not find tag help thread {self.tag_help_thread_id}, falling back to maintenance channel."
+                    f"Could not find tag help thread {settings.tag_help_thread_id}, falling back to maintenance channel."
                 )
-                channel = self.bot.get_channel(int(maintenance_channel_id))
+                channel = self.bot.get_channel(maintenance_channel_id)
         else:
-            channel = self.bot.get_channel(int(maintenance_channel_id))
+            channel = self.bot.get_channel(maintenance_channel_id)
 
         if not channel:
             logging.warn(
@@ -235,14 +218,31 @@ class BackgroundBooru(commands.Cog, name="BooruBackgroundCog"):
             logging.debug("Last message was posted by the bot, skipping...")
             return
 
-        r_post = booru_scripts.fetch_images_with_tag(
-            "tagme", self.api_url, self.api_key, self.api_user, limit=1, random=True
-        )[0]
+        booru = service(BOORU_READ)
+        try:
+            r_post = (
+                await booru.call_in_thread(
+                    booru_scripts.fetch_images_with_tag,
+                    "tagme",
+                    self.api_url,
+                    self.api_key,
+                    self.api_user,
+                    limit=1,
+                    random=True,
+                )
+            )[0]
 
-        post_url = f"{self.api_url}/posts/{r_post['id']}"
-        image_url = booru_scripts.get_image_url(
-            r_post["id"], self.api_url, self.api_key, self.api_user
-        )
+            post_url = f"{self.api_url}/posts/{r_post['id']}"
+            image_url = await booru.call_in_thread(
+                booru_scripts.get_image_url,
+                r_post["id"],
+                self.api_url,
+                self.api_key,
+                self.api_user,
+            )
+        except ServiceUnavailable as e:
+            logging.info(f"Skipping status update: {e}")
+            return
 
         sauce_info = await self.get_sauce_info(channel, image_url)
         message = f"{r_post['id']}\n\n{post_url}"
@@ -252,12 +252,23 @@ class BackgroundBooru(commands.Cog, name="BooruBackgroundCog"):
         await channel.send(message)
 
     async def get_sauce_info(self, channel, image_url):
+        from saucenao_api import SauceNao
+        from saucenao_api.errors import SauceNaoApiError
+
+        if self.sauce is None:
+            self.sauce = SauceNao(api_key=self.sauce_api_key)
+
         try:
-            results = self.sauce.from_url(image_url)
+            # Nice to have, so skipped rather than waited for when SauceNAO is busy
+            results = await service(SAUCENAO).call_in_thread(
+                self.sauce.from_url, image_url, optional=True
+            )
             if results and results[0].similarity >= 80:
                 author = results[0].author or "Unknown (checked with SauceNAO)"
                 source = results[0].urls[0] if results[0].urls else "No source found"
                 return {"author": author.replace(" ", "_"), "source": source}
+        except ServiceUnavailable as e:
+            logging.info(f"Skipping SauceNAO lookup: {e}")
         except SauceNaoApiError as e:
             logging.error(f"SauceNAO error: {str(e)}")
             await channel.send(f"Error using SauceNAO: {e}")
@@ -266,94 +277,90 @@ class BackgroundBooru(commands.Cog, name="BooruBackgroundCog"):
 
     @tasks.loop(seconds=30)
     async def check_new_comments(self):
-        channel = self.bot.get_channel(int(self.fav_ch))
+        fav_channel_id = config().fav_channel_id
+        channel = self.bot.get_channel(fav_channel_id)
         if not channel:
-            logging.warn(f"Could not find auto upload channel {self.fav_ch}")
+            logging.warn(f"Could not find auto upload channel {fav_channel_id}")
             return
 
         last_comment_id = retrieve_key("last_comment_id", 0) or 0
-        new_comments = booru_scripts.fetch_new_comments(
-            self.api_url,
-            self.api_key,
-            self.api_user,
-            last_comment_id=last_comment_id,
-        )
+        new_comments = None
+        if danbooru_db.db_reads_enabled():
+            try:
+                # Comes with the commenter's name joined in
+                new_comments = await danbooru_db.fetch_new_comments(
+                    int(last_comment_id)
+                )
+            except psycopg.Error as e:
+                logging.warning(f"Could not read comments from the booru DB: {e}")
+        if new_comments is None:
+            try:
+                new_comments = await service(BOORU_READ).call_in_thread(
+                    booru_scripts.fetch_new_comments,
+                    self.api_url,
+                    self.api_key,
+                    self.api_user,
+                    last_comment_id=last_comment_id,
+                )
+            except ServiceUnavailable as e:
+                logging.info(f"Skipping comment check: {e}")
+                return
 
         if new_comments:
             if last_comment_id != 0:
+                sent = []
                 for comment in new_comments:
-                    _username = booru_scripts.get_username(
-                        self.api_url,
-                        self.api_key,
-                        self.api_user,
-                        comment["creator_id"],
-                    )
-                    await channel.send(
-                        f"New comment by {_username} on post {comment['post_id']}:\n{comment['body']}\n\n{self.api_url}/posts/{comment['post_id']}"
+                    _username = comment.get(
+                        "creator_name"
+                    ) or await shared_cache().username(comment["creator_id"])
+                    sent.append(
+                        shared_outbox().send(
+                            channel,
+                            f"New comment by {_username} on post {comment['post_id']}:\n{comment['body']}\n\n{self.api_url}/posts/{comment['post_id']}",
+                        )
                     )
+                # Only move past these once they're actually posted. They come newest
+                # first, so stop at the oldest that failed and it's tried again next
+                # time along with everything after it.
+                results = await asyncio.gather(*sent, return_exceptions=True)
+                for comment, result in zip(reversed(new_comments), reversed(results)):
+                    if isinstance(result, Exception):
+                        logging.warning(
+                            f"Could not post comment {comment['id']}: {result}"
+                        )
+                        break
+                    last_comment_id = comment["id"]
             else:
                 # Last comment id was 0! So we're skipping/new db.. either way.. DONT post all the comments!
                 logging.warning(
                     f"Skipping posting {len(new_comments)} comments for now, as db was 0 or uninitialized."
                 )
+                last_comment_id = new_comments[0]["id"]
 
-            store_key("last_comment_id", new_comments[0]["id"])
+            store_key("last_comment_id", last_comment_id)
 
     @tasks.loop(minutes=30)
     async def check_and_report_posts(self):
-        logging.debug(f"Running check and report posts.")
-
-        changes = []
-
-        posts_to_check = booru_scripts.fetch_images_with_tag(
-            "missing_source OR missing_artist OR bad_link",
-            self.api_url,
-            self.api_key,
-            self.api_user,
-            limit=20,
-            random=True,
+        logging.debug(f"Queueing check and report posts.")
+
+        # The sweep itself runs on a job worker, one per half hour slot no matter how
+        # many of us are running
+        await asyncio.to_thread(
+            jobs.enqueue,
+            jobs.MAINTENANCE_SWEEP,
+            {"limit": 20},
+            idempotency_key=f"maintenance_sweep:{int(time.time() // 1800)}",
         )
 
-        for post in posts_to_check:
-            post_id = post["id"]
-            post_url = f"{self.api_url}/posts/{post_id}"
-
-            if "missing_source" in post["tag_string"] and post["source"]:
-                booru_scripts.append_post_tags(
-                    post_id,
-                    "",
-                    self.api_url,
-                    self.api_key,
-                    self.api_user,
-                    ["missing_source"],
-                )
-                changes.append(f"Removed `missing_source` from <{post_url}>")
-
-            if "missing_artist" in post["tag_string"] and post["tag_string_artist"]:
-                booru_scripts.append_post_tags(
-                    post_id,
-                    "",
-                    self.api_url,
-                    self.api_key,
-                    self.api_user,
-                    ["missing_artist"],
-                )
-                changes.append(f"Removed `missing_artist` from <{post_url}>")
-
-            if "vore" not in post["tag_string"].split() and any(
-                tag in post["tag_string"] for tag in ["vore", "unbirth"]
-            ):
-                booru_scripts.append_post_tags(
-                    post_id, "vore", self.api_url, self.api_key, self.api_user
-                )
-                changes.append(f"Added `vore` to <{post_url}>")
+    async def report_maintenance(self, job):
+        changes = job.result.get("changes") if job.result else None
 
         if changes:
-            maintenance_channel_id = str(os.environ.get("BOORU_MAINTENANCE"))
+            maintenance_channel_id = config().maintenance_channel_id
             if not maintenance_channel_id:
                 return
 
-            channel = self.bot.get_channel(int(maintenance_channel_id))
+            channel = self.bot.get_channel(maintenance_channel_id)
             if not channel:
                 logging.warn(f"Could not find maintenance channel!")
                 return
@@ -372,25 +379,33 @@ class BackgroundBooru(commands.Cog, name="BooruBackgroundCog"):
         logging.info("Running modqueue check...")
 
         # Get channel to post to
-        if not self.maintenance_channel_id:
+        maintenance_channel_id = config().maintenance_channel_id
+        if not maintenance_channel_id:
             logging.warning("BOORU_MAINTENANCE not set, skipping modqueue check")
             return
 
-        maintenance_channel = self.bot.get_channel(int(self.maintenance_channel_id))
+        maintenance_channel = self.bot.get_channel(maintenance_channel_id)
         if not maintenance_channel:
-            logging.warning(f"Could not find maintenance channel {self.maintenance_channel_id}")
+            logging.warning(f"Could not find maintenance channel {maintenance_channel_id}")
             return
 
         # Fetch pending posts from modqueue
         try:
-            pending_posts = booru_scripts.fetch_images_with_tag(
-                "status:pending",
-                self.api_url,
-                self.api_key,
-                self.api_user,
-                limit=100,  # Get up to 100 pending posts
-                random=False,
+            pending_posts = await asyncio.to_thread(
+                post_mirror.find_posts, "status:pending", limit=100
             )
+            if pending_posts is None and danbooru_db.db_reads_enabled():
+                pending_posts = await danbooru_db.fetch_pending_posts(limit=100)
+            if pending_posts is None:
+                pending_posts = await service(BOORU_READ).call_in_thread(
+                    booru_scripts.fetch_images_with_tag,
+                    "status:pending",
+                    self.api_url,
+                    self.api_key,
+                    self.api_user,
+                    limit=100,  # Get up to 100 pending posts
+                    random=False,
+                )
             
             logging.info(f"Found {len(pending_posts)} pending posts in modqueue")
             
@@ -424,6 +439,7 @@ class BackgroundBooru(commands.Cog, name="BooruBackgroundCog"):
             # Alert on new posts
             if new_posts:
                 highest_id = last_sent_id
+                sent = []
                 for post in new_posts:
                     post_id = post["id"]
                     post_url = f"{self.api_url}/posts/{post_id}"
@@ -437,17 +453,22 @@ class BackgroundBooru(commands.Cog, name="BooruBackgroundCog"):
                         f"(tags: {tags}, creator: {creator_id})"
                     )
                     
-                    await maintenance_channel.send(
-                        f"**New post in modqueue:**\n"
-                        f"Post ID: {post_id}\n"
-                        f"Tags: {tags}\n"
-                        f"Link: {post_url}"
+                    sent.append(
+                        shared_outbox().send(
+                            maintenance_channel,
+                            f"**New post in modqueue:**\n"
+                            f"Post ID: {post_id}\n"
+                            f"Tags: {tags}\n"
+                            f"Link: {post_url}",
+                        )
                     )
                     
                     # Track the highest ID we've sent
                     if post_id > highest_id:
                         highest_id = post_id
 
+                await asyncio.gather(*sent)
+
                 # Update the last sent ID to the highest one we just sent
                 store_key("last_modqueue_id_sent", highest_id)
                 logging.info(f"Updated last_modqueue_id_sent to {highest_id}")
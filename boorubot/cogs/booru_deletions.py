@@ -1,6 +1,6 @@
+import io
 import os
-import importlib.util
-import yaml
+import time
 import discord
 import logging
 import asyncio
@@ -9,13 +9,26 @@ from datetime import datetime
 from typing import Dict, List, Tuple
 from discord.ext import commands, tasks
 
+from utilities import jobs
+from utilities.booru_scripts import booru_scripts
+from utilities.config import RELOAD_ERRORS, config, reload as reload_config
 from utilities.database import retrieve_key, store_key
+from utilities.deletion_report import DeletionReport
 
-# Load booru_scripts module using importlib
-_script_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "scripts", "Booru_Scripts", "booru_utils.py")
-spec = importlib.util.spec_from_file_location("booru_scripts", _script_path)
-booru_scripts = importlib.util.module_from_spec(spec)
-spec.loader.exec_module(booru_scripts)
+# Give up waiting for the rest of a sweep after this long without any progress
+REPORT_STALL_SECONDS = 15 * 60
+
+
+class SweepReport:
+    """A sweep's report, and the message that shows it."""
+
+    __slots__ = ("report", "message", "shown", "progress_at")
+
+    def __init__(self, report):
+        self.report = report
+        self.message = None
+        self.shown = 0  # Results shown in the message so far
+        self.progress_at = time.monotonic()
 
 
 class BooruDeletions(commands.Cog, name="BooruDeletionsCog"):
@@ -23,154 +36,142 @@ class BooruDeletions(commands.Cog, name="BooruDeletionsCog"):
         self.bot = bot
 
         # Configure options and secrets
-        self.api_key = os.environ.get("BOORU_KEY", "")
-        self.api_user = os.environ.get("BOORU_USER", "")
-        self.api_url = os.environ.get("BOORU_URL", "")
-
-        # Get maintenance channel
-        self.maintenance_channel_id = str(os.environ.get("BOORU_MAINTENANCE"))
+        self.api_key = config().booru_key
+        self.api_user = config().booru_user
+        self.api_url = config().booru_url
 
-        # Load deletions from YAML file
-        self.deletion_list = self.load_deletions()
+        # Sweep job id -> its report. Deletes from before the sweep id went in the
+        # payload, or queued by hand, are reported under None.
+        self.reports = {}
 
-    def load_deletions(self) -> Dict[str, str]:
-        """
-        Load deletions from the YAML configuration file.
-
-        Returns:
-            Dict[str, str]: Dictionary of {tag: reason} pairs
-        """
-        # Try multiple possible paths for the config file
-        possible_paths = [
-            os.path.join(os.path.dirname(__file__), "..", "config", "deletions.yaml"),
-            os.path.join("/app", "boorubot", "config", "deletions.yaml"),
-            os.path.join("/app", "config", "deletions.yaml"),
-            "boorubot/config/deletions.yaml",
-            "config/deletions.yaml",
-        ]
-
-        for config_path in possible_paths:
-            try:
-                if os.path.exists(config_path):
-                    with open(config_path, "r") as file:
-                        config = yaml.safe_load(file)
-                        deletions = config.get("deletions", {})
-                        logging.info(
-                            f"Loaded {len(deletions)} deletion rules from {config_path}"
-                        )
-                        return deletions
-            except (FileNotFoundError, yaml.YAMLError) as e:
-                logging.debug(f"Could not load from {config_path}: {e}")
-                continue
-            except Exception as e:
-                logging.debug(f"Unexpected error loading from {config_path}: {e}")
-                continue
-
-        # If no config file found, use default
-        logging.warning("No deletions config file found, using default")
-        return {"fayanna": "Character requested removal."}
+    # Sweeps and their reports run on the leader only (see cogs/leader.py), which is
+    # also the replica that gets the finished delete jobs
+    @commands.Cog.listener()
+    async def on_leader_elected(self):
+        if not self.check_and_delete_posts.is_running():
+            self.check_and_delete_posts.start()
+        if not self.send_deletion_report.is_running():
+            self.send_deletion_report.start()
 
     @commands.Cog.listener()
-    async def on_ready(self):
-        # Start the deletion check task
-        self.check_and_delete_posts.start()
+    async def on_leader_deposed(self):
+        self.check_and_delete_posts.cancel()
+        self.send_deletion_report.cancel()
+
+    async def cog_unload(self):
+        self.check_and_delete_posts.cancel()
+        self.send_deletion_report.cancel()
 
     @tasks.loop(minutes=15)
     async def check_and_delete_posts(self):
         """
-        Check for posts that need to be deleted based on the deletion_list.
+        Queue a sweep for posts that need to be deleted based on the deletion list.
         Runs every 15 minutes.
         """
         logging.debug("Running check and delete posts task.")
 
-        if not self.deletion_list:
+        deletions = config().deletions
+        if not deletions:
             logging.debug("No items in deletion list, skipping.")
             return
 
-        maintenance_channel = self.bot.get_channel(int(self.maintenance_channel_id))
-        if not maintenance_channel:
-            logging.warning(
-                f"Could not find maintenance channel {self.maintenance_channel_id}."
-            )
-            return
+        # The sweep runs on a job worker, one per 15 minute slot no matter how many of
+        # us are running. It queues a delete job per matching post.
+        await asyncio.to_thread(
+            jobs.enqueue,
+            jobs.DELETION_SWEEP,
+            {"deletions": dict(deletions)},
+            idempotency_key=f"deletion_sweep:{int(time.time() // 900)}",
+        )
 
-        deleted_posts = []
-        failed_deletions = []
+    @commands.Cog.listener()
+    async def on_job_done(self, job):
+        if job.kind == jobs.DELETION_SWEEP:
+            queued = (job.result or {}).get("queued")
+            logging.debug(f"Deletion sweep queued {queued} deletions.")
+            # Its deletes may have started finishing before the sweep itself did
+            if job.status == "done" and queued:
+                self._report(job.id).add_expected(queued)
+            elif job.id in self.reports:
+                # Whatever it queued before it failed is all there is going to be
+                report = self.reports[job.id].report
+                report.expected = len(report.results)
+            return
+        if job.kind != jobs.DELETE:
+            return
 
-        for tag, reason in self.deletion_list.items():
-            logging.info(f"Checking for posts with tag '{tag}' for deletion.")
+        post_id = job.payload["post_id"]
+        tag = job.payload.get("tag")
+        reason = job.payload.get("reason", "")
+        report = self._report(job.payload.get("sweep_id"))
 
-            # Fetch posts with the specified tag - use a high limit to get all posts
-            posts_to_check = booru_scripts.fetch_images_with_tag(
-                tag,
-                self.api_url,
-                self.api_key,
-                self.api_user,
-                limit=1000,  # High limit to get all posts
-                random=False,
-            )
+        if job.status == "done":
+            report.record(post_id, tag, reason)
+            logging.info(f"Successfully deleted post {post_id}")
+        else:
+            report.record(post_id, tag, reason, error=job.last_error or "unknown error")
+            logging.error(f"Failed to delete post {post_id}: {job.last_error}")
 
-            if not posts_to_check:
-                logging.debug(f"No posts found with tag '{tag}'.")
-                continue
+    def _report(self, sweep_id):
+        if sweep_id not in self.reports:
+            self.reports[sweep_id] = SweepReport(DeletionReport(self.api_url))
+        return self.reports[sweep_id].report
 
-            logging.info(f"Found {len(posts_to_check)} posts with tag '{tag}'.")
+    @tasks.loop(seconds=10)
+    async def send_deletion_report(self):
+        """
+        Post each running sweep's report, then keep editing it as deletions finish.
+        Deletions no sweep told us about are reported once they stop coming in.
+        """
+        for sweep_id, sweep in list(self.reports.items()):
+            await self._send_report(sweep_id, sweep)
+
+    async def _send_report(self, sweep_id, sweep):
+        report = sweep.report
+        progressed = len(report.results) != sweep.shown
+        if progressed:
+            sweep.progress_at = time.monotonic()
+        # A delete that keeps failing retries for a long while, don't wait on it. A
+        # sweep's report waits for the sweep to say how many deletes it queued.
+        stalled = time.monotonic() - sweep.progress_at > REPORT_STALL_SECONDS
+        final = report.complete or stalled or (not progressed and sweep_id is None)
+        if not progressed and not final:
+            logging.debug("No posts were deleted or failed since the last report.")
+            return
 
-            for post in posts_to_check:
-                post_id = post["id"]
-                post_url = f"{self.api_url}/posts/{post_id}"
+        message = sweep.message
+        if final:
+            # Anything that finishes while we send this goes in the next report
+            del self.reports[sweep_id]
+            if not report.results:
+                return
+        else:
+            sweep.shown = len(report.results)
 
-                logging.info(
-                    f"Attempting to delete post {post_id} (tag: {tag}, reason: {reason})"
-                )
+        maintenance_channel_id = config().maintenance_channel_id
+        maintenance_channel = self.bot.get_channel(maintenance_channel_id)
+        if not maintenance_channel:
+            logging.warning(
+                f"Could not find maintenance channel {maintenance_channel_id}."
+            )
+            return
 
-                # Attempt to delete the post
-                success = booru_scripts.delete_post(
-                    post_id, self.api_url, self.api_key, self.api_user, reason=reason
-                )
+        content = report.render(final=final)
+        files = []
+        if final and report.needs_attachment():
+            files.append(
+                discord.File(io.BytesIO(report.to_csv()), filename="deletions.csv")
+            )
 
-                if success:
-                    deleted_posts.append(
-                        f"Deleted <{post_url}> (tag: `{tag}`, reason: {reason})"
-                    )
-                    logging.info(f"Successfully deleted post {post_id}")
-                else:
-                    failed_deletions.append(
-                        f"Failed to delete <{post_url}> (tag: `{tag}`, reason: {reason})"
-                    )
-                    logging.error(f"Failed to delete post {post_id}")
-
-        # Report results to maintenance channel
-        if deleted_posts or failed_deletions:
-            report_lines = []
-
-            if deleted_posts:
-                report_lines.append("**Successfully deleted posts:**")
-                report_lines.extend(deleted_posts[:10])  # Limit to first 10
-                if len(deleted_posts) > 10:
-                    report_lines.append(f"... and {len(deleted_posts) - 10} more")
-                report_lines.append("")  # Empty line for spacing
-
-            if failed_deletions:
-                report_lines.append("**Failed deletions:**")
-                report_lines.extend(failed_deletions[:10])  # Limit to first 10
-                if len(failed_deletions) > 10:
-                    report_lines.append(f"... and {len(failed_deletions) - 10} more")
-
-            report = "\n".join(report_lines)
-
-            # Check if report is too long for Discord (4000 character limit)
-            if len(report) > 3900:  # Leave some buffer
-                report = report[:3900] + "\n\n... (report truncated due to length)"
-
-            try:
-                await maintenance_channel.send(
-                    f"**Automatic deletion report:**\n\n{report}"
-                )
-            except Exception as e:
-                logging.error(f"Failed to send deletion report: {e}")
-        else:
-            logging.debug("No posts were deleted or failed during this check.")
+        try:
+            if message is None:
+                message = await maintenance_channel.send(content, files=files)
+                if not final:
+                    sweep.message = message
+            else:
+                await message.edit(content=content, attachments=files)
+        except Exception as e:
+            logging.error(f"Failed to send deletion report: {e}")
 
     @check_and_delete_posts.before_loop
     async def before_check_and_delete_posts(self):
@@ -183,12 +184,13 @@ class BooruDeletions(commands.Cog, name="BooruDeletionsCog"):
         """
         List all tags in the deletion list.
         """
-        if not self.deletion_list:
+        deletions = config().deletions
+        if not deletions:
             await ctx.send("No items in deletion list.")
             return
 
         deletion_list_text = "\n".join(
-            [f"`{tag}`: {reason}" for tag, reason in self.deletion_list.items()]
+            [f"`{tag}`: {reason}" for tag, reason in deletions.items()]
         )
         await ctx.send(f"**Current deletion list:**\n{deletion_list_text}")
 
@@ -213,7 +215,7 @@ class BooruDeletions(commands.Cog, name="BooruDeletionsCog"):
             await ctx.send(f"Successfully deleted <{post_url}> (reason: {reason})")
 
             # Also report to maintenance channel
-            maintenance_channel = self.bot.get_channel(int(self.maintenance_channel_id))
+            maintenance_channel = self.bot.get_channel(config().maintenance_channel_id)
             if maintenance_channel:
                 await maintenance_channel.send(
                     f"**Manual deletion by {ctx.author}:**\nDeleted <{post_url}> (reason: {reason})"
@@ -227,9 +229,14 @@ class BooruDeletions(commands.Cog, name="BooruDeletionsCog"):
         """
         Reload the deletion list from the YAML configuration file.
         """
-        old_count = len(self.deletion_list)
-        self.deletion_list = self.load_deletions()
-        new_count = len(self.deletion_list)
+        old_count = len(config().deletions)
+        try:
+            new_count = len(reload_config().deletions)
+        except RELOAD_ERRORS as e:
+            await ctx.send(
+                f"Could not reload the deletion list, keeping the old one: {e}"
+            )
+            return
 
         await ctx.send(
             f"Reloaded deletion list. {old_count} → {new_count} rules loaded."
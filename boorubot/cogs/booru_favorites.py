@@ -1,4 +1,3 @@
-import os
 import json
 import logging
 import asyncio
@@ -8,8 +7,10 @@ import psycopg
 from discord import app_commands
 from discord.ext import commands
 
+from utilities.config import RELOAD_ERRORS, config
 from utilities.database import retrieve_key, store_key
 from utilities.fav_announcements import announce_fav
+from utilities.spoiler import reload_policies
 from utilities.danbooru_db import (
     FAVORITE_NOTIFY_CHANNEL,
     connect_async,
@@ -21,7 +22,7 @@ from utilities.danbooru_db import (
 class FavoriteWatcher(commands.Cog, name="FavoriteWatcherCog"):
     def __init__(self, bot):
         self.bot = bot
-        self.api_url = os.getenv("BOORU_URL", "")
+        self.api_url = config().booru_url
 
         self.fav_ch = retrieve_key("fav_ch", None)
         self.sfw_fav_ch = retrieve_key("sfw_fav_ch", None)
@@ -39,11 +40,17 @@ class FavoriteWatcher(commands.Cog, name="FavoriteWatcherCog"):
         ]
         self._listen_task = None
 
+    # Every listener gets every NOTIFY, so only the leader listens (see cogs/leader.py)
     @commands.Cog.listener()
-    async def on_ready(self):
+    async def on_leader_elected(self):
         if self._listen_task is None or self._listen_task.done():
             self._listen_task = asyncio.create_task(self._listen_loop())
 
+    @commands.Cog.listener()
+    async def on_leader_deposed(self):
+        if self._listen_task is not None:
+            self._listen_task.cancel()
+
     async def _listen_loop(self):
         await self.bot.wait_until_ready()
         logging.info(f"Listening for favorites on {FAVORITE_NOTIFY_CHANNEL}")
@@ -105,6 +112,7 @@ class FavoriteWatcher(commands.Cog, name="FavoriteWatcherCog"):
                 username,
                 post_id,
                 tag_string,
+                rating=rating,
             )
             posted = True
 
@@ -152,6 +160,26 @@ class FavoriteWatcher(commands.Cog, name="FavoriteWatcherCog"):
             f"Set Vore Fav Channel to {interaction.channel.mention}!"
         )
 
+    @app_commands.command(
+        name="reload_cw",
+        description="Reload the content warning rules from spoilers.yaml.",
+    )
+    @app_commands.checks.has_permissions(administrator=True)
+    async def reload_cw(self, interaction: discord.Interaction):
+        try:
+            policies = reload_policies()
+        except RELOAD_ERRORS as e:
+            await interaction.response.send_message(
+                f"Could not reload CW rules, keeping the old ones: {e}",
+                ephemeral=True,
+            )
+            return
+
+        await interaction.response.send_message(
+            f"Reloaded CW rules ({len(policies.channels)} channel overrides).",
+            ephemeral=True,
+        )
+
 
 async def setup(bot):
     await bot.add_cog(FavoriteWatcher(bot))
@@ -0,0 +1,97 @@
+import discord
+import logging
+import asyncio
+
+from discord import app_commands
+from discord.ext import commands, tasks
+
+from utilities import jobs
+from utilities.booru_cache import shared_cache
+from utilities.config import config
+from utilities.job_handlers import run_next
+from utilities.leader import is_leader
+from utilities.sharding import owned_shards
+
+POLL_SECONDS = 2
+
+
+class BooruJobs(commands.Cog, name="BooruJobsCog"):
+    """
+    Runs the persistent job queue (utilities/jobs.py) inside the bot, and hands finished
+    jobs back to the cogs that queued them as an `on_job_done(job)` event.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+
+        self.worker_count = config().job_workers
+        self._workers = []
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        self._workers = [w for w in self._workers if not w.done()]
+        while len(self._workers) < self.worker_count:
+            self._workers.append(asyncio.create_task(self._work_loop()))
+
+        if not self.announce_finished.is_running():
+            self.announce_finished.start()
+        if not self.prune_jobs.is_running():
+            self.prune_jobs.start()
+
+    async def cog_unload(self):
+        for worker in self._workers:
+            worker.cancel()
+        self.announce_finished.cancel()
+        self.prune_jobs.cancel()
+        await shared_cache().close()
+
+    async def _work_loop(self):
+        await self.bot.wait_until_ready()
+
+        while not self.bot.is_closed():
+            try:
+                job = await asyncio.to_thread(run_next)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logging.exception("Job worker error")
+                job = None
+
+            if job is None:
+                await asyncio.sleep(POLL_SECONDS)
+
+    @tasks.loop(seconds=POLL_SECONDS)
+    async def announce_finished(self):
+        # In sharded mode, only the follow-ups for channels this process can see. Ones
+        # without a channel (sweep and delete reports) go to the leader.
+        for job in await asyncio.to_thread(
+            jobs.claim_finished,
+            shards=owned_shards(self.bot),
+            home=is_leader(self.bot),
+        ):
+            logging.debug(f"Announcing {job}")
+            # The worker may be in another process, so drop what we cached about the
+            # post here rather than in the handler
+            post_id = (job.result or {}).get("post_id") or job.payload.get("post_id")
+            if post_id:
+                shared_cache().invalidate_post(post_id)
+            self.bot.dispatch("job_done", job)
+
+    @tasks.loop(hours=1)
+    async def prune_jobs(self):
+        removed = await asyncio.to_thread(jobs.prune)
+        if removed:
+            logging.info(f"Pruned {removed} old jobs")
+
+    @app_commands.command(name="jobs", description="Show the booru job queue.")
+    @app_commands.checks.has_permissions(administrator=True)
+    async def show_jobs(self, interaction: discord.Interaction):
+        depth = await asyncio.to_thread(jobs.queue_depth)
+        summary = ", ".join(f"{status}: `{count}`" for status, count in depth.items())
+        await interaction.response.send_message(
+            f"Job queue: {summary or 'empty'}", ephemeral=True
+        )
+
+
+async def setup(bot):
+    await bot.add_cog(BooruJobs(bot))
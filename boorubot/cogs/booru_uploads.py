@@ -4,67 +4,56 @@
 
 import os
 import re
-import importlib.util
+import asyncio
 import discord
 import logging
 import requests
 import aiohttp
+import psycopg
 
 from datetime import datetime
-from typing import Literal, Optional
+from typing import Literal
 from discord import app_commands
 from discord.ext import commands, tasks
 
-from saucenao_api import SauceNao
-from saucenao_api.errors import SauceNaoApiError
-
+from utilities import jobs
+from utilities.booru_cache import shared_cache
+from utilities.booru_upload import CHUNK_SIZE, scratch_file
+from utilities.media import MediaQueueFull, inspect_media, media_pool
+from utilities.message_scan import LINK
+from utilities.throttle import (
+    BOORU_READ,
+    DISCORD_CDN,
+    SAUCENAO,
+    ServiceUnavailable,
+    service,
+)
+from utilities.booru_scripts import booru_scripts
+from utilities.config import config
+from utilities.danbooru_db import (
+    db_reads_enabled,
+    fetch_changed_posts,
+    fetch_post,
+    rewind,
+)
 from utilities.database import retrieve_key, store_key
+from utilities.post_index import PostIndex
+from utilities.sharding import shard_of
 
-# Load booru_scripts module using importlib
-_script_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "scripts", "Booru_Scripts", "booru_utils.py")
-spec = importlib.util.spec_from_file_location("booru_scripts", _script_path)
-booru_scripts = importlib.util.module_from_spec(spec)
-spec.loader.exec_module(booru_scripts)
-
-
-# Helper function to detect and download image from URL
-async def get_image_from_message(message: discord.Message) -> Optional[str]:
-    """
-    Check if a message contains only an image URL and download it.
+POST_INDEX_BATCH = 10000
 
-    Args:
-        message (discord.Message): The message to check.
 
-    Returns:
-        Optional[str]: Path to the downloaded image file or None if not valid.
-    """
-
-    # Regular expression to detect a URL with valid image extensions
-    image_url_pattern = re.compile(
-        r"^(https?://\S+?\.(?:png|jpg|jpeg|webp|gif|mp4|webm))(?:\?.*)?$", re.IGNORECASE
-    )
-
-    if message.content and image_url_pattern.match(message.content.strip()):
-        url = message.content.strip()
-        file_name = os.path.basename(url)
-        file_path = f"/tmp/{file_name}"
-
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url) as resp:
-                    if resp.status == 200:
-                        with open(file_path, "wb") as f:
-                            f.write(await resp.read())
-                        logging.info(f"Saved a custom linked image to {file_path}!")
-                        return file_path
-                    else:
-                        logging.warn(
-                            f"Failed to download image. HTTP Status: {resp.status}"
-                        )
-        except Exception as e:
-            logging.error(f"Error downloading image from URL: {e}")
-
-    return None
+async def _download(url, file_path):
+    """Save `url` to `file_path` if it answers 200, returns the HTTP status."""
+    async with aiohttp.ClientSession() as session:
+        async with session.get(url) as resp:
+            if resp.status == 200:
+                with open(file_path, "wb") as f:
+                    async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                        f.write(chunk)
+            elif resp.status >= 500:
+                resp.raise_for_status()  # Counts towards the CDN's breaker
+            return resp.status
 
 
 # This is pretty cool, basically a popup UI
@@ -85,9 +74,9 @@ class TagModal(discord.ui.Modal, title="Enter Tags"):
         self.message = message
 
         # Configure options and secrets
-        self.api_key = os.environ.get("BOORU_KEY", "")
-        self.api_user = os.environ.get("BOORU_USER", "")
-        self.api_url = os.environ.get("BOORU_URL", "")
+        self.api_key = config().booru_key
+        self.api_user = config().booru_user
+        self.api_url = config().booru_url
 
     async def on_submit(self, interaction: discord.Interaction):
         await interaction.response.defer(ephemeral=True)
@@ -95,32 +84,24 @@ class TagModal(discord.ui.Modal, title="Enter Tags"):
         tags = self.tags.value
         rating = self.rating.value
 
-        await self.attachment.save(f"./downloads/{self.attachment.filename}")
-
         await self.message.add_reaction("⬇")
 
         # Upload everything
-        upload_id = booru_scripts.upload_image(
-            self.api_key,
-            self.api_user,
-            self.api_url,
-            f"./downloads/{self.attachment.filename}",
+        await asyncio.to_thread(
+            jobs.enqueue,
+            jobs.UPLOAD,
+            {
+                "url": self.attachment.url,
+                "filename": self.attachment.filename,
+                "tags": tags,
+                "rating": rating,
+                "channel_id": self.message.channel.id,
+                "message_id": self.message.id,
+                "origin": "modal",
+            },
+            idempotency_key=f"upload:{self.message.id}",
+            shard=shard_of(self.message),
         )
-        if upload_id:
-            post_id = booru_scripts.create_post(
-                self.api_key,
-                self.api_user,
-                self.api_url,
-                upload_id,  # Passed from prev command
-                tags,
-                rating,
-            )
-
-            if post_id != None:
-                await self.message.add_reaction("⬆")
-
-            else:  # Image must have already been posted
-                await self.message.add_reaction("white_check_mark")
 
 
 class BooruUploads(commands.Cog, name="BooruCog"):
@@ -134,20 +115,27 @@ class BooruUploads(commands.Cog, name="BooruCog"):
         self.bot.tree.add_command(self.ctx_menu)
 
         # Configure options and secrets
-        self.api_key = os.environ.get("BOORU_KEY", "")
-        self.api_user = os.environ.get("BOORU_USER", "")
-        self.api_url = os.environ.get("BOORU_URL", "")
+        self.api_key = config().booru_key
+        self.api_user = config().booru_user
+        self.api_url = config().booru_url
 
         # Configure SauceNAO
-        self.sauce_api_key = os.environ.get("SAUCENAO_API_KEY", "")
-        self.sauce = SauceNao(api_key=self.sauce_api_key)
+        self.sauce_api_key = config().saucenao_api_key
+        self.sauce = None  # Created on first use, saucenao_api is slow to import
 
-        # Configure channels
-        self.auto_upload_list = str(os.environ.get("BOORU_AUTO_UPLOAD")).split(",")
+        # Local tag -> post id index so /random doesn't need a random search
+        self.post_index = PostIndex()
 
     @commands.Cog.listener()
     async def on_ready(self):
-        await self.bot.tree.sync()
+        # The index is built from the Danbooru DB, without it /random asks the booru
+        if db_reads_enabled() and not self.sync_post_index.is_running():
+            self.sync_post_index.start()
+        media_pool().start()
+
+    async def cog_unload(self):
+        # The media pool is left running, the job workers in this process use it too
+        self.sync_post_index.cancel()
 
     async def grab_message_context(
         self, interaction: discord.Interaction, message: discord.Message
@@ -165,8 +153,6 @@ class BooruUploads(commands.Cog, name="BooruCog"):
 
         # Check if the attachment is an image
         if attachment.content_type.startswith("image/"):
-            # Ensure the downloads directory exists
-            os.makedirs("./downloads", exist_ok=True)
             # Show modal to collect tags
             modal = TagModal(attachment, message)
             await message.add_reaction("🤔")
@@ -177,56 +163,70 @@ class BooruUploads(commands.Cog, name="BooruCog"):
             )
 
     @commands.Cog.listener()
-    async def on_message(self, message):
-        # Don't scan or reply to bots or ourselves
-        if message.author.bot:
-            return
-
-        # Check for contributor status first - this should happen for all channels
-        contributor_roles = os.getenv("CONTRIBUTOR_ROLES", "")
-        contributor_roles_set = set(contributor_roles.split(","))
-        user_roles = {str(role.id) for role in message.author.roles}
-        is_contributor = bool(contributor_roles_set & user_roles)
+    async def on_image_message(self, message, scan):
+        # Bots and messages without an image never get here, see cogs/message_dispatch.py
+        settings = config()
 
         # Default we will upload unless something turns it off.
         _is_auto_upload = True
 
         # Auto upload list comes from the auto upload list now.
-        if str(message.channel.id) not in self.auto_upload_list:
+        if message.channel.id not in settings.auto_upload_channel_ids:
             logging.debug(
-                f"Not uploading image in {message.channel.id}, not in list {self.auto_upload_list}"
+                f"Not uploading image in {message.channel.id}, not in auto upload list"
             )
             _is_auto_upload = False
             # For non-auto-upload channels, we only care about iqdb matching
             # No need to check contributor status or add no_entry reaction
 
-        # Handle attachments
-        if message.attachments and message.attachments[0].content_type.startswith(
-            "image/"
-        ):
-            attachment = message.attachments[0]
-            attachment_url = attachment.url
-            file_path = f"/tmp/{attachment.filename}"
-
-            async with aiohttp.ClientSession() as session:
-                async with session.get(attachment.url) as resp:
-                    if resp.status == 200:
-                        with open(file_path, "wb") as f:
-                            f.write(await resp.read())
-        else:
-            # Handle URLs as images
-            file_path = await get_image_from_message(message)
-            attachment_url = message.content.strip()
-            if not file_path:
-                return  # Neither attachment nor valid image URL
-
-            # If everything is good, we caught a linked image!
-            await message.add_reaction("🔗")
-
-        # Call the get_post_id function
-        post_id = booru_scripts.check_image_exists(
-            file_path, self.api_url, self.api_key, self.api_user
-        )
+        attachment_url = scan.url
+        filename = scan.filename
+
+        # The upload job streams its own copy, this one is only for the duplicate check
+        with scratch_file(filename) as file_path:
+            try:
+                status = await service(DISCORD_CDN).call(
+                    _download, attachment_url, file_path
+                )
+            except (ServiceUnavailable, aiohttp.ClientError) as e:
+                logging.warning(f"Could not download {attachment_url}: {e}")
+                return
+            if status != 200:
+                logging.warning(f"Could not download {attachment_url}: HTTP {status}")
+                return
+
+            if scan.image == LINK:
+                # If everything is good, we caught a linked image!
+                await message.add_reaction("🔗")
+
+            media = None
+            try:
+                # What the file really is, and a thumbnail to check for duplicates with
+                try:
+                    media = await media_pool().run(inspect_media, file_path)
+                except MediaQueueFull as e:
+                    logging.info(f"Not inspecting {file_path}: {e}")
+                except Exception as e:
+                    # A truncated or huge image, or a worker that died. IQDB gets
+                    # the whole file and can make of it what it will.
+                    logging.warning(f"Could not inspect {file_path}: {e!r}")
+                if media and media["format"] is None:
+                    logging.info(f"{attachment_url} isn't an image or video, ignoring")
+                    return
+
+                # Call the get_post_id function. IQDB only looks at a small version
+                # anyway, so the thumbnail does as well as the whole file.
+                post_id = await service(BOORU_READ).call_in_thread(
+                    booru_scripts.check_image_exists,
+                    (media and media["thumbnail"]) or file_path,
+                    self.api_url,
+                    self.api_key,
+                    self.api_user,
+                )
+            except ServiceUnavailable as e:
+                # The upload job still looks for the exact file before posting it
+                logging.warning(f"Skipping duplicate check: {e}")
+                post_id = None
 
         # Check if a valid number was returned
         if post_id is not None and isinstance(post_id, int):
@@ -234,83 +234,112 @@ class BooruUploads(commands.Cog, name="BooruCog"):
             await self._react_post_id(message, post_id)
 
         # Last check after all this, you must be a contributor
-        if not is_contributor:
+        contributor_roles = settings.contributor_role_ids
+        if not any(role.id in contributor_roles for role in message.author.roles):
             logging.info(
-                f"User {message.author} has none of the contributor roles {contributor_roles_set} not in {user_roles}, disabling auto-upload"
+                f"User {message.author} has none of the contributor roles {sorted(contributor_roles)}, disabling auto-upload"
             )
             _is_auto_upload = False
 
-        if _is_auto_upload:  # If we're good to auto upload.
-            # Add a gem! Its time to upload this new image
-            await message.add_reaction("💎")
+        if not _is_auto_upload:
+            # Nothing to do, image was unique, but was not in an auto upload channel
+            return
 
-            # Prepare the description with user and channel information
-            description = f"Uploaded by {message.author} in channel {message.channel}"
+        # Prepare the description with user and channel information
+        description = f"Uploaded by {message.author} in channel {message.channel}"
+
+        tags = "tagme discord_archive missing_source missing_artist"
+
+        # Check if channel name contains "vore" to add the "vore" tag
+        if "vore" in message.channel.name.lower():
+            tags += " vore"
+
+        # Check if channel is memes
+        if "meme" in message.channel.name.lower():
+            tags += " meme"
+
+        rating = "e"
+
+        # Queue the upload, keyed on the message so a redelivered message can't double post
+        job_id = await asyncio.to_thread(
+            jobs.enqueue,
+            jobs.UPLOAD,
+            {
+                "url": attachment_url,
+                "filename": filename,
+                "tags": tags,
+                "rating": rating,
+                "description": description,
+                "channel_id": message.channel.id,
+                "message_id": message.id,
+                "origin": "auto",
+            },
+            idempotency_key=f"upload:{message.id}",
+            shard=shard_of(message),
+        )
+        if job_id is None:
+            return
+
+        # Add a gem! Its time to upload this new image
+        await message.add_reaction("💎")
 
-            tags = "tagme discord_archive missing_source missing_artist"
+        # Increment image count
+        ic = retrieve_key("image_count", 1)
+        store_key("image_count", int(ic) + 1)
 
-            # Check if channel name contains "vore" to add the "vore" tag
-            if "vore" in message.channel.name.lower():
-                tags += " vore"
+    @commands.Cog.listener()
+    async def on_job_done(self, job):
+        if job.kind != jobs.UPLOAD:
+            return
 
-            # Check if channel is memes
-            if "meme" in message.channel.name.lower():
-                tags += " meme"
+        message = await self._fetch_job_message(job)
+        if job.status != "done":
+            logging.error(
+                f"Giving up uploading {job.payload['url']}: {job.last_error}"
+            )
+            if message:
+                await message.add_reaction("⚠")
+            return
+        if message is None:
+            return
 
-            rating = "e"
+        post_id = job.result["post_id"]
 
-            # Upload everything
-            upload_id = booru_scripts.upload_image(
-                self.api_key,
-                self.api_user,
-                self.api_url,
-                file_path,  # <- Same path as earlier
+        if job.payload.get("origin") == "modal":
+            # Image must have already been posted if it was existing
+            await message.add_reaction(
+                "✅" if job.result.get("existing") else "⬆"
             )
-            if not upload_id:
-                logging.error(f"Failed to upload image from {attachment_url}")
-            else:
-                post_id = booru_scripts.create_post(
-                    self.api_key,
-                    self.api_user,
-                    self.api_url,
-                    upload_id,  # Passed from prev command
-                    tags,
-                    rating,
-                    description=description,  # Pass the description here
-                )
+            return
 
-                if post_id is None:
-                    logging.error(
-                        f"Uploaded asset {upload_id} but failed to create post for {attachment_url}"
-                    )
-                else:
-                    await self._react_post_id(message, post_id)
-
-                    # SauceNAO integration
-                    logging.debug("Fetching sauce info")
-                    sauce_info = await self.get_sauce_info(attachment_url)
-                    if sauce_info["source"]:
-                        confirmation_message = await message.reply(
-                            f"Found author: `{sauce_info['author']}` and source: <{sauce_info['source']}> for post `{post_id}` via SauceNAO.\n"
-                            f"Please react with ✅ to confirm or ❌ if incorrect!"
-                        )
-
-                        await confirmation_message.add_reaction("✅")
-                        await confirmation_message.add_reaction("❌")
-                    else:
-                        logging.warning(
-                            f"SauceNAO couldn't find source for {attachment_url}"
-                        )
-        else:
-            # Nothing to do, image was unique, but was not in an auto upload channel
+        await self._react_post_id(message, post_id)
+        if job.result.get("existing"):
             return
 
-        # Increment image count
-        ic = retrieve_key("image_count", 1)
-        store_key("image_count", int(ic) + 1)
+        # SauceNAO integration
+        logging.debug("Fetching sauce info")
+        sauce_info = await self.get_sauce_info(job.payload["url"])
+        if sauce_info["source"]:
+            confirmation_message = await message.reply(
+                f"Found author: `{sauce_info['author']}` and source: <{sauce_info['source']}> for post `{post_id}` via SauceNAO.\n"
+                f"Please react with ✅ to confirm or ❌ if incorrect!"
+            )
+
+            await confirmation_message.add_reaction("✅")
+            await confirmation_message.add_reaction("❌")
+        else:
+            logging.warning(f"SauceNAO couldn't find source for {job.payload['url']}")
 
-        # Clean up the download
-        os.remove(file_path)
+    async def _fetch_job_message(self, job):
+        channel = self.bot.get_channel(int(job.payload["channel_id"]))
+        if channel is None:
+            logging.warning(f"Could not find channel for {job}")
+            return None
+        try:
+            return await channel.fetch_message(int(job.payload["message_id"]))
+        except discord.HTTPException as e:
+            logging.warning(f"Could not fetch message for {job}: {e}")
+            return None
 
     async def _react_post_id(self, message, post_id):
         try:
@@ -368,6 +397,59 @@ class BooruUploads(commands.Cog, name="BooruCog"):
                 activity=discord.Game(name=f"Running Version {self.bot.version}")
             )
 
+    @tasks.loop(minutes=1)
+    async def sync_post_index(self):
+        index = self.post_index
+        # Start a little behind where we got to, posts can commit out of order
+        after = rewind(index.cursor)
+        try:
+            while True:
+                rows = await asyncio.to_thread(
+                    fetch_changed_posts, after, POST_INDEX_BATCH
+                )
+                if index.ready:
+                    index.apply(rows)
+                else:
+                    # Nobody reads the index until the first sync is done, so the
+                    # big initial load can be built off the event loop
+                    await asyncio.to_thread(index.apply, rows)
+                if len(rows) < POST_INDEX_BATCH:
+                    break
+                after = index.cursor
+        except psycopg.Error as e:
+            logging.warning(f"Could not sync post index: {e}")
+            return
+
+        if not index.ready:
+            index.ready = True
+            logging.info(f"Post index ready with {len(index)} posts")
+
+    async def pick_random_post(self, tags, exclude_tags):
+        """A random post dict matching `tags`, or None. Local index first, booru second."""
+        if self.post_index.ready:
+            # A couple of retries, in case we pick something deleted since the last sync
+            for _ in range(3):
+                post_id = self.post_index.random_post_id(tags, exclude_tags)
+                if post_id is None:
+                    break  # Query the index can't answer
+                if post_id == 0:
+                    return None
+
+                if db_reads_enabled():
+                    post = await fetch_post(post_id)
+                else:
+                    try:
+                        post = await shared_cache().post(post_id)
+                    except aiohttp.ClientResponseError as e:
+                        if e.status != 404:
+                            raise
+                        post = None
+                if post and not post.get("is_deleted"):
+                    return post
+                self.post_index.remove(post_id)
+
+        return await shared_cache().random_post(tags, exclude=exclude_tags)
+
     @app_commands.command(
         name="random",
         description="Grab a random image with space-separated tags!",
@@ -387,15 +469,7 @@ class BooruUploads(commands.Cog, name="BooruCog"):
         # Exclude the default tags that are not explicitly included
         exclude_tags = [tag for tag in default_exclude if tag not in included_excludes]
 
-        image = booru_scripts.fetch_images_with_tag(
-            tags,
-            self.api_url,
-            self.api_key,
-            self.api_user,
-            limit=1,
-            random=True,
-            exclude=exclude_tags,  # Pass the exclude tags
-        )
+        image = await self.pick_random_post(tags, exclude_tags)
 
         if not image:
             await interaction.response.send_message(f"No match for `{tags}`!")
@@ -403,7 +477,7 @@ class BooruUploads(commands.Cog, name="BooruCog"):
 
         # Yeah i know the join and split tags thing is messy but go for it XD
         await interaction.response.send_message(
-            f"{os.environ.get('BOORU_URL', '')}/posts/{image[0]['id']}?q={'+'.join(tags.split(' '))}"
+            f"{self.api_url}/posts/{image['id']}?q={'+'.join(tags.split(' '))}"
         )
 
     # Sauce NAO Integration stuff
@@ -412,12 +486,23 @@ class BooruUploads(commands.Cog, name="BooruCog"):
         """
         Retrieves author and source information from SauceNAO.
         """
+        from saucenao_api import SauceNao
+        from saucenao_api.errors import SauceNaoApiError
+
+        if self.sauce is None:
+            self.sauce = SauceNao(api_key=self.sauce_api_key)
+
         try:
-            results = self.sauce.from_url(image_url)
+            # Nice to have, so skipped rather than waited for when SauceNAO is busy
+            results = await service(SAUCENAO).call_in_thread(
+                self.sauce.from_url, image_url, optional=True
+            )
             if results and results[0].similarity >= 80:
                 author = results[0].author or "Unknown"
                 source = results[0].urls[0] if results[0].urls else "No source found"
                 return {"author": author.replace(" ", "_"), "source": source}
+        except ServiceUnavailable as e:
+            logging.info(f"Skipping SauceNAO lookup: {e}")
         except SauceNaoApiError as e:
             logging.error(f"SauceNAO error: {e}")
         return {"author": None, "source": None}
@@ -471,16 +556,16 @@ class BooruUploads(commands.Cog, name="BooruCog"):
         # Process reaction
         if reaction.emoji == "✅":
             # Append the tags and source to the post
-            booru_scripts.append_source_to_post(
-                post_id, source, self.api_url, self.api_key, self.api_user
-            )
-            booru_scripts.append_post_tags(
-                post_id=post_id,
-                new_tags=f"art:{author}",
-                danbooru_url=self.api_url,
-                api_key=self.api_key,
-                username=self.api_user,
-                clear_tags=["missing_artist", "missing_source"],
+            await asyncio.to_thread(
+                jobs.enqueue,
+                jobs.TAG_EDIT,
+                {
+                    "post_id": int(post_id),
+                    "add": f"art:{author}",
+                    "remove": ["missing_artist", "missing_source"],
+                    "source": source,
+                },
+                idempotency_key=f"sauce_tags:{reaction.message.id}",
             )
             logging.info(f"Tags and source confirmed for {post_id}!")
         elif reaction.emoji == "❌":
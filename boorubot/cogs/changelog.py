@@ -6,6 +6,7 @@ import discord
 from discord import app_commands
 from discord.ext import commands, tasks
 
+from utilities.config import config
 from utilities.database import retrieve_key, store_key
 
 
@@ -37,7 +38,8 @@ class Changelog(commands.Cog, name="ChangeLogCog"):
         self.bot = bot
 
     @commands.Cog.listener()
-    async def on_ready(self):
+    async def on_leader_elected(self):
+        # Only the leader posts changelogs, see cogs/leader.py
         self.last_log = retrieve_key("LAST_CHANGELOG", 0)
 
         # Try Docker path first, then fall back to local development path
@@ -78,12 +80,12 @@ class Changelog(commands.Cog, name="ChangeLogCog"):
 
         # This was simplified when i took out the fops bot feature system,
         # For boorubot, i'll just read a single changelog channel from maintenance
-        ch_id = str(os.environ.get("BOORU_MAINTENANCE"))
+        ch_id = config().maintenance_channel_id
         if not ch_id:
             logging.warning("No channel set for changelog alerts (BOORU_MAINTENANCE not set)")
             return
 
-        channel = self.bot.get_channel(int(ch_id))
+        channel = self.bot.get_channel(ch_id)
         if not channel:
             logging.warning(f"Could not find channel {ch_id}")
             return
@@ -0,0 +1,71 @@
+import discord
+import logging
+
+from discord import app_commands
+from discord.ext import commands, tasks
+
+from utilities import config as bot_config
+from utilities.config import RELOAD_ERRORS
+from utilities.spoiler import load_policies, use_policies
+
+
+class ConfigCog(commands.Cog, name="ConfigCog"):
+    """Reloads utilities/config.py settings when their YAML files change, or on request."""
+
+    def __init__(self, bot):
+        self.bot = bot
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        if not self.watch_config.is_running():
+            self.watch_config.start()
+
+    async def cog_unload(self):
+        self.watch_config.cancel()
+
+    def reload(self):
+        # Both are built before either is swapped in, so a broken spoilers.yaml doesn't
+        # leave the new settings running with the old policies
+        settings = bot_config.Config()
+        policies = load_policies(settings.spoilers_path, strict=True)
+        bot_config.use(settings)
+        use_policies(policies)
+        return settings
+
+    @tasks.loop(seconds=15)
+    async def watch_config(self):
+        if not bot_config.config().files_changed():
+            return
+
+        try:
+            settings = self.reload()
+        except RELOAD_ERRORS as e:
+            # Keep running on the old settings until the file is fixed
+            logging.error(f"Config files changed but could not be reloaded: {e}")
+            return
+        logging.info(f"Config files changed, reloaded {settings}")
+
+    @app_commands.command(
+        name="reload_config",
+        description="Reload the bot settings from the environment and config files.",
+    )
+    @app_commands.checks.has_permissions(administrator=True)
+    async def reload_config(self, interaction: discord.Interaction):
+        try:
+            settings = self.reload()
+        except RELOAD_ERRORS as e:
+            await interaction.response.send_message(
+                f"Could not reload config, keeping the old settings: {e}",
+                ephemeral=True,
+            )
+            return
+
+        await interaction.response.send_message(
+            f"Reloaded config ({len(settings.deletions)} deletion rules, "
+            f"{len(settings.auto_upload_channel_ids)} upload channels).",
+            ephemeral=True,
+        )
+
+
+async def setup(bot):
+    await bot.add_cog(ConfigCog(bot))
@@ -6,17 +6,14 @@ import traceback
 from discord import app_commands
 from discord.ext import commands
 
+from utilities.config import config
+
 
 class ErrorHandlerCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.bot.tree.on_error = self.on_tree_error  # Manually bind the tree error here
 
-    @commands.Cog.listener()
-    async def on_ready(self):
-        # Sync the commands this cog provides
-        await self.bot.tree.sync()
-
     async def on_tree_error(
         self, interaction: discord.Interaction, error: app_commands.AppCommandError
     ):
@@ -62,10 +59,10 @@ class ErrorHandlerCog(commands.Cog):
         """
 
         # Send errors to this env
-        ch_id = str(os.environ.get("BOORU_MAINTENANCE"))
+        ch_id = config().maintenance_channel_id
 
         if ch_id:
-            channel = self.bot.get_channel(int(ch_id))
+            channel = self.bot.get_channel(ch_id)
             if channel:
                 error_traceback = "".join(
                     traceback.format_exception(type(error), error, error.__traceback__)
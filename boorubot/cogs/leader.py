@@ -0,0 +1,48 @@
+import asyncio
+import logging
+
+from discord.ext import commands
+
+from utilities.leader import LeaderElection
+from utilities.sharding import runs_singletons
+
+
+class LeaderCog(commands.Cog, name="LeaderCog"):
+    """
+    Runs the leader election (utilities/leader.py) and tells the other cogs with
+    `on_leader_elected` / `on_leader_deposed` events, which start and stop the tasks that
+    should only run once across all replicas.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.bot.is_leader = False
+        self.election = LeaderElection(self.elected, self.deposed)
+        self._task = None
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        # Processes without the home shard never run the background tasks
+        if not runs_singletons(self.bot):
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.election.run())
+
+    async def cog_unload(self):
+        if self._task is not None:
+            self._task.cancel()
+        await self.election.stop()
+
+    async def elected(self):
+        logging.info("Elected leader, starting background tasks.")
+        self.bot.is_leader = True
+        self.bot.dispatch("leader_elected")
+
+    async def deposed(self):
+        logging.warning("No longer leader, stopping background tasks.")
+        self.bot.is_leader = False
+        self.bot.dispatch("leader_deposed")
+
+
+async def setup(bot):
+    await bot.add_cog(LeaderCog(bot))
@@ -0,0 +1,107 @@
+import os
+import discord
+import logging
+
+from discord import app_commands
+from discord.ext import commands, tasks
+
+from utilities.config import config
+from utilities.loop_watchdog import LoopWatchdog, ReportLimiter, watchdog_enabled
+
+
+class LoopWatchdogCog(commands.Cog, name="LoopWatchdogCog"):
+    def __init__(self, bot):
+        self.bot = bot
+
+        self.threshold_ms = int(os.environ.get("LOOP_WATCHDOG_THRESHOLD_MS", 250))
+
+        # Same owner can only ping the channel this often, and nobody can ping it more
+        # than once a minute, so a really bad stall doesn't turn into a spam storm.
+        report_interval = int(os.environ.get("LOOP_WATCHDOG_REPORT_INTERVAL", 600))
+        self.owner_limiter = ReportLimiter(report_interval)
+        self.channel_limiter = ReportLimiter(60)
+
+        self.watchdog = None
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        if not watchdog_enabled():
+            logging.debug("LOOP_WATCHDOG not set, loop watchdog disabled.")
+            return
+
+        if self.watchdog is None:
+            self.watchdog = LoopWatchdog(threshold=self.threshold_ms / 1000)
+            self.watchdog.start()
+            self.bot.loop_watchdog = self.watchdog  # So other cogs can read lag stats
+
+        if not self.report_blocks.is_running():
+            self.report_blocks.start()
+
+    async def cog_unload(self):
+        self.report_blocks.cancel()
+        if self.watchdog is not None:
+            self.watchdog.stop()
+
+    @tasks.loop(seconds=10)
+    async def report_blocks(self):
+        for report in self.watchdog.drain():
+            logging.warning(
+                f"Event loop blocked for {report.duration * 1000:.0f}ms by {report.owner}\n"
+                f"{report.format_stack()}"
+            )
+
+            # Check both before taking either, so an owner held back by the channel
+            # limit doesn't lose its turn too
+            if not (
+                self.owner_limiter.ready(report.owner)
+                and self.channel_limiter.ready("channel")
+            ):
+                continue
+            self.owner_limiter.allow(report.owner)
+            self.channel_limiter.allow("channel")
+
+            await self.send_report(report)
+
+    async def send_report(self, report):
+        maintenance_channel_id = config().maintenance_channel_id
+        if not maintenance_channel_id:
+            return
+
+        channel = self.bot.get_channel(maintenance_channel_id)
+        if not channel:
+            logging.warning(
+                f"Could not find maintenance channel {maintenance_channel_id}."
+            )
+            return
+
+        # Keep the tail of the stack, that's where the blocking call lives
+        stack = report.format_stack()[-1500:]
+        try:
+            await channel.send(
+                f"**Event loop blocked for {report.duration * 1000:.0f}ms** by `{report.owner}`\n"
+                f"```py\n{stack}\n```"
+            )
+        except discord.HTTPException as e:
+            logging.error(f"Failed to send loop watchdog report: {e}")
+
+    @app_commands.command(
+        name="loop_lag", description="Show event loop lag stats from the watchdog."
+    )
+    @app_commands.checks.has_permissions(administrator=True)
+    async def loop_lag(self, interaction: discord.Interaction):
+        if self.watchdog is None:
+            await interaction.response.send_message(
+                "Loop watchdog is disabled (set `LOOP_WATCHDOG=true`).", ephemeral=True
+            )
+            return
+
+        stats = self.watchdog.stats()
+        await interaction.response.send_message(
+            f"Loop lag over {stats['samples']} samples: "
+            f"p50 `{stats['p50_ms']:.1f}ms`, p99 `{stats['p99_ms']:.1f}ms`, max `{stats['max_ms']:.1f}ms`",
+            ephemeral=True,
+        )
+
+
+async def setup(bot):
+    await bot.add_cog(LoopWatchdogCog(bot))
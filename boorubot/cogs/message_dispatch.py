@@ -0,0 +1,31 @@
+from discord.ext import commands
+
+from utilities.message_scan import scan
+
+
+class MessageDispatch(commands.Cog, name="MessageDispatchCog"):
+    """
+    The one on_message listener for the booru cogs. Each message is scanned once
+    (utilities/message_scan.py), and only images and replies to the bot are passed on:
+
+    on_image_message(message, scan): an image attachment or a lone image link
+    on_bot_reply(message): a reply to one of our messages
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+
+    @commands.Cog.listener()
+    async def on_message(self, message):
+        found = scan(message, self.bot.user.id)
+        if found is None:
+            return
+
+        if found.image:
+            self.bot.dispatch("image_message", message, found)
+        if found.reply_to_bot:
+            self.bot.dispatch("bot_reply", message)
+
+
+async def setup(bot):
+    await bot.add_cog(MessageDispatch(bot))
@@ -0,0 +1,39 @@
+import psycopg
+import logging
+import asyncio
+
+from discord.ext import commands, tasks
+
+from utilities import post_mirror
+
+
+class PostMirrorCog(commands.Cog, name="PostMirrorCog"):
+    """Keeps the local post mirror (utilities/post_mirror.py) synced from the Danbooru DB."""
+
+    def __init__(self, bot):
+        self.bot = bot
+
+    # One replica syncing is plenty, the mirror lives in the shared database
+    @commands.Cog.listener()
+    async def on_leader_elected(self):
+        if not self.sync_mirror.is_running():
+            self.sync_mirror.start()
+
+    @commands.Cog.listener()
+    async def on_leader_deposed(self):
+        self.sync_mirror.cancel()
+
+    async def cog_unload(self):
+        self.sync_mirror.cancel()
+
+    @tasks.loop(minutes=1)
+    async def sync_mirror(self):
+        try:
+            await asyncio.to_thread(post_mirror.sync)
+        except psycopg.Error as e:
+            # Readers notice the mirror going stale and fall back to the API
+            logging.warning(f"Could not sync post mirror: {e}")
+
+
+async def setup(bot):
+    await bot.add_cog(PostMirrorCog(bot))
@@ -0,0 +1,79 @@
+import discord
+import logging
+
+from collections import Counter
+
+from discord import app_commands
+from discord.ext import commands, tasks
+
+from utilities.leader import is_leader
+from utilities.sharding import (
+    ShardMetrics,
+    runs_singletons,
+    shard_for_guild,
+    shard_latencies,
+    shard_of,
+)
+
+
+class ShardsCog(commands.Cog, name="ShardsCog"):
+    """Per shard gateway latency and event rates (see utilities/sharding.py)."""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.metrics = ShardMetrics()
+        self.event_rates = {}  # shard id -> events per second over the last minute
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        if not self.sample_rates.is_running():
+            self.sample_rates.start()
+
+    async def cog_unload(self):
+        self.sample_rates.cancel()
+
+    @commands.Cog.listener()
+    async def on_message(self, message):
+        self.metrics.count(shard_of(message))
+
+    @commands.Cog.listener()
+    async def on_raw_reaction_add(self, payload):
+        self.metrics.count(shard_for_guild(payload.guild_id, self.bot.shard_count))
+
+    @commands.Cog.listener()
+    async def on_interaction(self, interaction):
+        self.metrics.count(shard_for_guild(interaction.guild_id, self.bot.shard_count))
+
+    @tasks.loop(minutes=1)
+    async def sample_rates(self):
+        self.event_rates = self.metrics.rates()
+        for shard_id, latency in shard_latencies(self.bot):
+            logging.debug(
+                f"Shard {shard_id}: {latency * 1000:.0f}ms latency, "
+                f"{self.event_rates.get(shard_id, 0) * 60:.0f} events/min"
+            )
+
+    @app_commands.command(
+        name="shards", description="Show gateway latency and event rates per shard."
+    )
+    @app_commands.checks.has_permissions(administrator=True)
+    async def show_shards(self, interaction: discord.Interaction):
+        guilds = Counter(guild.shard_id for guild in self.bot.guilds)
+        lines = [
+            f"Shard {shard_id}: {latency * 1000:.0f}ms, "
+            f"{self.event_rates.get(shard_id, 0) * 60:.0f} events/min, "
+            f"{guilds[shard_id]} guilds"
+            for shard_id, latency in shard_latencies(self.bot)
+        ]
+        if is_leader(self.bot):
+            lines.append("This process is the leader and runs the background tasks.")
+        elif runs_singletons(self.bot):
+            lines.append("This process is standing by to run the background tasks.")
+        else:
+            lines.append("This process doesn't have the home shard.")
+
+        await interaction.response.send_message("\n".join(lines), ephemeral=True)
+
+
+async def setup(bot):
+    await bot.add_cog(ShardsCog(bot))
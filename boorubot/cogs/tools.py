@@ -9,6 +9,8 @@ from datetime import datetime
 from utilities.common import seconds_until
 
 from utilities.database import store_key, retrieve_key
+from utilities.startup import sync_tree
+from utilities.throttle import status_lines
 
 
 class ToolCog(commands.Cog, name="ToolsCog"):
@@ -92,10 +94,24 @@ class ToolCog(commands.Cog, name="ToolsCog"):
         except Exception as e:
             logging.error(f"Couldn't check db at all, error was {e}")
 
+        limits = "\n".join(status_lines())
         await ctx.response.send_message(
-            f"I am running version `{self.bot.version}`. DB is `{dbstatus}`, access `{vc}`"
+            f"I am running version `{self.bot.version}`. DB is `{dbstatus}`, access `{vc}`\n"
+            f"```\n{limits}\n```"
         )
 
+    @commands.command(name="sync_commands")
+    @commands.has_permissions(administrator=True)
+    async def sync_commands(self, ctx, target: str = "global"):
+        """
+        Force a command tree sync, even if the commands look unchanged.
+
+        Usage: ^sync_commands [global|here]
+        """
+        guild = ctx.guild if target == "here" else None
+        await sync_tree(self.bot.tree, guild, force=True)
+        await ctx.send(f"Synced {'guild' if guild else 'global'} app commands.")
+
 
 async def setup(bot):
     await bot.add_cog(ToolCog(bot))
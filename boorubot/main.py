@@ -12,13 +12,15 @@ import discord
 from discord import Intents, app_commands
 from discord.ext import commands
 
-from .utilities.migrations import init_migrations
+from .utilities.migrations import run_migrations
+from .utilities.config import config
+from .utilities.startup import StartupTimer, sync_tree
 
 
-def init_db():
+async def init_db():
     try:
         # Initialize and run migrations
-        init_migrations()
+        await run_migrations()
         logging.info("Database initialized and migrations applied successfully.")
         return True
     except Exception as e:
@@ -34,15 +36,8 @@ class BooruBot:
 
         # Some local memory flags
         self.dbReady = False
-
-        # Create our discord bot
-        self.bot = commands.Bot(command_prefix="^", intents=intents)
-
-        # Remove legacy help command
-        self.bot.remove_command("help")
-
-        # Register python commands
-        self.bot.on_ready = self.on_ready
+        self.startup = StartupTimer()
+        self.startup_reported = False
 
         # Get the build commit that the code was built with.
         self.version = str(os.environ.get("GIT_COMMIT"))  # Currently running version
@@ -86,19 +81,32 @@ class BooruBot:
             )
             logging.info("Running in prod mode.")
 
+        # Create our discord bot, after logging is set up since this reads the config
+        settings = config()
+        if settings.sharded:
+            # One gateway connection per shard, see utilities/sharding.py
+            self.bot = commands.AutoShardedBot(
+                command_prefix="^",
+                intents=intents,
+                shard_count=settings.shard_count,
+                shard_ids=settings.shard_ids,
+            )
+            logging.info(
+                f"Sharded mode, running shards {settings.shard_ids or 'all'} "
+                f"of {settings.shard_count or 'auto'}"
+            )
+        else:
+            self.bot = commands.Bot(command_prefix="^", intents=intents)
+
+        # Remove legacy help command
+        self.bot.remove_command("help")
+
+        # Register python commands
+        self.bot.on_ready = self.on_ready
+
         # Append some extra information to our discord bot
         self.bot.version = self.version  # Package version with bot
 
-        # DB Setup
-        try:
-            logging.info("Configuring DB and running migrations")
-            self.dbReady = init_db()
-        except Exception as e:
-            logging.error(f"Could not configure the DB! Error was {e}")
-            self.dbReady = False
-        finally:
-            logging.info("Done configuring DB")
-
     async def load_cogs(self):
         # Cog Loader!
         logging.info("Loading cogs...")
@@ -113,15 +121,39 @@ class BooruBot:
                 return
         
         logging.info(f"Loading cogs from: {cogs_path}")
-        for filename in os.listdir(cogs_path):
-            logging.info(f"Found file {filename}, loading as extension.")
-            if filename.endswith(".py") and not filename.startswith("_"):
-                try:
-                    await self.bot.load_extension(f"cogs.{filename[:-3]}")
-                except Exception as e:
-                    logging.fatal(f"Error loading {filename} as a cog, error: {e}")
+        extensions = [
+            f"cogs.{filename[:-3]}"
+            for filename in sorted(os.listdir(cogs_path))
+            if filename.endswith(".py") and not filename.startswith("_")
+        ]
+
+        # Imports still run one at a time, but each cog's async setup overlaps the rest
+        await asyncio.gather(*(self.load_cog(extension) for extension in extensions))
         logging.info("Done loading cogs")
 
+    async def load_cog(self, extension):
+        logging.info(f"Loading {extension} as extension.")
+        try:
+            await self.startup.timed(extension, self.bot.load_extension(extension))
+        except Exception as e:
+            logging.fatal(f"Error loading {extension} as a cog, error: {e}")
+
+    async def sync_commands(self):
+        """Sync the command tree, unless the same commands were synced before."""
+        guild = None
+        if self.debug and config().debug_guild_id:
+            # Debug builds only sync to the test guild, where changes show up right away
+            guild = discord.Object(id=config().debug_guild_id)
+
+        with self.startup.phase("tree sync"):
+            synced = await sync_tree(self.bot.tree, guild)
+
+        target = f"guild {guild.id}" if guild else "global"
+        if synced:
+            logging.info(f"Synced {target} app commands.")
+        else:
+            logging.info(f"App commands unchanged, skipped {target} sync.")
+
     async def on_ready(self):
         # Start health monitoring
         logging.info(
@@ -130,7 +162,12 @@ class BooruBot:
         self.healthcheck_server = await discordhealthcheck.start(self.bot)
         logging.info("Done prepping external monitoring")
 
-        await self.bot.tree.sync()
+        # on_ready fires again after every reconnect, those find nothing to sync
+        await self.sync_commands()
+
+        if not self.startup_reported:
+            logging.info(self.startup.report())
+            self.startup_reported = True
 
     async def on_message(self, ctx):
         # hehe, sneaky every time
@@ -139,15 +176,27 @@ class BooruBot:
     async def start_bot(self):
         logging.info(f"Using version {self.version}")
 
+        # Migrations run while we log in, cogs only need them done by the time they load.
+        logging.info("Configuring DB and running migrations")
+        self.dbReady, _ = await asyncio.gather(
+            self.startup.timed("migrations", init_db()),
+            self.startup.timed(
+                "login", self.bot.login(str(os.environ.get("BOT_TOKEN")))
+            ),
+        )
+        logging.info("Done configuring DB")
+
         if not self.dbReady:
             logging.error("Database not ready. Bot will not start.")
+            await self.bot.close()
             return
 
         # Begin the cog loader
-        await self.load_cogs()
+        with self.startup.phase("cogs"):
+            await self.load_cogs()
 
-        # Run the discord bot using our token.
-        await self.bot.start(str(os.environ.get("BOT_TOKEN")))
+        # Connect to the gateway, on_ready finishes the startup report
+        await self.bot.connect()
 
     def run(self):
         asyncio.run(self.start_bot())
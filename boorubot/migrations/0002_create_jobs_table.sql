@@ -0,0 +1,21 @@
+-- Persistent work queue, see utilities/jobs.py
+CREATE TABLE IF NOT EXISTS jobs (
+    id BIGSERIAL PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload JSONB NOT NULL DEFAULT '{}',
+    idempotency_key TEXT UNIQUE,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 8,
+    run_after TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    locked_until TIMESTAMP,
+    last_error TEXT,
+    result JSONB,
+    announced BOOLEAN NOT NULL DEFAULT FALSE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS jobs_ready_idx
+    ON jobs (run_after, id) WHERE status IN ('pending', 'running');
+CREATE INDEX IF NOT EXISTS jobs_unannounced_idx
+    ON jobs (id) WHERE status IN ('done', 'failed') AND NOT announced;
@@ -0,0 +1,19 @@
+-- Local copy of the booru's post metadata, see utilities/post_mirror.py
+CREATE TABLE IF NOT EXISTS post_mirror (
+    id INTEGER PRIMARY KEY,
+    tag_string TEXT NOT NULL DEFAULT '',
+    tags TEXT[] NOT NULL DEFAULT '{}',  -- tag_string split up, written by sync()
+    tag_string_artist TEXT NOT NULL DEFAULT '',
+    source TEXT NOT NULL DEFAULT '',
+    rating CHAR(1),
+    is_pending BOOLEAN NOT NULL DEFAULT FALSE,
+    is_deleted BOOLEAN NOT NULL DEFAULT FALSE,
+    uploader_id INTEGER,
+    updated_at TIMESTAMP NOT NULL,
+    synced_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS post_mirror_tags_idx ON post_mirror USING GIN (tags);
+CREATE INDEX IF NOT EXISTS post_mirror_cursor_idx
+    ON post_mirror (updated_at, id);
+CREATE INDEX IF NOT EXISTS post_mirror_pending_idx
+    ON post_mirror (id) WHERE is_pending AND NOT is_deleted;
@@ -0,0 +1,3 @@
+-- Which shard a finished job's Discord follow-up belongs on, NULL for the home shard.
+-- See utilities/sharding.py
+ALTER TABLE jobs ADD COLUMN IF NOT EXISTS announce_shard INTEGER;
@@ -0,0 +1,5 @@
+-- When we last changed a post on the booru, until a sync has read it back.
+-- See post_mirror.forget()
+ALTER TABLE post_mirror ADD COLUMN IF NOT EXISTS stale_at TIMESTAMP;
+CREATE INDEX IF NOT EXISTS post_mirror_stale_idx
+    ON post_mirror (id) WHERE stale_at IS NOT NULL;
@@ -0,0 +1,235 @@
+import time
+import random
+import asyncio
+import logging
+
+from collections import OrderedDict
+
+from .config import config
+from .throttle import BOORU_READ, ServiceUnavailable, service
+
+"""
+Caching read layer in front of the booru's JSON API.
+
+Keyed on endpoint + params, with a TTL per endpoint. Stale entries are revalidated with
+If-None-Match / If-Modified-Since so an unchanged post costs a 304 instead of a body,
+and identical requests that arrive while one is already in flight share its result.
+Anything the bot writes to a post should go through `invalidate_post`.
+"""
+
+# Seconds an entry is served without asking the booru again, by endpoint. Endpoints
+# ending in an id are matched as e.g. "posts/{id}".
+DEFAULT_TTLS = {
+    "posts": 15,
+    "posts/{id}": 30,
+    "users/{id}": 3600,
+    "tags": 600,
+    "comments": 0,
+}
+DEFAULT_TTL = 30
+
+RANDOM_POOL_SIZE = 50
+
+
+def endpoint_pattern(endpoint):
+    """`posts/123` -> `posts/{id}`"""
+    return "/".join("{id}" if part.isdigit() else part for part in endpoint.split("/"))
+
+
+def cache_key(endpoint, params=None):
+    return (endpoint, tuple(sorted((params or {}).items())))
+
+
+class CacheEntry:
+    __slots__ = ("data", "etag", "last_modified", "expires")
+
+    def __init__(self, data, etag, last_modified, expires):
+        self.data = data
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires = expires
+
+
+class BooruCache:
+    def __init__(
+        self,
+        api_url,
+        api_key="",
+        api_user="",
+        ttls=None,
+        max_entries=5000,
+        clock=time.monotonic,
+    ):
+        self.api_url = api_url.rstrip("/")
+        self.api_key = api_key
+        self.api_user = api_user
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.max_entries = max_entries
+        self.clock = clock
+
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.coalesced = 0
+
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._random_pools = OrderedDict()
+        self._session = None
+
+    def ttl_for(self, endpoint):
+        return self.ttls.get(endpoint_pattern(endpoint), DEFAULT_TTL)
+
+    async def get_json(self, endpoint, params=None, ttl=None):
+        key = cache_key(endpoint, params)
+        entry = self._entries.get(key)
+
+        if entry is not None and entry.expires > self.clock():
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry.data
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            return await asyncio.shield(inflight)
+
+        self.misses += 1
+        task = asyncio.ensure_future(self._refresh(key, endpoint, params, ttl, entry))
+        self._inflight[key] = task
+        try:
+            return await asyncio.shield(task)
+        finally:
+            if self._inflight.get(key) is task:
+                del self._inflight[key]
+
+    async def _refresh(self, key, endpoint, params, ttl, entry):
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+
+        try:
+            status, data, response_headers = await service(BOORU_READ).call(
+                self._request, endpoint, params, headers
+            )
+        except ServiceUnavailable:
+            if entry is None:
+                raise
+            # The booru is down or we're over our limit, old data beats none
+            logging.debug(f"Serving stale {endpoint}, booru unavailable")
+            return entry.data
+        expires = self.clock() + (self.ttl_for(endpoint) if ttl is None else ttl)
+
+        if status == 304 and entry is not None:
+            self.revalidated += 1
+            entry.expires = expires
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            return entry.data
+
+        self._entries[key] = CacheEntry(
+            data,
+            response_headers.get("ETag"),
+            response_headers.get("Last-Modified"),
+            expires,
+        )
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return data
+
+    async def _request(self, endpoint, params, headers):
+        """Returns (status, json, headers). Raises on HTTP errors other than 304."""
+        import aiohttp
+
+        if self._session is None or self._session.closed:
+            auth = None
+            if self.api_user and self.api_key:
+                auth = aiohttp.BasicAuth(self.api_user, self.api_key)
+            self._session = aiohttp.ClientSession(
+                auth=auth, timeout=aiohttp.ClientTimeout(total=30)
+            )
+
+        url = f"{self.api_url}/{endpoint}.json"
+        async with self._session.get(url, params=params, headers=headers) as resp:
+            if resp.status == 304:
+                return 304, None, resp.headers
+            resp.raise_for_status()
+            return resp.status, await resp.json(), resp.headers
+
+    def invalidate_post(self, post_id):
+        """Forget everything that could show a post's old tags/source/rating."""
+        self._entries.pop(cache_key(f"posts/{post_id}"), None)
+        for key in [k for k in self._entries if k[0] == "posts"]:
+            del self._entries[key]
+        self._random_pools.clear()
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidated": self.revalidated,
+            "coalesced": self.coalesced,
+        }
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+    # Convenience reads
+
+    async def post(self, post_id):
+        return await self.get_json(f"posts/{post_id}")
+
+    async def post_tags(self, post_id):
+        return (await self.post(post_id))["tag_string"].split()
+
+    async def username(self, user_id):
+        return (await self.get_json(f"users/{user_id}"))["name"]
+
+    async def tag_exists(self, tag):
+        return bool(await self.get_json("tags", {"search[name]": tag}))
+
+    async def random_post(self, tags, exclude=()):
+        """
+        One random post matching `tags` and none of `exclude`, or None.
+
+        Pulls a batch of random matches at a time and hands them out one by one, so
+        repeated /random calls for the same tags don't each cost a random search.
+        """
+        query = " ".join([tags] + [f"-{tag}" for tag in exclude]).strip()
+        pool = self._random_pools.get(query)
+        if not pool:
+            posts = await self.get_json(
+                "posts",
+                {"tags": query, "limit": RANDOM_POOL_SIZE, "random": "true"},
+                ttl=0,
+            )
+            pool = list(posts or [])
+            random.shuffle(pool)
+            self._random_pools[query] = pool
+        self._random_pools.move_to_end(query)
+        while len(self._random_pools) > self.max_entries:
+            self._random_pools.popitem(last=False)
+        if not pool:
+            return None
+        return pool.pop()
+
+
+_shared = None
+
+
+def shared_cache():
+    """The process wide cache, configured from the booru settings in `config()`."""
+    global _shared
+    if _shared is None:
+        settings = config()
+        _shared = BooruCache(
+            settings.booru_url, settings.booru_key, settings.booru_user
+        )
+        logging.debug("Created shared booru cache")
+    return _shared
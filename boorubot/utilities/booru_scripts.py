@@ -0,0 +1,35 @@
+import os
+import sys
+import importlib.util
+
+"""
+The Booru_Scripts submodule, loaded once per process.
+
+It isn't a package, so it has to be loaded from its file path. Cogs and job handlers
+import `booru_scripts` from here instead of each executing their own copy, and the copy
+is kept in `sys.modules` so the bot's two import paths for `utilities` still share it.
+"""
+
+SCRIPT_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)),
+    "scripts",
+    "Booru_Scripts",
+    "booru_utils.py",
+)
+
+
+def load():
+    module = sys.modules.get("booru_scripts")
+    if module is None:
+        spec = importlib.util.spec_from_file_location("booru_scripts", SCRIPT_PATH)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules["booru_scripts"] = module
+        try:
+            spec.loader.exec_module(module)
+        except BaseException:
+            del sys.modules["booru_scripts"]
+            raise
+    return module
+
+
+booru_scripts = load()
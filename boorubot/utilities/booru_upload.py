@@ -0,0 +1,199 @@
+import os
+import glob
+import time
+import uuid
+import hashlib
+import logging
+import tempfile
+
+from contextlib import contextmanager
+
+import requests
+
+from .media import MAX_UPLOAD_BYTES, strip_stream
+
+"""
+Uploads that skip the temp file.
+
+`stream_upload` takes an open CDN response and writes it into the body of the booru's
+multipart `POST /uploads.json` one chunk at a time. Metadata is stripped from the head
+of the file on the way (see `media.strip_stream`), and what goes out is hashed. Nothing
+touches the disk, and only the head of the file and the current chunk are in memory.
+The upload job uses the MD5 to find a post it made before a crash.
+
+`source_upload` never sees the file. The booru fetches `upload[source]` itself.
+Danbooru supports that, but the booru has to be able to reach the Discord CDN, so it's
+opt in with BOORU_UPLOAD_FROM_SOURCE.
+
+`scratch_file` is for the places that still need the file on disk: the duplicate check,
+and re-encoding files over the size limit. The file, and anything made next to it, is
+removed when the block exits, however it exits.
+"""
+
+UPLOAD_FROM_SOURCE = os.getenv("BOORU_UPLOAD_FROM_SOURCE", "false").lower() == "true"
+
+CHUNK_SIZE = 64 * 1024
+UPLOAD_POLL_SECONDS = 1
+UPLOAD_POLL_ATTEMPTS = 30
+
+
+class UploadTooLarge(Exception):
+    """The file is over the booru's size limit, so it has to be re-encoded first."""
+
+
+class UploadFailed(Exception):
+    """The booru took the upload but didn't end up with a media asset."""
+
+
+@contextmanager
+def scratch_file(filename=""):
+    """A new, empty temp file with `filename`'s extension. Yields its path."""
+    fd, path = tempfile.mkstemp(
+        prefix="boorubot_", suffix=os.path.splitext(filename)[1]
+    )
+    os.close(fd)
+    try:
+        yield path
+    finally:
+        # Thumbnails and re-encodes are written as `path` plus an extension
+        for leftover in [path] + glob.glob(glob.escape(path) + ".*"):
+            try:
+                os.remove(leftover)
+            except FileNotFoundError:
+                pass
+
+
+def _auth(api_key, api_user):
+    return (api_user, api_key) if api_user and api_key else None
+
+
+def open_download(url, max_bytes=MAX_UPLOAD_BYTES, timeout=60):
+    """
+    Start a streaming GET of `url`, returns the response with the body unread. Raises
+    UploadTooLarge if it says it's over `max_bytes`.
+    """
+    resp = requests.get(url, stream=True, timeout=timeout)
+    try:
+        resp.raise_for_status()
+        size = int(resp.headers.get("Content-Length") or 0)
+        if size > max_bytes:
+            raise UploadTooLarge(f"{url} is {size} bytes")
+    except BaseException:
+        resp.close()
+        raise
+    return resp
+
+
+class HashingStream:
+    """Passes chunks through, keeping the MD5 and size of what went by."""
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._md5 = hashlib.md5()
+        self.size = 0
+
+    def __iter__(self):
+        for chunk in self._chunks:
+            self._md5.update(chunk)
+            self.size += len(chunk)
+            yield chunk
+
+    @property
+    def md5(self):
+        return self._md5.hexdigest()
+
+
+def multipart(field, filename, content_type, chunks, boundary):
+    """A multipart/form-data body with a single file, as a generator of bytes."""
+    filename = "".join(c for c in filename if c not in '"\r\n') or "upload"
+    yield (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode()
+    yield from chunks
+    yield f"\r\n--{boundary}--\r\n".encode()
+
+
+def _finished(upload, api_url, api_key, api_user):
+    """Wait for the booru to process `upload`, returns it with its media assets."""
+    for _ in range(UPLOAD_POLL_ATTEMPTS):
+        if upload.get("status") == "error":
+            raise UploadFailed(f"Upload {upload['id']} failed: {upload.get('error')}")
+        if upload.get("upload_media_assets"):
+            return upload
+        time.sleep(UPLOAD_POLL_SECONDS)
+        resp = requests.get(
+            f"{api_url}/uploads/{upload['id']}.json",
+            auth=_auth(api_key, api_user),
+            timeout=30,
+        )
+        resp.raise_for_status()
+        upload = resp.json()
+    raise UploadFailed(f"Upload {upload['id']} is still processing")
+
+
+def _asset(upload):
+    """(upload media asset id, md5 or None)"""
+    asset = upload["upload_media_assets"][0]
+    md5 = asset.get("md5") or (asset.get("media_asset") or {}).get("md5")
+    return asset["id"], md5
+
+
+def stream_upload(resp, filename, api_url, api_key, api_user, timeout=300):
+    """
+    Upload the body of `resp`, from `open_download`, while it downloads. Returns the
+    upload media asset id and the MD5 of what was sent.
+    """
+    content_type = resp.headers.get("Content-Type", "application/octet-stream")
+    body = HashingStream(strip_stream(resp.iter_content(CHUNK_SIZE)))
+    boundary = uuid.uuid4().hex
+
+    upload = requests.post(
+        f"{api_url}/uploads.json",
+        data=multipart("upload[files][0]", filename, content_type, body, boundary),
+        headers={"Content-Type": f"multipart/form-data; boundary={boundary}"},
+        auth=_auth(api_key, api_user),
+        timeout=timeout,
+    )
+    upload.raise_for_status()
+    logging.debug(f"Streamed {body.size} bytes of {filename} to the booru")
+
+    upload_id, _ = _asset(_finished(upload.json(), api_url, api_key, api_user))
+    return upload_id, body.md5
+
+
+def source_upload(url, api_url, api_key, api_user, timeout=30):
+    """
+    Have the booru fetch `url` itself. Returns the upload media asset id and the MD5,
+    if the booru told us.
+    """
+    resp = requests.post(
+        f"{api_url}/uploads.json",
+        data={"upload[source]": url},
+        auth=_auth(api_key, api_user),
+        timeout=timeout,
+    )
+    resp.raise_for_status()
+    return _asset(_finished(resp.json(), api_url, api_key, api_user))
+
+
+def find_post_by_md5(md5, api_url, api_key, api_user, timeout=30):
+    """The id of the post with this file, or None."""
+    resp = requests.get(
+        f"{api_url}/posts.json",
+        params={"tags": f"md5:{md5}", "limit": 1},
+        auth=_auth(api_key, api_user),
+        timeout=timeout,
+    )
+    resp.raise_for_status()
+    posts = resp.json()
+    return posts[0]["id"] if posts else None
+
+
+def file_md5(path):
+    md5 = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            md5.update(chunk)
+    return md5.hexdigest()
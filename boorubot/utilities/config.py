@@ -0,0 +1,186 @@
+import os
+import logging
+
+from types import MappingProxyType
+
+import yaml
+
+"""
+Bot settings, parsed once.
+
+`Config` reads the environment and the YAML files in `config/` up front and keeps
+everything in the form the hot paths want: channel ids as ints, role ids as a frozenset,
+the deletion list as a read only mapping. `config()` returns the current one. `reload()`
+builds a fresh `Config` and swaps it in with a single assignment, so a reader either sees
+the old settings or the new ones, never half of each, and a broken file leaves the old
+settings in place.
+"""
+
+CONFIG_DIRS = [
+    os.getenv("BOORU_CONFIG_DIR", ""),
+    os.path.join(os.path.dirname(__file__), "..", "config"),
+    os.path.join("/app", "config"),
+]
+
+DEFAULT_DELETIONS = {"fayanna": "Character requested removal."}
+
+# What building a Config (or the spoiler policies) raises on a broken setting or file
+RELOAD_ERRORS = (OSError, ValueError, TypeError, yaml.YAMLError)
+
+
+def config_path(name, dirs=None):
+    """The first `name` found in the config directories, or None."""
+    for directory in CONFIG_DIRS if dirs is None else dirs:
+        if not directory:
+            continue
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            return os.path.normpath(path)
+    return None
+
+
+def _int_or_none(value):
+    value = (value or "").strip()
+    return int(value) if value else None
+
+
+def _int_list(value):
+    return [int(part) for part in (value or "").split(",") if part.strip()]
+
+
+def _shard_ids(value):
+    """'0-3,8' -> [0, 1, 2, 3, 8], or None if unset."""
+    shard_ids = []
+    for part in (value or "").split(","):
+        part = part.strip()
+        if "-" in part:
+            first, last = part.split("-", 1)
+            shard_ids.extend(range(int(first), int(last) + 1))
+        elif part:
+            shard_ids.append(int(part))
+    return sorted(set(shard_ids)) or None
+
+
+def _flag(value):
+    return str(value).lower() in ("true", "1", "t", "yes")
+
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+def _load_deletions(path):
+    if path is None:
+        logging.warning("No deletions config file found, using default")
+        return dict(DEFAULT_DELETIONS)
+
+    with open(path, "r") as file:
+        deletions = (yaml.safe_load(file) or {}).get("deletions") or {}
+    logging.info(f"Loaded {len(deletions)} deletion rules from {path}")
+    return deletions
+
+
+class Config:
+    __slots__ = (
+        "booru_url",
+        "booru_key",
+        "booru_user",
+        "saucenao_api_key",
+        "auto_upload_channel_ids",
+        "fav_channel_id",
+        "maintenance_channel_id",
+        "alert_channel_id",
+        "tag_help_thread_id",
+        "contributor_role_ids",
+        "debug_guild_id",
+        "sharded",
+        "shard_count",
+        "shard_ids",
+        "home_guild_id",
+        "job_workers",
+        "deletions",
+        "deletions_path",
+        "spoilers_path",
+        "_mtimes",
+    )
+
+    def __init__(self, environ=None, dirs=None):
+        environ = os.environ if environ is None else environ
+
+        self.booru_url = environ.get("BOORU_URL", "")
+        self.booru_key = environ.get("BOORU_KEY", "")
+        self.booru_user = environ.get("BOORU_USER", "")
+        self.saucenao_api_key = environ.get("SAUCENAO_API_KEY", "")
+
+        # First auto upload channel is where favs go
+        auto_upload = _int_list(environ.get("BOORU_AUTO_UPLOAD"))
+        self.auto_upload_channel_ids = frozenset(auto_upload)
+        self.fav_channel_id = auto_upload[0] if auto_upload else None
+
+        self.maintenance_channel_id = _int_or_none(environ.get("BOORU_MAINTENANCE"))
+        self.alert_channel_id = _int_or_none(environ.get("ALERT_CHAN_ID"))
+        self.tag_help_thread_id = _int_or_none(environ.get("TAG_HELP_THREAD"))
+        self.contributor_role_ids = frozenset(
+            _int_list(environ.get("CONTRIBUTOR_ROLES"))
+        )
+        self.debug_guild_id = _int_or_none(environ.get("DEBUG_GUILD_ID"))
+
+        # Sharding, see utilities/sharding.py. No count means let Discord pick one.
+        self.sharded = _flag(environ.get("BOORU_SHARDED"))
+        self.shard_count = _int_or_none(environ.get("BOORU_SHARD_COUNT"))
+        self.shard_ids = _shard_ids(environ.get("BOORU_SHARD_IDS"))
+        if self.shard_ids is not None and self.shard_count is None:
+            raise ValueError("BOORU_SHARD_IDS needs BOORU_SHARD_COUNT")
+        self.home_guild_id = _int_or_none(environ.get("HOME_GUILD_ID"))
+        self.job_workers = int(environ.get("BOORU_JOB_WORKERS") or 2)
+
+        self.deletions_path = config_path("deletions.yaml", dirs)
+        self.deletions = MappingProxyType(_load_deletions(self.deletions_path))
+        self.spoilers_path = environ.get("SPOILER_CONFIG") or config_path(
+            "spoilers.yaml", dirs
+        )
+
+        self._mtimes = {
+            path: _mtime(path)
+            for path in (self.deletions_path, self.spoilers_path)
+            if path
+        }
+
+    def __repr__(self):
+        return (
+            f"<Config {self.booru_url or 'no booru'}, "
+            f"{len(self.auto_upload_channel_ids)} upload channels, "
+            f"{len(self.deletions)} deletion rules>"
+        )
+
+    def files_changed(self):
+        """Whether any YAML file this was loaded from has changed on disk since."""
+        return any(_mtime(path) != mtime for path, mtime in self._mtimes.items())
+
+
+_config = None
+
+
+def config():
+    global _config
+    if _config is None:
+        _config = Config()
+    return _config
+
+
+def reload(environ=None, dirs=None):
+    """
+    Re-read the environment and config files and swap the new settings in. Raises (and
+    keeps the old settings) if a file can't be parsed.
+    """
+    return use(Config(environ, dirs))
+
+
+def use(settings):
+    """Swap in an already built `settings`, see `reload`."""
+    global _config
+    _config = settings
+    return _config
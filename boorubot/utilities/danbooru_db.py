@@ -1,7 +1,14 @@
 import os
+import itertools
+
+from datetime import timedelta
 
 FAVORITE_NOTIFY_CHANNEL = "favorite_added"
 
+# Danbooru stamps updated_at before its transaction commits, so a post can turn up
+# behind a cursor that has already read later ones. Syncs start this far back.
+CURSOR_OVERLAP = timedelta(seconds=int(os.getenv("DANBOORU_CURSOR_OVERLAP", 120)))
+
 RATING_NAMES = {
     "g": "general",
     "s": "sensitive",
@@ -53,18 +60,275 @@ async def connect_async():
     return await psycopg.AsyncConnection.connect(autocommit=True, **_connect_kwargs())
 
 
+def db_reads_enabled():
+    """Whether cogs should read from the Danbooru DB instead of the API where they can."""
+    return os.getenv("DANBOORU_DB_READS", "False").lower() in ("true", "1", "yes")
+
+
+# Pooled, read-only connections for everything except LISTEN, which needs a connection
+# of its own for as long as it's listening.
+_pool = None
+
+
+async def _configure_read_only(conn):
+    await conn.execute("SET SESSION CHARACTERISTICS AS TRANSACTION READ ONLY")
+
+
+async def get_pool():
+    global _pool
+    if _pool is None:
+        from psycopg_pool import AsyncConnectionPool
+
+        _pool = AsyncConnectionPool(
+            kwargs={"autocommit": True, **_connect_kwargs()},
+            min_size=1,
+            max_size=int(os.getenv("DANBOORU_DB_POOL_SIZE", 5)),
+            configure=_configure_read_only,
+            open=False,
+        )
+        await _pool.open()
+    return _pool
+
+
+async def close_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+async def _fetch(query, params):
+    """Run a read on a pooled connection, as a server side prepared statement."""
+    pool = await get_pool()
+    async with pool.connection() as conn:
+        cur = await conn.execute(query, params, prepare=True)
+        return await cur.fetchall()
+
+
+# Rows per round trip when streaming a big read through a server side cursor
+STREAM_FETCH_SIZE = int(os.getenv("DANBOORU_DB_FETCH_SIZE", 2000))
+
+_cursor_names = itertools.count()
+
+
+async def stream(query, params=(), fetch_size=None):
+    """
+    Yield the rows of a big read one by one as plain tuples, pulling `fetch_size` at a
+    time through a named server side cursor, so memory stays flat however many rows
+    match. Holds a pooled connection until exhausted; wrap in `contextlib.aclosing`
+    if you might stop early.
+    """
+    pool = await get_pool()
+    async with pool.connection() as conn:
+        # Named cursors only live inside a transaction
+        async with conn.transaction():
+            async with conn.cursor(f"stream_{next(_cursor_names)}") as cur:
+                cur.itersize = fetch_size or STREAM_FETCH_SIZE
+                await cur.execute(query, params)
+                async for row in cur:
+                    yield row
+
+
+def stream_sync(query, params=(), fetch_size=None):
+    """Blocking `stream`, on its own connection, for the job worker threads."""
+    with connect() as conn:
+        conn.read_only = True
+        with conn.cursor(f"stream_{next(_cursor_names)}") as cur:
+            cur.itersize = fetch_size or STREAM_FETCH_SIZE
+            cur.execute(query, params)
+            yield from cur
+
+
+def _scan_posts_query(all_tags, none_tags, pending=None):
+    conditions, params = ["NOT is_deleted"], []
+    if pending is not None:
+        conditions.append("is_pending = %s")
+        params.append(pending)
+    if all_tags:
+        conditions.append("string_to_array(tag_string, ' ') @> %s")
+        params.append(list(all_tags))
+    if none_tags:
+        conditions.append("NOT string_to_array(tag_string, ' ') && %s")
+        params.append(list(none_tags))
+    query = f"""
+        SELECT id, tag_string, rating FROM posts
+        WHERE {" AND ".join(conditions)}
+        ORDER BY id
+    """
+    return query, params
+
+
+def scan_posts(all_tags=(), none_tags=(), fetch_size=None, pending=None):
+    """
+    Every live post with all of `all_tags` and none of `none_tags`, streamed as
+    (id, tag_string, rating) tuples. Async iterator. `pending` limits it to pending
+    (True) or approved (False) posts.
+    """
+    query, params = _scan_posts_query(all_tags, none_tags, pending)
+    return stream(query, params, fetch_size)
+
+
+def scan_posts_sync(all_tags=(), none_tags=(), fetch_size=None, pending=None):
+    """Blocking `scan_posts`."""
+    query, params = _scan_posts_query(all_tags, none_tags, pending)
+    return stream_sync(query, params, fetch_size)
+
+
+_POST_COLUMNS = (
+    "id",
+    "tag_string",
+    "rating",
+    "source",
+    "is_pending",
+    "is_deleted",
+    "uploader_id",
+    "md5",
+    "file_ext",
+)
+_POST_SELECT = f"SELECT {', '.join(_POST_COLUMNS)} FROM posts"
+
+
+def _post(row):
+    return dict(zip(_POST_COLUMNS, row))
+
+
 async def fetch_fav_context(user_id, post_id):
-    async with await connect_async() as conn:
-        cur = await conn.execute(
+    rows = await _fetch(
+        """
+        SELECT u.name, p.tag_string, p.rating
+        FROM users u
+        JOIN posts p ON p.id = %s
+        WHERE u.id = %s
+        """,
+        (post_id, user_id),
+    )
+    if not rows:
+        return None
+    return rows[0][0], rows[0][1], rows[0][2]
+
+
+async def fetch_post(post_id):
+    """A post as a dict with the API's field names, or None."""
+    rows = await _fetch(f"{_POST_SELECT} WHERE id = %s", (post_id,))
+    return _post(rows[0]) if rows else None
+
+
+async def fetch_posts_with_tag(tag, limit=100):
+    """Newest live posts tagged `tag`."""
+    rows = await _fetch(
+        f"""
+        {_POST_SELECT}
+        WHERE string_to_array(tag_string, ' ') @> ARRAY[%s] AND NOT is_deleted
+        ORDER BY id DESC
+        LIMIT %s
+        """,
+        (tag, limit),
+    )
+    return [_post(row) for row in rows]
+
+
+async def fetch_pending_posts(limit=100):
+    """The modqueue, oldest first."""
+    rows = await _fetch(
+        f"{_POST_SELECT} WHERE is_pending AND NOT is_deleted ORDER BY id LIMIT %s",
+        (limit,),
+    )
+    return [_post(row) for row in rows]
+
+
+async def fetch_new_comments(last_comment_id, limit=100):
+    """
+    Comments after `last_comment_id`, newest first like the API, each with the
+    commenter's name as `creator_name`.
+    """
+    rows = await _fetch(
+        """
+        SELECT c.id, c.post_id, c.body, c.creator_id, u.name
+        FROM comments c
+        JOIN users u ON u.id = c.creator_id
+        WHERE c.id > %s AND NOT c.is_deleted
+        ORDER BY c.id DESC
+        LIMIT %s
+        """,
+        (last_comment_id, limit),
+    )
+    return [
+        dict(zip(("id", "post_id", "body", "creator_id", "creator_name"), row))
+        for row in rows
+    ]
+
+
+async def fetch_user_names(user_ids):
+    """{user id: name} for the ids that exist."""
+    rows = await _fetch(
+        "SELECT id, name FROM users WHERE id = ANY(%s)", (list(user_ids),)
+    )
+    return dict(rows)
+
+
+def fetch_changed_posts(after, limit=10000):
+    """
+    Posts changed after the (updated_at, id) cursor `after`, oldest change first, as
+    (id, tag_string, rating, is_deleted, updated_at) rows.
+    """
+    with connect() as conn:
+        cur = conn.execute(
             """
-            SELECT u.name, p.tag_string, p.rating
-            FROM users u
-            JOIN posts p ON p.id = %s
-            WHERE u.id = %s
+            SELECT id, tag_string, rating, is_deleted, updated_at
+            FROM posts
+            WHERE (updated_at, id) > (%s, %s)
+            ORDER BY updated_at, id
+            LIMIT %s
             """,
-            (post_id, user_id),
+            (after[0], after[1], limit),
         )
-        row = await cur.fetchone()
-    if not row:
-        return None
-    return row[0], row[1], row[2]
+        return cur.fetchall()
+
+
+_POST_METADATA = """
+    SELECT p.id, p.tag_string,
+           COALESCE((
+               SELECT string_agg(t.name, ' ')
+               FROM tags t
+               WHERE t.category = 1
+                 AND t.name = ANY(string_to_array(p.tag_string, ' '))
+           ), ''),
+           p.source, p.rating, p.is_pending, p.is_deleted, p.uploader_id,
+           p.updated_at
+    FROM posts p
+"""
+
+
+def rewind(cursor, overlap=CURSOR_OVERLAP):
+    """
+    Where a sync that got as far as `cursor`, an (updated_at, id) pair, picks up again
+    for `fetch_changed_posts` and `fetch_changed_post_metadata`. Posts in the overlap
+    are read twice, so whatever stores them has to upsert.
+    """
+    return (cursor[0] - overlap, 0)
+
+
+def fetch_changed_post_metadata(after, limit=5000):
+    """
+    Like `fetch_changed_posts`, with everything the post mirror keeps: (id, tag_string,
+    tag_string_artist, source, rating, is_pending, is_deleted, uploader_id, updated_at).
+    """
+    with connect() as conn:
+        cur = conn.execute(
+            _POST_METADATA + """
+            WHERE (p.updated_at, p.id) > (%s, %s)
+            ORDER BY p.updated_at, p.id
+            LIMIT %s
+            """,
+            (after[0], after[1], limit),
+        )
+        return cur.fetchall()
+
+
+def fetch_post_metadata(post_ids):
+    """`fetch_changed_post_metadata` rows for these posts."""
+    with connect() as conn:
+        cur = conn.execute(
+            _POST_METADATA + " WHERE p.id = ANY(%s) ORDER BY p.id", (list(post_ids),)
+        )
+        return cur.fetchall()
@@ -0,0 +1,112 @@
+import io
+import csv
+
+"""
+Deletion sweep reports.
+
+A sweep queues a delete job per matching post, and those finish over the next few
+minutes. `DeletionReport` keeps every result as it comes in. The deletions cog posts
+one message per sweep and edits it as results arrive. Once the sweep is done, the full
+list is attached as a CSV if it's too long to show in the message.
+"""
+
+REPORT_LINES = 10  # Per section in the message, the CSV has all of them
+MAX_REPORT_LENGTH = 2000
+
+CSV_COLUMNS = ("post_id", "url", "tag", "reason", "status", "error")
+
+
+class DeletionResult:
+    __slots__ = ("post_id", "tag", "reason", "error")
+
+    def __init__(self, post_id, tag, reason, error=None):
+        self.post_id = post_id
+        self.tag = tag
+        self.reason = reason
+        self.error = error
+
+    @property
+    def deleted(self):
+        return self.error is None
+
+
+class DeletionReport:
+    def __init__(self, api_url, expected=None):
+        self.api_url = api_url
+        self.expected = expected  # None for deletions no sweep told us about
+        self.results = []
+
+    def add_expected(self, count):
+        self.expected = (self.expected or 0) + count
+
+    def record(self, post_id, tag, reason, error=None):
+        self.results.append(DeletionResult(post_id, tag, reason, error))
+
+    @property
+    def deleted(self):
+        return [result for result in self.results if result.deleted]
+
+    @property
+    def failed(self):
+        return [result for result in self.results if not result.deleted]
+
+    @property
+    def complete(self):
+        return self.expected is not None and len(self.results) >= self.expected
+
+    def _line(self, result):
+        verb = "Deleted" if result.deleted else "Failed to delete"
+        return (
+            f"{verb} <{self.api_url}/posts/{result.post_id}> "
+            f"(tag: `{result.tag}`, reason: {result.reason})"
+        )
+
+    def _section(self, title, results):
+        if not results:
+            return []
+        # The latest ones, so an edit in progress shows what just happened
+        lines = [title] + [self._line(result) for result in results[-REPORT_LINES:]]
+        if len(results) > REPORT_LINES:
+            lines.append(f"... and {len(results) - REPORT_LINES} more")
+        return lines + [""]
+
+    def render(self, final=False, limit=MAX_REPORT_LENGTH):
+        deleted, failed = self.deleted, self.failed
+        status = f"{len(deleted)} deleted, {len(failed)} failed"
+        if not final and self.expected is not None:
+            status += f", {max(self.expected - len(self.results), 0)} to go"
+
+        lines = [
+            f"**Automatic deletion report{'' if final else ' (in progress)'}:** {status}",
+            "",
+        ]
+        lines += self._section("**Failed deletions:**", failed)
+        lines += self._section("**Successfully deleted posts:**", deleted)
+        if final and self.needs_attachment():
+            lines.append("Full list attached.")
+
+        report = "\n".join(lines).strip()
+        if len(report) > limit:
+            cut = "\n... (see the attached list)" if final else "\n..."
+            report = report[: limit - len(cut)].rsplit("\n", 1)[0] + cut
+        return report
+
+    def needs_attachment(self):
+        return len(self.results) > REPORT_LINES
+
+    def to_csv(self):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(CSV_COLUMNS)
+        for result in self.results:
+            writer.writerow(
+                (
+                    result.post_id,
+                    f"{self.api_url}/posts/{result.post_id}",
+                    result.tag,
+                    result.reason,
+                    "deleted" if result.deleted else "failed",
+                    result.error or "",
+                )
+            )
+        return buffer.getvalue().encode()
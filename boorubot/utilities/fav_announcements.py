@@ -1,6 +1,7 @@
 import logging
 import re
 
+from utilities.outbox import shared_outbox
 from utilities.spoiler import format_link_with_cw
 
 FAV_HISTORY_LIMIT = 20
@@ -45,8 +46,12 @@ def format_fav_message(usernames, link_section):
     return f"{_fav_header(usernames)}\n{link_section}"
 
 
-def format_fav_announcement(usernames, post_url, tag_string=""):
-    link_section = format_link_with_cw(post_url, tag_string)
+def format_fav_announcement(
+    usernames, post_url, tag_string="", rating=None, channel_id=None, post_id=None
+):
+    link_section = format_link_with_cw(
+        post_url, tag_string, rating, channel_id, post_id
+    )
     return format_fav_message(usernames, link_section)
 
 
@@ -66,12 +71,27 @@ async def announce_fav(
     fav_id,
     tag_string="",
     history_limit=FAV_HISTORY_LIMIT,
+    rating=None,
+    outbox=None,
 ):
-    """Post a fav announcement, or edit a recent one for the same post."""
+    """
+    Queue a fav announcement, or add the user to a recent one for the same post.
+    Returns the outbox future for the announcement if it hasn't been posted yet.
+    """
     import discord
 
+    outbox = outbox or shared_outbox()
     post_url = f"{api_url}/posts/{fav_id}"
 
+    # Still waiting to go out, so there's nothing to edit yet
+    queued = outbox.pending(channel, ("fav", fav_id))
+    if queued is not None:
+        merged = merge_fav_announcement(parse_fav_message(queued.content), username)
+        if merged is None:
+            return
+        queued.content = merged
+        return queued.future
+
     try:
         async for message in channel.history(limit=history_limit):
             if message.author.id != bot_user_id:
@@ -95,4 +115,10 @@ async def announce_fav(
     except discord.HTTPException as e:
         logging.warning(f"Could not scan fav channel history: {e}")
 
-    await channel.send(format_fav_announcement([username], post_url, tag_string))
+    return outbox.send(
+        channel,
+        format_fav_announcement(
+            [username], post_url, tag_string, rating, channel.id, fav_id
+        ),
+        key=("fav", fav_id),
+    )
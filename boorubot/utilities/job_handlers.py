@@ -0,0 +1,376 @@
+import logging
+
+import requests
+
+from . import danbooru_db, jobs, post_mirror
+from .booru_scripts import booru_scripts
+from .config import config
+from .booru_upload import (
+    CHUNK_SIZE,
+    UPLOAD_FROM_SOURCE,
+    UploadTooLarge,
+    file_md5,
+    find_post_by_md5,
+    open_download,
+    scratch_file,
+    source_upload,
+    stream_upload,
+)
+from .media import MediaQueueFull, media_pool, prepare_upload
+from .tag_edit import TagEdit, apply_edits, edit_post
+from .throttle import BOORU_READ, BOORU_WRITE, DISCORD_CDN, service
+
+"""
+The booru side of each job kind. These are plain blocking functions (Booru_Scripts is
+all `requests`), run off the event loop by the worker. They raise to ask for a retry
+and return a JSON-able result for whoever does the Discord follow-up.
+"""
+
+
+class JobError(Exception):
+    """Raised by a handler when the booru didn't do what we asked."""
+
+
+def _read(func, *args, **kwargs):
+    return service(BOORU_READ).call_sync(func, *args, **kwargs)
+
+
+def _write(func, *args, **kwargs):
+    return service(BOORU_WRITE).call_sync(func, *args, **kwargs)
+
+
+def _creds():
+    return (
+        config().booru_url,
+        config().booru_key,
+        config().booru_user,
+    )
+
+
+def _fetch_to_file(url, file_path):
+    with open(file_path, "wb") as f, requests.get(url, stream=True, timeout=60) as resp:
+        resp.raise_for_status()
+        for chunk in resp.iter_content(chunk_size=CHUNK_SIZE):
+            f.write(chunk)
+
+
+def _prepare(file_path):
+    """Strip metadata and shrink an oversized file, returns the path to upload."""
+    try:
+        prepared = media_pool().run_sync(prepare_upload, file_path)
+    except MediaQueueFull as e:
+        logging.info(f"Uploading {file_path} as is: {e}")
+        return file_path
+    return prepared["path"]
+
+
+def _upload_file(payload, api_url, api_key, api_user):
+    """Through a temp file, for files that need re-encoding before they go up."""
+    with scratch_file(payload.get("filename", "upload")) as file_path:
+        service(DISCORD_CDN).call_sync(_fetch_to_file, payload["url"], file_path)
+        upload_path = _prepare(file_path)
+        upload_id = _write(
+            booru_scripts.upload_image, api_key, api_user, api_url, upload_path
+        )
+        return upload_id, file_md5(upload_path)
+
+
+def _upload(payload, api_url, api_key, api_user):
+    """Get the file onto the booru, returns the upload id and the file's MD5 if known."""
+    if UPLOAD_FROM_SOURCE:
+        return _write(source_upload, payload["url"], api_url, api_key, api_user)
+
+    try:
+        resp = service(DISCORD_CDN).call_sync(open_download, payload["url"])
+    except UploadTooLarge as e:
+        logging.info(f"Re-encoding before upload: {e}")
+        return _upload_file(payload, api_url, api_key, api_user)
+    with resp:
+        return _write(
+            stream_upload,
+            resp,
+            payload.get("filename", "upload"),
+            api_url,
+            api_key,
+            api_user,
+        )
+
+
+def handle_upload(payload):
+    api_url, api_key, api_user = _creds()
+    upload_id, md5 = _upload(payload, api_url, api_key, api_user)
+    if not upload_id:
+        raise JobError(f"Failed to upload image from {payload['url']}")
+
+    # If we crashed after creating the post last time, this finds it instead of
+    # making a duplicate.
+    if md5:
+        existing = _read(find_post_by_md5, md5, api_url, api_key, api_user)
+        if existing is not None:
+            return {"post_id": existing, "existing": True}
+
+    post_id = _write(
+        booru_scripts.create_post,
+        api_key,
+        api_user,
+        api_url,
+        upload_id,
+        payload["tags"],
+        payload["rating"],
+        description=payload.get("description", ""),
+    )
+    if post_id is None:
+        raise JobError(
+            f"Uploaded asset {upload_id} but failed to create post for {payload['url']}"
+        )
+
+    return {"post_id": post_id, "existing": False}
+
+
+def _send_edit(edit, adjust=None, base=None):
+    api_url, api_key, api_user = _creds()
+    post = _write(edit_post, edit, api_url, api_key, api_user, adjust=adjust, base=base)
+    post_mirror.forget(edit.post_id)
+    return post
+
+
+def _clear_tagme_over(threshold):
+    """Once a post has enough tags we can clear the `tagme`"""
+
+    def adjust(edit, post):
+        tags = edit.apply(post["tag_string"].split())
+        if "tagme" in tags and len(tags) > threshold:
+            logging.info(f"Clearing tagme on {post['id']}")
+            edit.remove("tagme")
+
+    return adjust
+
+
+def handle_tag_edit(payload):
+    """Adds, removes and an optional new source, all in one PUT."""
+    post_id = payload["post_id"]
+
+    edit = TagEdit(post_id).add(payload.get("add", ""))
+    edit.remove(*payload.get("remove") or [])
+    if payload.get("source"):
+        # No longer missing once we apply one
+        edit.set_source(payload["source"]).remove("missing_source")
+
+    threshold = payload.get("clear_tagme_over")
+    adjust = _clear_tagme_over(threshold) if threshold is not None else None
+
+    post = _send_edit(edit, adjust)
+    return {"post_id": post_id, "tags": post["tag_string"].split()}
+
+
+def handle_source_append(payload):
+    # Jobs queued before sources were folded into tag edits
+    return handle_tag_edit({"post_id": payload["post_id"], "source": payload["source"]})
+
+
+def handle_delete(payload):
+    api_url, api_key, api_user = _creds()
+    post_id = payload["post_id"]
+
+    success = _write(
+        booru_scripts.delete_post,
+        post_id,
+        api_url,
+        api_key,
+        api_user,
+        reason=payload.get("reason", ""),
+    )
+    if not success:
+        raise JobError(f"Failed to delete post {post_id}")
+    post_mirror.forget(post_id)
+    return {"post_id": post_id}
+
+
+def handle_deletion_sweep(payload, job_id=None):
+    """
+    Find posts matching the deletion list and queue a delete job for each, carrying
+    this sweep's `job_id` so they're reported together.
+    """
+    api_url, api_key, api_user = _creds()
+    queued = 0
+
+    for tag, reason in payload["deletions"].items():
+        # Not the post mirror: a sweep needs every match, not a page of them, and the
+        # mirror is only ever as good as the Danbooru DB it copies
+        query = post_mirror.parse_query(tag)
+        if query is not None and danbooru_db.db_reads_enabled():
+            # Stream every match straight from the Danbooru DB
+            all_tags, none_tags, pending = query
+            post_ids = (
+                row[0]
+                for row in danbooru_db.scan_posts_sync(
+                    all_tags, none_tags, pending=True if pending else None
+                )
+            )
+        else:
+            # Use a high limit to get all posts
+            posts = _read(
+                booru_scripts.fetch_images_with_tag,
+                tag,
+                api_url,
+                api_key,
+                api_user,
+                limit=1000,
+                random=False,
+            )
+            post_ids = [post["id"] for post in posts or []]
+
+        found = 0
+
+        def deletes():
+            nonlocal found
+            for post_id in post_ids:
+                found += 1
+                # Keyed on the post, so a post still waiting from the last sweep isn't
+                # queued twice
+                yield (
+                    {
+                        "post_id": post_id,
+                        "tag": tag,
+                        "reason": reason,
+                        "sweep_id": job_id,
+                    },
+                    f"delete:{post_id}",
+                )
+
+        # In batches on one connection, a big DB scan has to finish inside our lease
+        queued += jobs.enqueue_many(jobs.DELETE, deletes())
+
+        if found:
+            logging.info(f"Found {found} posts with tag '{tag}'.")
+        else:
+            logging.debug(f"No posts found with tag '{tag}'.")
+
+    return {"queued": queued}
+
+
+def _maintenance_fixes(edit, post):
+    """The regular maintenance changes `post` needs, added to `edit`."""
+    if "missing_source" in post["tag_string"] and post["source"]:
+        edit.remove("missing_source")
+
+    if "missing_artist" in post["tag_string"] and post["tag_string_artist"]:
+        edit.remove("missing_artist")
+
+    if "vore" not in post["tag_string"].split() and any(
+        tag in post["tag_string"] for tag in ["vore", "unbirth"]
+    ):
+        edit.add("vore")
+
+
+def handle_maintenance_sweep(payload, job_id=None):
+    """Spot-check posts tagged as needing work and fix their tags."""
+    api_url, api_key, api_user = _creds()
+    changes = []
+
+    wanted = ["missing_source", "missing_artist", "bad_link"]
+    posts = post_mirror.find_posts(
+        any_tags=wanted, limit=payload.get("limit", 20), random=True
+    )
+    if posts is None:
+        posts = _read(
+            booru_scripts.fetch_images_with_tag,
+            " OR ".join(wanted),
+            api_url,
+            api_key,
+            api_user,
+            limit=payload.get("limit", 20),
+            random=True,
+        )
+
+    edits, snapshots = {}, {}
+    for post in posts:
+        edit = TagEdit(post["id"])
+        _maintenance_fixes(edit, post)
+        if edit:
+            edits[post["id"]], snapshots[post["id"]] = edit, post
+
+    # All at once rather than a job each. The fixes are decided again if the post has
+    # changed since we looked, and any that fail get a job so they're retried.
+    def send(edit):
+        decided = TagEdit(edit.post_id)
+
+        def adjust(final, post):
+            _maintenance_fixes(final, post)
+            decided.merge(final)
+
+        post = snapshots[edit.post_id]
+        return decided, _send_edit(TagEdit(edit.post_id), adjust, base=post)
+
+    for post_id, result in apply_edits(edits.values(), send).items():
+        if isinstance(result, Exception):
+            edit = edits[post_id]
+            logging.warning(f"Sweep edit to {post_id} failed, queueing it: {result}")
+            jobs.enqueue(
+                jobs.TAG_EDIT,
+                {
+                    "post_id": post_id,
+                    "add": " ".join(edit.added),
+                    "remove": edit.removed,
+                },
+                # A retried sweep doesn't queue the same fix twice
+                idempotency_key=f"maint:{post_id}:{job_id}" if job_id else None,
+            )
+            continue
+
+        # What was decided on the post as it was when we wrote it, and holds now
+        decided, post = result
+        before = set(snapshots[post_id]["tag_string"].split())
+        after = set(post["tag_string"].split())
+        post_url = f"{api_url}/posts/{post_id}"
+        changes.extend(
+            f"Removed `{tag}` from <{post_url}>"
+            for tag in decided.removed
+            if tag in before and tag not in after
+        )
+        changes.extend(
+            f"Added `{tag}` to <{post_url}>"
+            for tag in decided.added
+            if tag in after and tag not in before
+        )
+
+    return {"changes": changes}
+
+
+# Handlers that are also given their job's id, see run_next
+SWEEPS = {jobs.DELETION_SWEEP, jobs.MAINTENANCE_SWEEP}
+
+HANDLERS = {
+    jobs.UPLOAD: handle_upload,
+    jobs.TAG_EDIT: handle_tag_edit,
+    jobs.SOURCE_APPEND: handle_source_append,
+    jobs.DELETE: handle_delete,
+    jobs.DELETION_SWEEP: handle_deletion_sweep,
+    jobs.MAINTENANCE_SWEEP: handle_maintenance_sweep,
+}
+
+
+def run_next(kinds=None):
+    """
+    Claim one job, run it and record the outcome. Blocking, so call it from a thread.
+    Returns the job it ran, or None if the queue had nothing for us.
+    """
+    job = jobs.claim(kinds or HANDLERS.keys())
+    if job is None:
+        return None
+
+    logging.info(f"Running {job}")
+    try:
+        if job.kind in SWEEPS:
+            result = HANDLERS[job.kind](job.payload, job.id)
+        else:
+            result = HANDLERS[job.kind](job.payload)
+    except Exception as e:
+        jobs.fail(job, e)
+        job.status = "pending" if job.attempts < job.max_attempts else "failed"
+        return job
+
+    jobs.complete(job, result)
+    job.status = "done"
+    job.result = result
+    return job
@@ -0,0 +1,316 @@
+import json
+import random
+import logging
+
+from .database import getCur
+
+"""
+Postgres backed job queue.
+
+Anything that writes to the booru goes through here so it survives restarts and gets
+retried. Workers claim jobs with FOR UPDATE SKIP LOCKED so any number of them can share
+the table, and a claimed job carries a lease; if the worker dies the lease runs out and
+another worker picks it up again. A worker that only finishes after that can't record
+its outcome any more, the job belongs to the new lease.
+
+A finished (or permanently failed) job stays `announced = FALSE` until the bot has done
+the Discord side of it (reactions, reports), see cogs/booru_jobs.py. A job queued from a
+message records the message's shard in `announce_shard`, so in sharded mode the process
+that can see that channel is the one that announces it.
+"""
+
+UPLOAD = "upload"
+TAG_EDIT = "tag_edit"
+SOURCE_APPEND = "source_append"
+DELETE = "delete"
+DELETION_SWEEP = "deletion_sweep"
+MAINTENANCE_SWEEP = "maintenance_sweep"
+
+LEASE_SECONDS = 300
+ENQUEUE_BATCH = 500
+BACKOFF_BASE = 5
+BACKOFF_CAP = 3600
+
+
+class Job:
+    __slots__ = (
+        "id",
+        "kind",
+        "payload",
+        "status",
+        "attempts",
+        "max_attempts",
+        "result",
+        "last_error",
+        "locked_until",
+    )
+
+    def __init__(
+        self,
+        id,
+        kind,
+        payload,
+        status="pending",
+        attempts=0,
+        max_attempts=8,
+        result=None,
+        last_error=None,
+        locked_until=None,
+    ):
+        self.id = id
+        self.kind = kind
+        self.payload = payload or {}
+        self.status = status
+        self.attempts = attempts
+        self.max_attempts = max_attempts
+        self.result = result
+        self.last_error = last_error
+        self.locked_until = locked_until  # The lease we claimed it with
+
+    def __repr__(self):
+        return f"<Job {self.id} {self.kind} {self.status} attempt {self.attempts}>"
+
+
+_COLUMNS = (
+    "id, kind, payload, status, attempts, max_attempts, result, last_error, "
+    "locked_until"
+)
+# Only the worker holding the lease writes the outcome. One whose lease ran out while
+# it worked would otherwise overwrite the run of whoever claimed the job next.
+_HOLDS_LEASE = "id = %s AND status = 'running' AND locked_until = %s"
+
+
+def backoff_delay(attempts, base=BACKOFF_BASE, cap=BACKOFF_CAP, jitter=random.random):
+    """Seconds to wait before retry number `attempts` (1 based), exponential with jitter."""
+    delay = min(cap, base * 2 ** max(0, attempts - 1))
+    return delay / 2 + delay / 2 * jitter()
+
+
+def enqueue(kind, payload, idempotency_key=None, max_attempts=8, shard=None):
+    """
+    Add a job. Returns the job id, or None if a job with the same idempotency key is
+    already queued or done. A key whose job permanently failed gets requeued.
+    """
+    cur, conn = getCur()
+    cur.execute(
+        """
+        INSERT INTO jobs (kind, payload, idempotency_key, max_attempts, announce_shard)
+        VALUES (%s, %s, %s, %s, %s)
+        ON CONFLICT (idempotency_key) DO UPDATE
+            SET status = 'pending', attempts = 0, run_after = CURRENT_TIMESTAMP,
+                announced = FALSE, last_error = NULL, updated_at = CURRENT_TIMESTAMP
+            WHERE jobs.status = 'failed'
+        RETURNING id
+        """,
+        (kind, json.dumps(payload), idempotency_key, max_attempts, shard),
+    )
+    row = cur.fetchone()
+    conn.commit()
+    cur.close()
+    conn.close()
+
+    if row is None:
+        logging.debug(f"Job {idempotency_key} already queued, skipping")
+        return None
+
+    logging.debug(f"Queued {kind} job {row[0]} ({idempotency_key})")
+    return row[0]
+
+
+def enqueue_many(kind, entries, max_attempts=8, batch=ENQUEUE_BATCH):
+    """
+    `enqueue` for lots of jobs of one kind, from any iterable of (payload,
+    idempotency_key) pairs. They go in `batch` at a time over one connection. Returns
+    how many were queued.
+    """
+    queued = 0
+    cur, conn = getCur()
+    try:
+        entries = iter(entries)
+        while True:
+            # One row per key, Postgres won't upsert the same row twice in a statement
+            chunk = {}
+            for payload, key in entries:
+                chunk[key] = json.dumps(payload)
+                if len(chunk) >= batch:
+                    break
+            if not chunk:
+                break
+            cur.execute(
+                """
+                INSERT INTO jobs (kind, payload, idempotency_key, max_attempts)
+                SELECT %s, new.payload::jsonb, new.key, %s
+                FROM unnest(%s::text[], %s::text[]) AS new (payload, key)
+                ON CONFLICT (idempotency_key) DO UPDATE
+                    SET status = 'pending', attempts = 0, run_after = CURRENT_TIMESTAMP,
+                        announced = FALSE, last_error = NULL,
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE jobs.status = 'failed'
+                RETURNING id
+                """,
+                (kind, max_attempts, list(chunk.values()), list(chunk)),
+            )
+            queued += len(cur.fetchall())
+            conn.commit()
+    finally:
+        cur.close()
+        conn.close()
+
+    logging.debug(f"Queued {queued} {kind} jobs")
+    return queued
+
+
+def claim(kinds, lease_seconds=LEASE_SECONDS):
+    """Claim the next runnable job of one of `kinds`, or None if there isn't one."""
+    cur, conn = getCur()
+    cur.execute(
+        f"""
+        UPDATE jobs
+        SET status = 'running',
+            attempts = attempts + 1,
+            locked_until = CURRENT_TIMESTAMP + make_interval(secs => %s),
+            updated_at = CURRENT_TIMESTAMP
+        WHERE id = (
+            SELECT id FROM jobs
+            WHERE kind = ANY(%s)
+              AND ((status = 'pending' AND run_after <= CURRENT_TIMESTAMP)
+                OR (status = 'running' AND locked_until < CURRENT_TIMESTAMP))
+            ORDER BY run_after, id
+            FOR UPDATE SKIP LOCKED
+            LIMIT 1
+        )
+        RETURNING {_COLUMNS}
+        """,
+        (lease_seconds, list(kinds)),
+    )
+    row = cur.fetchone()
+    conn.commit()
+    cur.close()
+    conn.close()
+
+    return Job(*row) if row else None
+
+
+def complete(job, result=None):
+    """Record the job as done. False if we no longer held its lease."""
+    cur, conn = getCur()
+    cur.execute(
+        f"""
+        UPDATE jobs
+        SET status = 'done', result = %s, locked_until = NULL, last_error = NULL,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE {_HOLDS_LEASE}
+        """,
+        (json.dumps(result or {}), job.id, job.locked_until),
+    )
+    recorded = cur.rowcount == 1
+    conn.commit()
+    cur.close()
+    conn.close()
+
+    if not recorded:
+        logging.warning(f"{job} finished after its lease ran out, result dropped")
+    return recorded
+
+
+def fail(job, error):
+    """
+    Record a failed attempt, scheduling a retry unless we're out of attempts. False if
+    we no longer held the job's lease.
+    """
+    cur, conn = getCur()
+    if job.attempts >= job.max_attempts:
+        logging.error(f"{job} failed permanently: {error}")
+        cur.execute(
+            f"""
+            UPDATE jobs
+            SET status = 'failed', last_error = %s, locked_until = NULL,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE {_HOLDS_LEASE}
+            """,
+            (str(error), job.id, job.locked_until),
+        )
+    else:
+        delay = backoff_delay(job.attempts)
+        logging.warning(f"{job} failed, retrying in {delay:.0f}s: {error}")
+        cur.execute(
+            f"""
+            UPDATE jobs
+            SET status = 'pending', last_error = %s, locked_until = NULL,
+                run_after = CURRENT_TIMESTAMP + make_interval(secs => %s),
+                updated_at = CURRENT_TIMESTAMP
+            WHERE {_HOLDS_LEASE}
+            """,
+            (str(error), delay, job.id, job.locked_until),
+        )
+    recorded = cur.rowcount == 1
+    conn.commit()
+    cur.close()
+    conn.close()
+
+    if not recorded:
+        logging.warning(f"{job} failed after its lease ran out, error dropped")
+    return recorded
+
+
+def claim_finished(limit=20, shards=None, home=True):
+    """
+    Finished jobs whose Discord side hasn't been handled yet, marked as handled. Jobs
+    queued from a message go to whoever has its shard (any shard if `shards` is None),
+    the rest only to the `home` process.
+    """
+    if shards is None:
+        condition, params = "announce_shard IS NOT NULL", []
+    else:
+        condition, params = "announce_shard = ANY(%s)", [list(shards)]
+    condition = f"AND ({condition} OR (announce_shard IS NULL AND %s))"
+    params.append(home)
+
+    cur, conn = getCur()
+    cur.execute(
+        f"""
+        UPDATE jobs SET announced = TRUE
+        WHERE id IN (
+            SELECT id FROM jobs
+            WHERE status IN ('done', 'failed') AND NOT announced {condition}
+            ORDER BY id
+            FOR UPDATE SKIP LOCKED
+            LIMIT %s
+        )
+        RETURNING {_COLUMNS}
+        """,
+        (*params, limit),
+    )
+    rows = cur.fetchall()
+    conn.commit()
+    cur.close()
+    conn.close()
+
+    return sorted((Job(*row) for row in rows), key=lambda job: job.id)
+
+
+def queue_depth():
+    """{status: count} over the whole table."""
+    cur, conn = getCur()
+    cur.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")
+    depth = dict(cur.fetchall())
+    cur.close()
+    conn.close()
+    return depth
+
+
+def prune(days=7):
+    cur, conn = getCur()
+    cur.execute(
+        """
+        DELETE FROM jobs
+        WHERE status IN ('done', 'failed') AND announced
+          AND updated_at < CURRENT_TIMESTAMP - make_interval(days => %s)
+        """,
+        (days,),
+    )
+    removed = cur.rowcount
+    conn.commit()
+    cur.close()
+    conn.close()
+    return removed
@@ -0,0 +1,102 @@
+import os
+import asyncio
+import logging
+
+import psycopg
+
+from .database import connect_kwargs
+
+"""
+Leader election between bot replicas.
+
+Every replica that could run the background tasks (see `sharding.runs_singletons`)
+campaigns by asking Postgres for a session advisory lock on its own connection. The one
+that gets it is the leader and keeps it for as long as that connection lives; the rest
+retry every `interval` seconds. A leader that shuts down unlocks on the way out, and one
+that crashes loses its connection, which releases the lock, so a standby takes over
+within one interval either way. If the leader's own connection breaks it steps down
+right away instead of waiting to find out whether the lock survived.
+"""
+
+# pg_advisory_lock key, any constant every replica agrees on
+LEADER_LOCK = 0x626F6F7275_01
+
+ELECTION_INTERVAL = float(os.getenv("LEADER_ELECTION_INTERVAL", 5))
+
+# Notice a dead server (or a partition) in ~25s instead of the OS default of hours
+_KEEPALIVES = {
+    "keepalives": 1,
+    "keepalives_idle": 10,
+    "keepalives_interval": 5,
+    "keepalives_count": 3,
+    "connect_timeout": 5,
+}
+
+
+def is_leader(bot):
+    """Whether this process currently runs the singleton background tasks."""
+    return getattr(bot, "is_leader", False)
+
+
+class LeaderElection:
+    def __init__(
+        self, on_elected, on_deposed, lock_id=LEADER_LOCK, interval=ELECTION_INTERVAL
+    ):
+        self.on_elected = on_elected
+        self.on_deposed = on_deposed
+        self.lock_id = lock_id
+        self.interval = interval
+        self.is_leader = False
+        self._conn = None
+
+    async def _connect(self):
+        return await psycopg.AsyncConnection.connect(
+            **connect_kwargs(), **_KEEPALIVES, autocommit=True
+        )
+
+    async def campaign(self):
+        """One round: become leader if the lock is free, or check we still hold it."""
+        if self._conn is None or self._conn.closed:
+            # A lock held on a connection that's gone is gone too
+            await self._step_down()
+            self._conn = await self._connect()
+
+        if self.is_leader:
+            # The lock lives exactly as long as this session does
+            await self._conn.execute("SELECT 1")
+            return
+
+        cur = await self._conn.execute(
+            "SELECT pg_try_advisory_lock(%s)", (self.lock_id,)
+        )
+        if (await cur.fetchone())[0]:
+            self.is_leader = True
+            await self.on_elected()
+
+    async def run(self):
+        while True:
+            try:
+                await self.campaign()
+            except (psycopg.Error, OSError) as e:
+                logging.warning(f"Leader election connection failed: {e}")
+                await self._step_down()
+            await asyncio.sleep(self.interval)
+
+    async def _step_down(self):
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+        if self.is_leader:
+            self.is_leader = False
+            await self.on_deposed()
+
+    async def stop(self):
+        """Hand the lock over straight away, rather than when the connection drops."""
+        if self.is_leader and self._conn is not None and not self._conn.closed:
+            try:
+                await self._conn.execute(
+                    "SELECT pg_advisory_unlock(%s)", (self.lock_id,)
+                )
+            except psycopg.Error as e:
+                logging.warning(f"Could not release leader lock: {e}")
+        await self._step_down()
@@ -0,0 +1,169 @@
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+
+from collections import deque
+
+"""
+Opt-in event loop watchdog.
+
+A heartbeat coroutine ticks on the loop, and a plain thread watches that heartbeat.
+When the loop stops ticking for longer than the threshold, the thread grabs the loop
+thread's stack so we can see *which* cog callback was hogging it.
+"""
+
+COGS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "cogs")
+
+
+def watchdog_enabled():
+    return str(os.environ.get("LOOP_WATCHDOG", "")).lower() in ("true", "1", "t")
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile, returns 0.0 for no samples."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def attribute_stack(stack, cogs_dir=COGS_DIR):
+    """
+    Work out which cog/listener owns a stack (list of FrameSummary, outermost first).
+
+    Returns something like `booru_uploads.on_message`, or the innermost frame if
+    no cog code is on the stack.
+    """
+    cogs_dir = os.path.normpath(cogs_dir)
+    for frame in stack:
+        if os.path.normpath(os.path.dirname(frame.filename)) == cogs_dir:
+            module = os.path.splitext(os.path.basename(frame.filename))[0]
+            return f"{module}.{frame.name}"
+
+    if stack:
+        frame = stack[-1]
+        return f"{os.path.basename(frame.filename)}:{frame.lineno} ({frame.name})"
+    return "unknown"
+
+
+class ReportLimiter:
+    """Allow at most one report per key every `interval` seconds."""
+
+    def __init__(self, interval, clock=time.monotonic):
+        self.interval = interval
+        self.clock = clock
+        self._last = {}
+
+    def ready(self, key):
+        """Whether `key` may report now, without using up its turn."""
+        last = self._last.get(key)
+        return last is None or self.clock() - last >= self.interval
+
+    def allow(self, key):
+        if not self.ready(key):
+            return False
+        self._last[key] = self.clock()
+        return True
+
+
+class BlockReport:
+    __slots__ = ("owner", "duration", "stack", "started_at")
+
+    def __init__(self, owner, duration, stack, started_at):
+        self.owner = owner
+        self.duration = duration
+        self.stack = stack
+        self.started_at = started_at
+
+    def format_stack(self):
+        return "".join(traceback.format_list(self.stack))
+
+
+class LoopWatchdog:
+    def __init__(self, threshold=0.25, interval=0.05, sample_size=2048):
+        self.threshold = threshold
+        self.interval = interval
+
+        self.lag_samples = deque(maxlen=sample_size)  # Seconds late per heartbeat
+        self.reports = deque(maxlen=100)  # Finished BlockReports, drained by the cog
+
+        self._beat = time.monotonic()
+        self._loop_thread_id = None
+        self._task = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        """Must be called from inside the running loop."""
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._thread = threading.Thread(
+            target=self._monitor, name="loop-watchdog", daemon=True
+        )
+        self._thread.start()
+        logging.info(f"Loop watchdog started (threshold {self.threshold * 1000:.0f}ms)")
+
+    def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+            self._thread = None
+
+    def stats(self):
+        samples = list(self.lag_samples)
+        return {
+            "samples": len(samples),
+            "p50_ms": percentile(samples, 50) * 1000,
+            "p99_ms": percentile(samples, 99) * 1000,
+            "max_ms": (max(samples) if samples else 0.0) * 1000,
+        }
+
+    def drain(self):
+        reports = []
+        while self.reports:
+            reports.append(self.reports.popleft())
+        return reports
+
+    async def _heartbeat(self):
+        while True:
+            before = time.monotonic()
+            self._beat = before
+            await asyncio.sleep(self.interval)
+            self.lag_samples.append(max(0.0, time.monotonic() - before - self.interval))
+
+    def _monitor(self):
+        current = None  # BlockReport for the stall we're in the middle of
+
+        while not self._stop.wait(self.interval / 2):
+            beat = self._beat
+            stalled = time.monotonic() - beat - self.interval
+
+            if stalled < self.threshold:
+                if current is not None:
+                    self.reports.append(current)
+                    current = None
+                continue
+
+            if current is not None and current.started_at == beat:
+                current.duration = stalled
+                continue
+            if current is not None:
+                self.reports.append(current)
+                current = None
+
+            # New stall, grab the loop thread's stack while it's still stuck
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            stack = traceback.extract_stack(frame)
+            current = BlockReport(attribute_stack(stack), stalled, stack, beat)
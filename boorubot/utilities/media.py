@@ -0,0 +1,397 @@
+import os
+import time
+import zlib
+import asyncio
+import hashlib
+import logging
+import threading
+import multiprocessing
+
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+"""
+CPU bound work on uploaded media, in a process pool so it never blocks the event loop
+(or holds the GIL from the job worker threads).
+
+`inspect_media` sniffs the real format, hashes the file and, with Pillow, makes a small
+thumbnail for the duplicate check. `prepare_upload` strips EXIF/text metadata from
+JPEGs and PNGs, all but the orientation, and, with Pillow, re-encodes images over the
+booru's size limit. `strip_stream` does the stripping for a file on its way through a
+streamed upload. Pillow is optional. Without it there are no thumbnails, and oversized
+files go up as they are. Videos are only sniffed and hashed.
+
+`MediaPool` keeps at most `max_pending` jobs queued or running. Past that it raises
+`MediaQueueFull`, and callers skip the preprocessing rather than wait for it.
+"""
+
+MEDIA_WORKERS = int(os.getenv("MEDIA_WORKERS", 2))
+MEDIA_QUEUE = int(os.getenv("MEDIA_QUEUE", 16))
+MAX_UPLOAD_BYTES = int(os.getenv("BOORU_MAX_UPLOAD_BYTES", 50 * 1024 * 1024))
+
+THUMBNAIL_SIZE = 256
+STRIP_HEAD_LIMIT = 1024 * 1024  # Metadata past this isn't worth buffering for
+
+SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+    (b"\x1a\x45\xdf\xa3", "webm"),
+)
+
+# JPEG segments to keep: JFIF, ICC profiles and Adobe's colour transform
+_JPEG_KEEP = {0xE0, 0xE2, 0xEE}
+_PNG_TEXT_CHUNKS = {b"tEXt", b"zTXt", b"iTXt", b"eXIf", b"tIME"}
+_EXIF_HEADER = b"Exif\x00\x00"
+_ORIENTATION = 0x0112
+
+
+class MediaQueueFull(Exception):
+    """More media jobs are pending than the pool takes."""
+
+
+def sniff(head):
+    """The format of a file from its first bytes, or None if it isn't media we take."""
+    for signature, fmt in SIGNATURES:
+        if head.startswith(signature):
+            return fmt
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    if head[4:8] == b"ftyp":
+        return "mp4"
+    return None
+
+
+def exif_orientation(tiff):
+    """The Orientation tag from EXIF data (the TIFF part), or None if it isn't set."""
+    order = {b"II": "little", b"MM": "big"}.get(tiff[:2])
+    if order is None or len(tiff) < 10:
+        return None
+    ifd = int.from_bytes(tiff[4:8], order)
+    count = int.from_bytes(tiff[ifd : ifd + 2], order)
+    for pos in range(ifd + 2, min(ifd + 2 + count * 12, len(tiff) - 11), 12):
+        if int.from_bytes(tiff[pos : pos + 2], order) == _ORIENTATION:
+            orientation = int.from_bytes(tiff[pos + 8 : pos + 10], order)
+            return orientation if 1 <= orientation <= 8 else None
+    return None
+
+
+def orientation_exif(orientation):
+    """EXIF data (the TIFF part) with nothing in it but the Orientation tag."""
+    return (
+        b"MM\x00\x2a\x00\x00\x00\x08\x00\x01"
+        + _ORIENTATION.to_bytes(2, "big")
+        + b"\x00\x03\x00\x00\x00\x01"
+        + orientation.to_bytes(2, "big")
+        + b"\x00\x00\x00\x00\x00\x00"
+    )
+
+
+def _kept_orientation(tiff):
+    orientation = exif_orientation(tiff)
+    # 1 is upright, the same as having no tag
+    return orientation_exif(orientation) if orientation not in (None, 1) else None
+
+
+def strip_jpeg(data):
+    """
+    Drop APPn/COM segments other than JFIF, ICC and Adobe. EXIF is cut down to its
+    Orientation tag, which viewers need to show phone photos the right way up. Pixel
+    data is untouched.
+    """
+    if not data.startswith(b"\xff\xd8"):
+        return data
+    out, pos = [b"\xff\xd8"], 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            return data  # Not where a marker should be, leave the file alone
+        marker = data[pos + 1]
+        if marker == 0xDA:  # Start of scan, the rest is image data
+            out.append(data[pos:])
+            return b"".join(out)
+        length = int.from_bytes(data[pos + 2 : pos + 4], "big")
+        segment = data[pos : pos + 2 + length]
+        if not (0xE0 <= marker <= 0xEF or marker == 0xFE) or marker in _JPEG_KEEP:
+            out.append(segment)
+        elif marker == 0xE1 and segment[4:10] == _EXIF_HEADER:
+            exif = _kept_orientation(segment[10:])
+            if exif is not None:
+                exif = _EXIF_HEADER + exif
+                out.append(b"\xff\xe1" + (len(exif) + 2).to_bytes(2, "big") + exif)
+        pos += 2 + length
+    return data
+
+
+def strip_png(data):
+    """Drop text, EXIF and timestamp chunks, but keep the EXIF Orientation tag."""
+    if not data.startswith(SIGNATURES[0][0]):
+        return data
+    out, pos = [data[:8]], 8
+    while pos + 8 <= len(data):
+        length = int.from_bytes(data[pos : pos + 4], "big")
+        kind = data[pos + 4 : pos + 8]
+        chunk = data[pos : pos + 12 + length]
+        if kind not in _PNG_TEXT_CHUNKS:
+            out.append(chunk)
+        elif kind == b"eXIf":
+            exif = _kept_orientation(chunk[8:-4])
+            if exif is not None:
+                crc = zlib.crc32(kind + exif).to_bytes(4, "big")
+                out.append(len(exif).to_bytes(4, "big") + kind + exif + crc)
+        pos += 12 + length
+        if kind == b"IEND":
+            break
+    return b"".join(out)
+
+
+def strip_metadata(data):
+    fmt = sniff(data[:16])
+    if fmt == "jpeg":
+        return strip_jpeg(data)
+    if fmt == "png":
+        return strip_png(data)
+    return data
+
+
+def metadata_end(data):
+    """
+    Where the image data starts in the head of a JPEG or PNG: the start of scan marker,
+    or the first IDAT chunk. 0 for anything else, None if `data` doesn't reach it yet.
+    """
+    if len(data) < 16:
+        return None  # Not enough to sniff
+    fmt = sniff(data[:16])
+    if fmt == "jpeg":
+        pos = 2
+        while pos + 4 <= len(data):
+            if data[pos] != 0xFF:
+                return 0  # Not a layout strip_jpeg touches
+            if data[pos + 1] == 0xDA:
+                return pos
+            pos += 2 + int.from_bytes(data[pos + 2 : pos + 4], "big")
+        return None
+    if fmt == "png":
+        pos = 8
+        while pos + 8 <= len(data):
+            if data[pos + 4 : pos + 8] == b"IDAT":
+                return pos
+            pos += 12 + int.from_bytes(data[pos : pos + 4], "big")
+        return None
+    return 0
+
+
+def _strip_head(head, end):
+    fmt = sniff(head[:16])
+    if fmt == "jpeg":
+        return strip_jpeg(head)  # Stops at the start of scan by itself
+    if fmt == "png":
+        return strip_png(head[:end]) + head[end:]
+    return head
+
+
+def strip_stream(chunks, limit=STRIP_HEAD_LIMIT):
+    """
+    `strip_jpeg`/`strip_png` for a file arriving in chunks. Only the head, up to the
+    image data, is buffered. If that's over `limit` the file passes through as is, as
+    do PNG text chunks after the first IDAT.
+    """
+    chunks = iter(chunks)
+    head = b""
+    for chunk in chunks:
+        head += chunk
+        end = metadata_end(head)
+        if end is not None:
+            yield _strip_head(head, end) if end else head
+            break
+        if len(head) >= limit:
+            yield head
+            break
+    else:
+        if head:
+            yield strip_metadata(head)  # The whole file fit in the head
+        return
+    yield from chunks
+
+
+def _pillow():
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    return Image
+
+
+def inspect_media(path):
+    """Format, size, hashes and (with Pillow) dimensions and a thumbnail file."""
+    with open(path, "rb") as f:
+        data = f.read()
+
+    info = {
+        "path": path,
+        "format": sniff(data[:16]),
+        "bytes": len(data),
+        "md5": hashlib.md5(data).hexdigest(),
+        "sha256": hashlib.sha256(data).hexdigest(),
+        "width": None,
+        "height": None,
+        "thumbnail": None,
+    }
+
+    Image = _pillow()
+    if Image is None or info["format"] not in ("png", "jpeg", "gif", "webp"):
+        return info
+
+    with Image.open(path) as image:
+        info["width"], info["height"] = image.size
+        thumb = image.convert("RGB")
+        thumb.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        info["thumbnail"] = f"{path}.thumb.jpg"
+        thumb.save(info["thumbnail"], "JPEG", quality=85)
+    return info
+
+
+def prepare_upload(path, max_bytes=MAX_UPLOAD_BYTES):
+    """
+    Strip metadata in place and, if the file is still over `max_bytes`, re-encode it.
+    Returns {"path", "format", "stripped", "transcoded"}; `path` is a new file when
+    it was transcoded, and the caller removes it along with the original.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    fmt = sniff(data[:16])
+    result = {"path": path, "format": fmt, "stripped": False, "transcoded": False}
+
+    stripped = strip_metadata(data)
+    if len(stripped) != len(data):
+        with open(path, "wb") as f:
+            f.write(stripped)
+        result["stripped"] = True
+
+    Image = _pillow()
+    if len(stripped) <= max_bytes or Image is None or fmt not in ("png", "jpeg"):
+        return result
+
+    try:
+        out, kind = _reencode(Image, path)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        # Too big for WebP, too many pixels for Pillow and the like. The booru can
+        # turn the original down itself, retrying won't change anything here.
+        logging.warning(f"Could not re-encode {len(stripped)} byte {fmt}: {e}")
+        return result
+    logging.info(
+        f"Re-encoded {len(stripped)} byte {fmt} as {kind}, "
+        f"{os.path.getsize(out)} bytes"
+    )
+    result.update(path=out, format=kind.lower(), transcoded=True)
+    return result
+
+
+def _reencode(Image, path):
+    from PIL import ImageOps
+
+    with Image.open(path) as image:
+        # The re-encoded file has no EXIF, so the orientation goes into the pixels
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ("RGBA", "LA", "P"):
+            out, kind = f"{path}.webp", "WEBP"
+            image.save(out, kind, quality=90)
+        else:
+            out, kind = f"{path}.jpg", "JPEG"
+            image.convert("RGB").save(out, kind, quality=90, optimize=True)
+    return out, kind
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+class MediaPool:
+    def __init__(self, workers=MEDIA_WORKERS, max_pending=MEDIA_QUEUE, executor=None):
+        self.max_pending = max_pending
+        self._executor = executor
+        self._workers = workers
+        self._pending = 0
+        self._lock = threading.Lock()
+        # func name -> [jobs, seconds, slowest]
+        self.timings = defaultdict(lambda: [0, 0.0, 0.0])
+
+    def _pool(self):
+        if self._executor is None:
+            # Not forked: the bot process has an event loop and threads going
+            self._executor = ProcessPoolExecutor(
+                self._workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def start(self):
+        """Spawn the workers now rather than on the first upload. Returns a future per
+        worker, done once it's up."""
+        pool = self._pool()
+        return [pool.submit(sniff, b"") for _ in range(self._workers)]
+
+    def submit(self, func, *args):
+        """Returns a concurrent future for `func(*args)`, run in a worker process."""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise MediaQueueFull(f"{self._pending} media jobs pending")
+            self._pending += 1
+        try:
+            future = self._pool().submit(_timed, func, *args)
+        except BaseException:
+            self._done(None)
+            raise
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        with self._lock:
+            self._pending -= 1
+
+    def _result(self, func, timed):
+        result, elapsed = timed
+        with self._lock:
+            timing = self.timings[func.__name__]
+            timing[0] += 1
+            timing[1] += elapsed
+            timing[2] = max(timing[2], elapsed)
+        logging.debug(f"{func.__name__} took {elapsed * 1000:.0f}ms")
+        return result
+
+    async def run(self, func, *args):
+        return self._result(func, await asyncio.wrap_future(self.submit(func, *args)))
+
+    def run_sync(self, func, *args):
+        """`run` for a thread that can block, like a job handler."""
+        return self._result(func, self.submit(func, *args).result())
+
+    def stats(self):
+        with self._lock:
+            return {
+                name: {
+                    "jobs": jobs,
+                    "avg_ms": total / jobs * 1000,
+                    "max_ms": slow * 1000,
+                }
+                for name, (jobs, total, slow) in self.timings.items()
+            }
+
+    def shutdown(self):
+        """Stop the workers. The next job starts a fresh pool."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+_shared = None
+
+
+def media_pool():
+    """The process wide media pool."""
+    global _shared
+    if _shared is None:
+        _shared = MediaPool()
+        logging.debug("Created media pool")
+    return _shared
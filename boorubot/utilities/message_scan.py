@@ -0,0 +1,76 @@
+import os
+import re
+
+from typing import Optional
+
+"""
+What a message is, worked out once.
+
+The dispatcher cog (cogs/message_dispatch.py) runs `scan` on every message and only
+passes on the ones something acts on, as `on_image_message(message, scan)` and
+`on_bot_reply(message)`. Most messages are plain chat. For those `scan` reads a few
+attributes and returns None, without any I/O or regex matching.
+"""
+
+ATTACHMENT = "attachment"
+LINK = "link"
+
+# A message that is nothing but a link to an image
+IMAGE_URL_PATTERN = re.compile(
+    r"^(https?://\S+?\.(?:png|jpg|jpeg|webp|gif|mp4|webm))(?:\?.*)?$", re.IGNORECASE
+)
+
+
+class MessageScan:
+    __slots__ = ("image", "url", "filename", "reply_to_bot")
+
+    def __init__(self, image=None, url=None, filename=None, reply_to_bot=False):
+        self.image = image  # ATTACHMENT, LINK or None
+        self.url = url
+        self.filename = filename
+        self.reply_to_bot = reply_to_bot
+
+    def __repr__(self):
+        return (
+            f"<MessageScan image={self.image} url={self.url!r} "
+            f"reply_to_bot={self.reply_to_bot}>"
+        )
+
+
+def image_url(content) -> Optional[str]:
+    """The URL if `content` is only a link to an image."""
+    content = content.strip()
+    if not content.startswith("http"):
+        return None
+    return content if IMAGE_URL_PATTERN.match(content) else None
+
+
+def replies_to(message, user_id) -> bool:
+    reference = message.reference
+    if reference is None:
+        return False
+    # Deleted messages resolve to something without an author
+    author = getattr(reference.resolved, "author", None)
+    return author is not None and author.id == user_id
+
+
+def scan(message, bot_user_id) -> Optional[MessageScan]:
+    """None for messages nothing acts on, which is most of them."""
+    if message.author.bot:
+        return None
+
+    reply_to_bot = replies_to(message, bot_user_id)
+
+    attachments = message.attachments
+    if attachments and (attachments[0].content_type or "").startswith("image/"):
+        attachment = attachments[0]
+        return MessageScan(
+            ATTACHMENT, attachment.url, attachment.filename, reply_to_bot
+        )
+
+    url = image_url(message.content) if message.content else None
+    if url:
+        filename = os.path.basename(url.split("?", 1)[0])
+        return MessageScan(LINK, url, filename, reply_to_bot)
+
+    return MessageScan(reply_to_bot=True) if reply_to_bot else None
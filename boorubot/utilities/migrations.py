@@ -1,78 +1,126 @@
-import psycopg
-import logging
 import os
-from datetime import datetime
+import re
+import time
+import asyncio
+import logging
 
-from .database import getCur
+import psycopg
+
+from .database import connect_kwargs
 
 """
 We could use a library but we can also manually track/handle basic migrations here,
 no reason we couldn't migrate (lol) in the future
+
+Migrations are SQL files in `boorubot/migrations/`, named `<version>_<name>.sql` and
+applied in version order. `migration_log` records each by name (without the version, so
+the ones that predate the files are still recognised). `run_migrations` reads the log in
+one query and applies everything pending in a single transaction, holding an advisory
+lock so replicas starting together take turns, and the second one finds nothing to do.
+Statements that can't run in a transaction (CREATE INDEX CONCURRENTLY) don't belong here.
 """
 
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "migrations")
 
-# For the first boot
-def init_migration_log():
-    cur, conn = getCur()
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS migration_log (
-            id SERIAL PRIMARY KEY,
-            migration_name TEXT NOT NULL,
-            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-    """
-    )
-    conn.commit()
-    cur.close()
-    conn.close()
-
-
-# Applies a migration
-def apply_migration(migration_name, migration_func):
-    cur, conn = getCur()
-
-    # Check if the migration has already been applied
-    cur.execute(
-        """
-        SELECT 1 FROM migration_log WHERE migration_name = %s;
-    """,
-        (migration_name,),
-    )
-
-    if cur.fetchone():
-        logging.info(f"Migration {migration_name} already applied.")
-    else:
-        # Run the migration function
-        logging.info(f"Applying migration {migration_name}...")
-        migration_func(cur)
-
-        # Log the migration as applied
-        cur.execute(
-            """
-            INSERT INTO migration_log (migration_name) VALUES (%s);
-        """,
-            (migration_name,),
-        )
-        conn.commit()
+# pg_advisory_xact_lock key, any constant every replica agrees on
+MIGRATION_LOCK = 0x626F6F7275
 
-    cur.close()
-    conn.close()
+_FILENAME = re.compile(r"^(\d+)_(\w+)\.sql$")
 
 
-def create_key_value_table(cur):
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS key_value_store (
-            key TEXT PRIMARY KEY,
-            value TEXT
-        );
-    """
-    )
+class Migration:
+    __slots__ = ("version", "name", "path")
 
+    def __init__(self, version, name, path):
+        self.version = version
+        self.name = name
+        self.path = path
+
+    def __repr__(self):
+        return f"<Migration {self.version:04d} {self.name}>"
+
+    def sql(self):
+        with open(self.path, "r") as file:
+            return file.read()
+
+
+def load_migrations(directory=MIGRATIONS_DIR):
+    """Every migration file in `directory`, in version order."""
+    migrations = []
+    for filename in os.listdir(directory):
+        match = _FILENAME.match(filename)
+        if match:
+            migrations.append(
+                Migration(
+                    int(match.group(1)),
+                    match.group(2),
+                    os.path.join(directory, filename),
+                )
+            )
+    migrations.sort(key=lambda migration: migration.version)
+
+    versions = [migration.version for migration in migrations]
+    if len(set(versions)) != len(versions):
+        raise ValueError(f"Duplicate migration versions in {directory}")
+    return migrations
 
-def init_migrations():
-    init_migration_log()
 
-    # Apply migrations
-    apply_migration("create_key_value_table", create_key_value_table)
+def pending_migrations(migrations, applied):
+    return [migration for migration in migrations if migration.name not in applied]
+
+
+async def run_migrations(directory=MIGRATIONS_DIR):
+    """Apply any pending migrations. Returns [(name, seconds)] for the ones applied."""
+    migrations = load_migrations(directory)
+    start = time.perf_counter()
+    timings = []
+
+    async with await psycopg.AsyncConnection.connect(**connect_kwargs()) as conn:
+        async with conn.transaction():
+            # Released at commit or rollback, whichever replica got here first has
+            # finished (or failed) by the time the next one reads the log.
+            await conn.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK,))
+            await conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS migration_log (
+                    id SERIAL PRIMARY KEY,
+                    migration_name TEXT NOT NULL,
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+                """
+            )
+            cur = await conn.execute("SELECT migration_name FROM migration_log")
+            applied = {row[0] for row in await cur.fetchall()}
+
+            pending = pending_migrations(migrations, applied)
+            for migration in pending:
+                logging.info(f"Applying migration {migration.name}...")
+                applied_start = time.perf_counter()
+                await conn.execute(migration.sql())
+                timings.append((migration.name, time.perf_counter() - applied_start))
+
+            if pending:
+                async with conn.cursor() as cur:
+                    await cur.executemany(
+                        "INSERT INTO migration_log (migration_name) VALUES (%s)",
+                        [(migration.name,) for migration in pending],
+                    )
+
+    elapsed = (time.perf_counter() - start) * 1000
+    if timings:
+        applied_list = ", ".join(
+            f"{name} {seconds * 1000:.0f}ms" for name, seconds in timings
+        )
+        logging.info(
+            f"Applied {len(timings)} migrations in {elapsed:.0f}ms ({applied_list})"
+        )
+    else:
+        logging.info(
+            f"Migrations up to date ({len(migrations)} checked in {elapsed:.0f}ms)"
+        )
+    return timings
+
+
+def init_migrations():
+    """Blocking `run_migrations`, for callers without an event loop."""
+    return asyncio.run(run_migrations())
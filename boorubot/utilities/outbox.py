@@ -0,0 +1,178 @@
+import os
+import time
+import asyncio
+import logging
+
+from collections import deque
+
+"""
+Batched outbound messages.
+
+The background tasks that announce things one at a time (new comments, the modqueue,
+favorites) queue them here instead of awaiting `channel.send` for each. Every channel
+gets a `ChannelOutbox` that waits `window` seconds after the first message is queued,
+packs as many queued messages as fit into one Discord message (except ones sent with
+a key, which are looked up and edited later and so go alone), and keeps to at most
+`rate` sends per `per` seconds, Discord's per channel bucket, so a burst goes out as a
+few messages spread over the bucket instead of a string of 429s.
+
+`send` returns a future for the `discord.Message` the content ended up in. Callers
+that don't care can drop it, send failures are logged here either way.
+"""
+
+MAX_MESSAGE_LENGTH = 2000
+SEPARATOR = "\n\n"
+
+SEND_WINDOW = float(os.getenv("OUTBOX_WINDOW", 1.0))
+SEND_RATE = 5
+SEND_PER = 5.0
+
+
+class Pending:
+    """A queued message. `content` can still be changed until it goes out."""
+
+    __slots__ = ("content", "key", "future")
+
+    def __init__(self, content, key, future):
+        self.content = content
+        self.key = key
+        self.future = future
+
+
+def _retrieve(future):
+    # Failures are logged when they happen, don't warn again for callers that never
+    # awaited the future
+    if not future.cancelled():
+        future.exception()
+
+
+def pack(pending, limit=MAX_MESSAGE_LENGTH, separator=SEPARATOR):
+    """
+    How many of `pending`, from the front, fit in one message. At least one. Messages
+    sent with a key go out on their own, whoever edits them later has to find them.
+    """
+    length, count = 0, 0
+    for entry in pending:
+        if entry.key is not None:
+            return count or 1
+        added = len(entry.content) + (len(separator) if count else 0)
+        if count and length + added > limit:
+            break
+        length += added
+        count += 1
+    return count
+
+
+def truncate(content, limit=MAX_MESSAGE_LENGTH):
+    if len(content) <= limit:
+        return content
+    return content[: limit - 1] + "…"
+
+
+class ChannelOutbox:
+    def __init__(self, channel, window=SEND_WINDOW, rate=SEND_RATE, per=SEND_PER):
+        self.channel = channel
+        self.window = window
+        self.per = per
+        self.queue = []
+        self._sent = deque(maxlen=rate)  # When the last `rate` messages went out
+        self._task = None
+
+    def send(self, content, key=None):
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_retrieve)
+        self.queue.append(Pending(content, key, future))
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._drain())
+        return future
+
+    def pending(self, key):
+        """The queued message sent with `key`, if it hasn't gone out yet."""
+        for entry in self.queue:
+            if entry.key == key and not entry.future.done():
+                return entry
+        return None
+
+    async def _wait_for_bucket(self):
+        if len(self._sent) == self._sent.maxlen:
+            wait = self._sent[0] + self.per - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+    async def _drain(self):
+        await asyncio.sleep(self.window)
+        while self.queue:
+            await self._wait_for_bucket()
+
+            # Callers may have given up on some of these while they waited
+            self.queue = [entry for entry in self.queue if not entry.future.done()]
+            if not self.queue:
+                break
+            count = pack(self.queue)
+            batch, self.queue = self.queue[:count], self.queue[count:]
+            content = truncate(SEPARATOR.join(entry.content for entry in batch))
+
+            try:
+                message = await self.channel.send(content)
+            except Exception as e:
+                logging.warning(
+                    f"Could not send {len(batch)} queued message(s) to "
+                    f"{self.channel.id}: {e}"
+                )
+                for entry in batch:
+                    if not entry.future.done():
+                        entry.future.set_exception(e)
+            else:
+                for entry in batch:
+                    if not entry.future.done():
+                        entry.future.set_result(message)
+            self._sent.append(time.monotonic())
+
+    async def flush(self):
+        if self._task is not None and not self._task.done():
+            await self._task
+
+
+class Outbox:
+    """One `ChannelOutbox` per channel id."""
+
+    def __init__(self, window=SEND_WINDOW, rate=SEND_RATE, per=SEND_PER):
+        self.window = window
+        self.rate = rate
+        self.per = per
+        self._channels = {}
+
+    def _outbox(self, channel):
+        outbox = self._channels.get(channel.id)
+        if outbox is None:
+            outbox = ChannelOutbox(channel, self.window, self.rate, self.per)
+            self._channels[channel.id] = outbox
+        outbox.channel = channel
+        return outbox
+
+    def send(self, channel, content, key=None):
+        """Queue `content` for `channel`, returns a future for the sent message."""
+        return self._outbox(channel).send(content, key)
+
+    def pending(self, channel, key):
+        outbox = self._channels.get(channel.id)
+        return outbox.pending(key) if outbox else None
+
+    async def flush(self):
+        """Wait for everything queued so far to go out."""
+        await asyncio.gather(
+            *(outbox.flush() for outbox in self._channels.values()),
+            return_exceptions=True,
+        )
+
+
+_shared = None
+
+
+def shared_outbox():
+    """The process wide outbox."""
+    global _shared
+    if _shared is None:
+        _shared = Outbox()
+        logging.debug("Created shared outbox")
+    return _shared
@@ -0,0 +1,220 @@
+import random
+import bisect
+import logging
+
+from array import array
+from datetime import datetime
+
+from .danbooru_db import RATING_NAMES
+from .tag_table import PostRecord, TagTable
+
+"""
+In-memory index of post ids by tag and rating, for answering /random locally.
+
+Every tag (and rating) maps to a sorted `array('I')` of post ids, so a search is a
+handful of sorted-set intersections and differences instead of a random-order tag
+search on the booru. The index is fed (updated_at, id) ordered rows from the Danbooru
+DB, see `danbooru_db.fetch_changed_posts`. Each sync starts a little behind its cursor
+(`danbooru_db.rewind`), and a row folded in a second time changes nothing.
+
+Only plain tags, `-tag` and `rating:` are understood; `search` returns None for
+anything else (wildcards, `~`, `order:`, other metatags) so the caller can fall back
+to asking the booru.
+"""
+
+EPOCH = datetime(1970, 1, 1)
+
+# Below this many changes to one tag in a batch we insert/remove in place, above it we
+# rebuild the tag's array in one go
+_INPLACE_LIMIT = 64
+
+_RATING_CODES = {name: code for code, name in RATING_NAMES.items()}
+
+
+def _rating_code(value):
+    value = value.lower()
+    if value in RATING_NAMES:
+        return value
+    return _RATING_CODES.get(value)
+
+
+def intersect(a, b):
+    """Sorted intersection of two sorted id arrays."""
+    if len(a) > len(b):
+        a, b = b, a
+    if not a:
+        return array("I")
+
+    if len(a) * 16 < len(b):
+        # Much smaller side, binary search each id in the big one
+        hits = array("I")
+        lo = 0
+        for post_id in a:
+            lo = bisect.bisect_left(b, post_id, lo)
+            if lo == len(b):
+                break
+            if b[lo] == post_id:
+                hits.append(post_id)
+        return hits
+
+    wanted = set(b)
+    return array("I", [post_id for post_id in a if post_id in wanted])
+
+
+def difference(a, b):
+    """Ids in sorted array `a` that aren't in sorted array `b`."""
+    if not a or not b:
+        return array("I", a)
+
+    if len(b) > len(a):
+        out = array("I")
+        for post_id in a:
+            i = bisect.bisect_left(b, post_id)
+            if i == len(b) or b[i] != post_id:
+                out.append(post_id)
+        return out
+
+    unwanted = set(b)
+    return array("I", [post_id for post_id in a if post_id not in unwanted])
+
+
+def _apply_changes(ids, added, removed):
+    if len(added) + len(removed) < _INPLACE_LIMIT:
+        for post_id in removed:
+            i = bisect.bisect_left(ids, post_id)
+            if i < len(ids) and ids[i] == post_id:
+                del ids[i]
+        for post_id in added:
+            i = bisect.bisect_left(ids, post_id)
+            if i == len(ids) or ids[i] != post_id:
+                ids.insert(i, post_id)
+        return ids
+
+    merged = set(ids)
+    merged.difference_update(removed)
+    merged.update(added)
+    return array("I", sorted(merged))
+
+
+class PostIndex:
+    def __init__(self):
+        self.cursor = (EPOCH, 0)
+        self.ready = False  # Set once the first full sync is done
+
+        self.tags = TagTable()
+        self._all = array("I")
+        self._by_tag = {}  # tag id -> post ids
+        self._by_rating = {}
+        self._posts = {}  # post id -> PostRecord, to undo it on the next change
+
+    def __len__(self):
+        return len(self._all)
+
+    def apply(self, rows):
+        """
+        Fold in (id, tag_string, rating, is_deleted, updated_at) rows, in cursor order.
+        """
+        if not rows:
+            return
+
+        self._fold(rows)
+        last = rows[-1]
+        self.cursor = (last[4], last[0])
+        logging.debug(f"Post index applied {len(rows)} rows, {len(self)} posts")
+
+    def remove(self, post_id):
+        """Drop a post we found out is gone before the next sync did."""
+        if post_id in self._posts:
+            self._fold([(post_id, "", None, True, None)])
+
+    def _fold(self, rows):
+        added, removed = {}, {}
+
+        def change(key, post_id, into, other):
+            into.setdefault(key, set()).add(post_id)
+            if key in other:
+                other[key].discard(post_id)
+
+        for post_id, tag_string, rating, is_deleted, updated_at in rows:
+            old = self._posts.pop(post_id, None)
+            if old is not None:
+                for tag_id in old.tags:
+                    change(("tag", tag_id), post_id, removed, added)
+                change(("rating", old.rating), post_id, removed, added)
+                change(("all", None), post_id, removed, added)
+
+            if not is_deleted:
+                record = PostRecord.from_tag_string(
+                    self.tags, post_id, rating, tag_string
+                )
+                self._posts[post_id] = record
+                for tag_id in record.tags:
+                    change(("tag", tag_id), post_id, added, removed)
+                change(("rating", rating), post_id, added, removed)
+                change(("all", None), post_id, added, removed)
+
+        for key in added.keys() | removed.keys():
+            kind, name = key
+            if kind == "all":
+                self._all = _apply_changes(
+                    self._all, added.get(key, ()), removed.get(key, ())
+                )
+                continue
+
+            table = self._by_tag if kind == "tag" else self._by_rating
+            ids = _apply_changes(
+                table.get(name, array("I")), added.get(key, ()), removed.get(key, ())
+            )
+            if ids:
+                table[name] = ids
+            else:
+                table.pop(name, None)
+
+    def search(self, tags, exclude=()):
+        """
+        Sorted ids matching the space separated `tags` and none of `exclude`, or None
+        if the query uses syntax the index doesn't understand. The result may be one of
+        the index's own arrays, so don't modify it.
+        """
+        include, omit = [], []
+
+        for token in tags.lower().split() + [f"-{tag}" for tag in exclude]:
+            negate = token.startswith("-")
+            term = token[1:] if negate else token
+
+            if term.startswith("rating:"):
+                code = _rating_code(term[7:])
+                if code is None:
+                    return None
+                ids = self._by_rating.get(code, array("I"))
+            elif ":" in term or "*" in term or term.startswith("~") or not term:
+                return None
+            else:
+                ids = self._by_tag.get(self.tags.lookup(term), array("I"))
+
+            (omit if negate else include).append(ids)
+
+        # Smallest first, so every step shrinks the working set as fast as possible
+        include.sort(key=len)
+        result = include[0] if include else self._all
+        for ids in include[1:]:
+            if not result:
+                break
+            result = intersect(result, ids)
+        for ids in omit:
+            if not result:
+                break
+            result = difference(result, ids)
+
+        return result
+
+    def random_post_id(self, tags, exclude=(), rng=random):
+        """
+        A random matching id, 0 if nothing matches, or None if the index can't answer.
+        """
+        ids = self.search(tags, exclude)
+        if ids is None:
+            return None
+        if not ids:
+            return 0
+        return rng.choice(ids)
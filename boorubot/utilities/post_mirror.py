@@ -0,0 +1,222 @@
+import os
+import time
+import logging
+
+from datetime import datetime
+
+from .danbooru_db import fetch_changed_post_metadata, fetch_post_metadata, rewind
+from .database import getCur, retrieve_key, store_key
+
+"""
+Local mirror of the booru's post metadata, in our own database.
+
+`sync` pulls every post changed since the newest one we have (less a short overlap, see
+`danbooru_db.rewind`) straight from the Danbooru DB, so sweeps and the modqueue check
+can search posts without a round trip to the API. The mirror is only as fresh as its
+last sync; `find_posts` returns None once that is older than the staleness budget, and
+callers go back to the API. Posts the bot changes are marked stale by `forget` and left
+out of searches until a sync has read them again.
+"""
+
+SYNC_BATCH = 5000
+STALENESS_BUDGET = int(os.environ.get("POST_MIRROR_STALENESS", 300))
+
+_COLUMNS = (
+    "id",
+    "tag_string",
+    "tag_string_artist",
+    "source",
+    "rating",
+    "is_pending",
+    "is_deleted",
+    "uploader_id",
+)
+
+
+def _cursor():
+    cur, conn = getCur()
+    cur.execute(
+        "SELECT updated_at, id FROM post_mirror ORDER BY updated_at DESC, id DESC LIMIT 1"
+    )
+    row = cur.fetchone()
+    cur.close()
+    conn.close()
+    return row or (datetime(1970, 1, 1), 0)
+
+
+def _now():
+    cur, conn = getCur()
+    cur.execute("SELECT clock_timestamp()")
+    now = cur.fetchone()[0]
+    cur.close()
+    conn.close()
+    return now
+
+
+def _store(rows, started):
+    """Upsert mirror rows. A post forgotten after `started` stays stale, the row we
+    read may be from before that change."""
+    cur, conn = getCur()
+    cur.executemany(
+        """
+        INSERT INTO post_mirror (id, tag_string, tag_string_artist, source,
+            rating, is_pending, is_deleted, uploader_id, updated_at, tags)
+        VALUES (%s, COALESCE(%s, ''), %s, COALESCE(%s, ''), %s, %s, %s, %s, %s,
+            string_to_array(COALESCE(%s, ''), ' '))
+        ON CONFLICT (id) DO UPDATE SET
+            tag_string = EXCLUDED.tag_string,
+            tags = EXCLUDED.tags,
+            tag_string_artist = EXCLUDED.tag_string_artist,
+            source = EXCLUDED.source,
+            rating = EXCLUDED.rating,
+            is_pending = EXCLUDED.is_pending,
+            is_deleted = EXCLUDED.is_deleted,
+            uploader_id = EXCLUDED.uploader_id,
+            updated_at = EXCLUDED.updated_at,
+            synced_at = CURRENT_TIMESTAMP,
+            stale_at = CASE WHEN post_mirror.stale_at > %s
+                THEN post_mirror.stale_at END
+        """,
+        [(*row, row[1], started) for row in rows],
+    )
+    conn.commit()
+    cur.close()
+    conn.close()
+
+
+def _stale_ids():
+    cur, conn = getCur()
+    cur.execute("SELECT id FROM post_mirror WHERE stale_at IS NOT NULL")
+    ids = [row[0] for row in cur.fetchall()]
+    cur.close()
+    conn.close()
+    return ids
+
+
+def _drop(post_ids):
+    cur, conn = getCur()
+    cur.execute("DELETE FROM post_mirror WHERE id = ANY(%s)", (list(post_ids),))
+    conn.commit()
+    cur.close()
+    conn.close()
+
+
+def sync(batch=SYNC_BATCH):
+    """Bring the mirror up to date. Blocking, returns how many posts changed."""
+    started = _now()
+    after = rewind(_cursor())
+    synced = 0
+
+    while True:
+        rows = fetch_changed_post_metadata(after, batch)
+        if rows:
+            _store(rows, started)
+            synced += len(rows)
+            after = (rows[-1][-1], rows[-1][0])
+
+        if len(rows) < batch:
+            break
+
+    # Posts we changed may have been read before the change but be behind the cursor
+    # now, so those are read again by id
+    stale = _stale_ids()
+    for i in range(0, len(stale), batch):
+        ids = stale[i : i + batch]
+        rows = fetch_post_metadata(ids)
+        _store(rows, started)
+        _drop(set(ids) - {row[0] for row in rows})  # Gone from the booru entirely
+        synced += len(rows)
+
+    store_key("post_mirror_synced_at", str(time.time()))
+    if synced:
+        logging.info(f"Post mirror synced {synced} posts")
+    return synced
+
+
+def is_fresh(budget=None):
+    """Whether the last completed sync is within the staleness budget."""
+    budget = STALENESS_BUDGET if budget is None else budget
+    synced_at = float(retrieve_key("post_mirror_synced_at") or 0)
+    return time.time() - synced_at <= budget
+
+
+def forget(post_id):
+    """
+    Mark a post we just changed as stale, so nothing reads its old tags before the
+    next sync reads it again. The row stays, the sync cursor may already be past the
+    new version.
+    """
+    cur, conn = getCur()
+    cur.execute(
+        "UPDATE post_mirror SET stale_at = clock_timestamp() WHERE id = %s", (post_id,)
+    )
+    conn.commit()
+    cur.close()
+    conn.close()
+
+
+def parse_query(query):
+    """
+    Split a tag search into (tags, excluded tags, pending only), or None if it uses
+    syntax the mirror can't answer.
+    """
+    all_tags, none_tags, pending = [], [], False
+    for token in query.split():
+        negate = token.startswith("-")
+        term = token[1:] if negate else token
+        if term == "status:deleted" and negate:
+            continue  # Deleted posts are never returned anyway
+        if term == "status:pending" and not negate:
+            pending = True
+        elif ":" in term or "*" in term or term.startswith("~") or not term:
+            return None
+        else:
+            (none_tags if negate else all_tags).append(term)
+    return all_tags, none_tags, pending
+
+
+def find_posts(
+    query="", any_tags=(), pending=None, limit=100, random=False, budget=None
+):
+    """
+    Posts (as dicts with the API's field names) matching a simple tag `query` and with
+    at least one of `any_tags`, newest first or in random order. Returns None if the
+    mirror is too stale to answer, or the query has syntax it doesn't understand.
+    """
+    parsed = parse_query(query)
+    if parsed is None or not is_fresh(budget):
+        return None
+
+    all_tags, none_tags, pending_only = parsed
+    if pending_only:
+        pending = True
+
+    conditions, params = ["NOT is_deleted", "stale_at IS NULL"], []
+    if all_tags:
+        conditions.append("tags @> %s")
+        params.append(all_tags)
+    if none_tags:
+        conditions.append("NOT tags && %s")
+        params.append(none_tags)
+    if any_tags:
+        conditions.append("tags && %s")
+        params.append(list(any_tags))
+    if pending is not None:
+        conditions.append("is_pending = %s")
+        params.append(pending)
+
+    cur, conn = getCur()
+    cur.execute(
+        f"""
+        SELECT {", ".join(_COLUMNS)} FROM post_mirror
+        WHERE {" AND ".join(conditions)}
+        ORDER BY {"random()" if random else "id DESC"}
+        LIMIT %s
+        """,
+        (*params, limit),
+    )
+    rows = cur.fetchall()
+    cur.close()
+    conn.close()
+
+    return [dict(zip(_COLUMNS, row)) for row in rows]
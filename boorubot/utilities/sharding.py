@@ -0,0 +1,76 @@
+import time
+
+from collections import Counter
+
+from .config import config
+
+"""
+Sharded mode.
+
+With BOORU_SHARDED set the bot is an `AutoShardedBot`. By default one process runs
+every shard. BOORU_SHARD_IDS (with BOORU_SHARD_COUNT) splits them across processes,
+and each process only sees the guilds on its own shards.
+
+The comment feed, the modqueue, the sweeps and so on aren't tied to any guild, so they
+only run in a process holding the home shard, and only in the one of those that won the
+leader election (utilities/leader.py). The home shard is the shard of HOME_GUILD_ID (the
+guild with the maintenance channel), or shard 0 if that isn't set.
+Job follow-ups go back to a process that owns the shard the job came from, see
+`jobs.claim_finished`.
+"""
+
+
+def shard_for_guild(guild_id, shard_count):
+    """The shard Discord delivers `guild_id`'s events on. DMs arrive on shard 0."""
+    if not guild_id or not shard_count:
+        return 0
+    return (guild_id >> 22) % shard_count
+
+
+def shard_of(message):
+    """The shard a message (or anything else with a `.guild`) came in on."""
+    return message.guild.shard_id if message.guild else 0
+
+
+def home_shard(shard_count):
+    return shard_for_guild(config().home_guild_id, shard_count)
+
+
+def owned_shards(bot):
+    """The shard ids this process runs, or None if it runs all of them."""
+    return getattr(bot, "shard_ids", None)
+
+
+def runs_singletons(bot):
+    """Whether guild agnostic background tasks belong in this process."""
+    shard_ids = owned_shards(bot)
+    return shard_ids is None or home_shard(bot.shard_count) in shard_ids
+
+
+def shard_latencies(bot):
+    """[(shard_id, seconds)] for every shard in this process."""
+    latencies = getattr(bot, "latencies", None)
+    if latencies is None:
+        return [(bot.shard_id or 0, bot.latency)]
+    return sorted(latencies)
+
+
+class ShardMetrics:
+    """Per shard event counts, turned into rates each time `rates` is called."""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.counts = Counter()
+        self.since = clock()
+
+    def count(self, shard_id):
+        self.counts[shard_id] += 1
+
+    def rates(self):
+        """{shard_id: events per second} since the last call."""
+        now = self.clock()
+        elapsed = max(now - self.since, 1e-9)
+        rates = {shard_id: count / elapsed for shard_id, count in self.counts.items()}
+        self.counts.clear()
+        self.since = now
+        return rates
@@ -1,4 +1,22 @@
 import os
+import re
+import fnmatch
+import logging
+
+from collections import OrderedDict
+
+from .config import config
+from .danbooru_db import RATING_NAMES
+
+"""
+Content warnings for posted links.
+
+A `CwPolicy` is compiled once from a set of tags, wildcard rules like `*_gore` and an
+optional rating threshold. `config/spoilers.yaml` can give each destination channel its
+own policy on top of the default one, and `reload_policies` re-reads it without a
+restart. Results are cached per post id, so a post announced to several channels is
+only split and matched once per policy.
+"""
 
 SPOILER_TAGS = {
     t.strip().lower()
@@ -9,14 +27,165 @@ SPOILER_TAGS = {
     if t.strip()
 }
 
+RATING_ORDER = "gsqe"
+
+CACHE_SIZE = 1024
+
+
+class CwPolicy:
+    """One compiled set of CW rules."""
+
+    def __init__(self, tags=(), patterns=(), rating=None):
+        self.tags = frozenset(t.lower() for t in tags)
+        self.patterns = tuple(p.lower() for p in patterns)
+        self.rating = rating[0].lower() if rating else None
+
+        self._pattern_re = None
+        if self.patterns:
+            self._pattern_re = re.compile(
+                "|".join(fnmatch.translate(p) for p in self.patterns)
+            )
+
+    def evaluate(self, tags, rating=None):
+        """
+        Sorted CW labels for a post, given its tags as an iterable of lowercase names.
+        """
+        hits = set(self.tags.intersection(tags))
+        if self._pattern_re is not None:
+            hits.update(tag for tag in tags if self._pattern_re.match(tag))
+
+        if self.rating and rating and rating in RATING_ORDER:
+            if RATING_ORDER.index(rating) >= RATING_ORDER.index(self.rating):
+                hits.add(RATING_NAMES[rating])
+
+        return sorted(hits)
+
+
+def _mapping(config, where):
+    config = config or {}
+    if not isinstance(config, dict):
+        raise ValueError(f"{where} should be a mapping, not {type(config).__name__}")
+    return config
+
+
+def _policy_from_config(config, base=None, where="policy"):
+    """Fields missing from `config` are inherited from `base`."""
+    config = _mapping(config, where)
+    return CwPolicy(
+        tags=config.get("tags", base.tags if base else ()),
+        patterns=config.get("patterns", base.patterns if base else ()),
+        rating=config.get("rating", base.rating if base else None),
+    )
+
+
+class CwPolicies:
+    """The default policy, per channel overrides and the per post result cache."""
+
+    def __init__(self, default=None, channels=None, cache_size=CACHE_SIZE):
+        self.default = default or CwPolicy(SPOILER_TAGS)
+        self.channels = channels or {}
+        self.cache_size = cache_size
+        self._cache = (
+            OrderedDict()
+        )  # post id -> (tag_string, rating, tags, {policy: hits})
+
+    @classmethod
+    def from_config(cls, config):
+        config = _mapping(config, "spoilers.yaml")
+        default = _policy_from_config(
+            config.get("default"), base=CwPolicy(SPOILER_TAGS), where="default"
+        )
+        channels = {
+            int(channel_id): _policy_from_config(
+                channel_config, base=default, where=f"channel {channel_id}"
+            )
+            for channel_id, channel_config in _mapping(
+                config.get("channels"), "channels"
+            ).items()
+        }
+        return cls(default, channels)
+
+    def policy_for(self, channel_id=None):
+        return self.channels.get(channel_id, self.default)
+
+    def cw_for(self, tag_string, rating=None, channel_id=None, post_id=None):
+        policy = self.policy_for(channel_id)
+        if post_id is None:
+            return policy.evaluate({t.lower() for t in tag_string.split()}, rating)
+
+        cached = self._cache.get(post_id)
+        if cached is None or cached[0] != tag_string or cached[1] != rating:
+            tags = frozenset(t.lower() for t in tag_string.split())
+            cached = (tag_string, rating, tags, {})
+            self._cache[post_id] = cached
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        self._cache.move_to_end(post_id)
+
+        results = cached[3]
+        if policy not in results:
+            results[policy] = policy.evaluate(cached[2], rating)
+        return results[policy]
+
+
+def load_policies(path=None, strict=False):
+    """
+    Policies from spoilers.yaml, or just the SPOILER_TAGS default. A broken file falls
+    back to the default too, unless `strict`, when the error is raised.
+    """
+    import yaml
+
+    path = path or config().spoilers_path
+    if path and os.path.exists(path):
+        try:
+            with open(path, "r") as file:
+                policies = CwPolicies.from_config(yaml.safe_load(file))
+            logging.info(
+                f"Loaded CW policies from {path} "
+                f"({len(policies.channels)} channel overrides)"
+            )
+            return policies
+        except (OSError, yaml.YAMLError, ValueError, TypeError) as e:
+            if strict:
+                raise
+            logging.error(f"Could not load CW policies from {path}: {e}")
+
+    return CwPolicies()
+
+
+_policies = None
+
+
+def policies():
+    global _policies
+    if _policies is None:
+        _policies = load_policies()
+    return _policies
+
+
+def reload_policies(path=None):
+    """
+    Re-read spoilers.yaml. Returns the new policies. Raises (and keeps the old
+    policies) if the file can't be loaded.
+    """
+    return use_policies(load_policies(path, strict=True))
+
+
+def use_policies(new):
+    """Swap in already loaded policies, see `reload_policies`."""
+    global _policies
+    _policies = new
+    return _policies
+
 
-def spoiler_tags_for(tag_string):
-    tags = {t.lower() for t in tag_string.split()}
-    return sorted(tag for tag in tags if tag in SPOILER_TAGS)
+def spoiler_tags_for(tag_string, rating=None, channel_id=None, post_id=None):
+    return policies().cw_for(tag_string, rating, channel_id, post_id)
 
 
-def format_link_with_cw(post_url, tag_string):
-    hit = spoiler_tags_for(tag_string)
+def format_link_with_cw(
+    post_url, tag_string, rating=None, channel_id=None, post_id=None
+):
+    hit = spoiler_tags_for(tag_string, rating, channel_id, post_id)
     if hit:
         return f"## CW: {', '.join(hit)}\n|| {post_url} ||"
     return post_url
@@ -0,0 +1,82 @@
+import json
+import time
+import asyncio
+import hashlib
+
+from contextlib import contextmanager
+
+from .database import retrieve_key, store_key
+
+"""
+Startup bookkeeping for `BooruBot`.
+
+`StartupTimer` records how long each startup phase took (some run side by side, so the
+phases can add up to more than the total) and sums it up once the bot is ready.
+`command_signature` hashes the app commands we'd send to Discord, and `sync_tree` keeps the
+hash of the last sync in the KV store, so restarts only sync when a command changed.
+Global syncs are slow and heavily rate limited; a guild sync (for debugging against a test
+server) shows up right away.
+"""
+
+
+class StartupTimer:
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.started = clock()
+        self.phases = []  # (name, seconds), in the order they finished
+
+    @contextmanager
+    def phase(self, name):
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.phases.append((name, self.clock() - start))
+
+    async def timed(self, name, awaitable):
+        """Await `awaitable` as a phase, for phases that run under `asyncio.gather`."""
+        with self.phase(name):
+            return await awaitable
+
+    def elapsed(self):
+        return self.clock() - self.started
+
+    def report(self):
+        phases = ", ".join(
+            f"{name} {seconds * 1000:.0f}ms" for name, seconds in self.phases
+        )
+        return f"Ready {self.elapsed():.2f}s after start ({phases})"
+
+
+def command_signature(tree, guild=None):
+    """A hash of the command payloads `tree.sync(guild=guild)` would upload."""
+    payload = sorted(
+        (command.to_dict(tree) for command in tree.get_commands(guild=guild)),
+        key=lambda command: (command.get("type", 1), command["name"]),
+    )
+    return hashlib.sha256(
+        json.dumps(payload, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+def _signature_key(tree, guild=None):
+    key = f"app_commands_signature:{tree.client.application_id}"
+    return f"{key}:{guild.id}" if guild is not None else key
+
+
+async def sync_tree(tree, guild=None, force=False):
+    """
+    Sync `tree`, globally or to one `guild`, unless the KV store says these exact
+    commands were synced there already. Returns whether it synced.
+    """
+    if guild is not None:
+        tree.copy_global_to(guild=guild)
+
+    signature = command_signature(tree, guild)
+    key = _signature_key(tree, guild)
+    if not force and await asyncio.to_thread(retrieve_key, key) == signature:
+        return False
+
+    await tree.sync(guild=guild)
+    await asyncio.to_thread(store_key, key, signature)
+    return True
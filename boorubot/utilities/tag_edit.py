@@ -0,0 +1,257 @@
+import logging
+import threading
+
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+"""
+Tag edits as a single request.
+
+`TagEdit` collects tag adds and removes, a new source and a new rating for one post,
+and `send` applies them with one `PUT /posts/{id}.json`. The tag string goes up as a
+partial edit: `post[old_tag_string]` is empty, so Danbooru merges it into whatever
+tags the post has now instead of replacing them. Removals are `-tag` tokens.
+`apply_edits` sends edits for many posts at once, for sweeps.
+
+Edits that depend on what the post looks like (clearing `tagme` once there are enough
+tags, the maintenance fixes) go through `edit_post`. It holds the post's lock, so edits
+to one post from this process's workers go one at a time, while different posts still
+go in parallel. The edit is computed from a version of the post, sent with that
+version's tags as `post[old_tag_string]`, and Danbooru merges it with anything written
+since. The decisions are then made again on the merged post. If they changed and
+aren't in the post yet, somebody else got in between, and they're sent again. Tag
+strings aren't compared as such, since Danbooru's aliases and implications rewrite
+them. Danbooru has no conditional update on `updated_at`, so the check has to be after
+the write.
+"""
+
+BULK_CONCURRENCY = 8
+EDIT_ATTEMPTS = 3
+
+
+class VersionConflict(Exception):
+    """The post kept changing under us for `EDIT_ATTEMPTS` writes in a row."""
+
+
+class KeyedLock:
+    """A lock per key, dropped once nobody holds or waits for it."""
+
+    def __init__(self):
+        self._locks = {}  # key -> [lock, holders and waiters]
+        self._guard = threading.Lock()
+
+    @contextmanager
+    def hold(self, key):
+        with self._guard:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._guard:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[key]
+
+    def __len__(self):
+        return len(self._locks)
+
+
+post_locks = KeyedLock()
+
+
+class TagEdit:
+    def __init__(self, post_id):
+        self.post_id = post_id
+        self.added = []
+        self.removed = []
+        self.source = None
+        self.rating = None
+
+    def add(self, *tags):
+        """Tags can be given one by one or as space separated strings."""
+        for tag in (t for group in tags for t in group.split()):
+            if tag in self.removed:
+                self.removed.remove(tag)
+            if tag not in self.added:
+                self.added.append(tag)
+        return self
+
+    def remove(self, *tags):
+        for tag in (t for group in tags for t in group.split()):
+            if tag in self.added:
+                self.added.remove(tag)
+            if tag not in self.removed:
+                self.removed.append(tag)
+        return self
+
+    def set_source(self, source):
+        self.source = source
+        return self
+
+    def set_rating(self, rating):
+        self.rating = rating
+        return self
+
+    def merge(self, other):
+        """Fold a later edit to the same post into this one."""
+        self.add(*other.added)
+        self.remove(*other.removed)
+        if other.source is not None:
+            self.source = other.source
+        if other.rating is not None:
+            self.rating = other.rating
+        return self
+
+    def __bool__(self):
+        return bool(
+            self.added or self.removed or self.source is not None or self.rating
+        )
+
+    def __repr__(self):
+        return f"<TagEdit {self.post_id} {self.tag_string()!r}>"
+
+    def tag_string(self):
+        return " ".join(self.added + [f"-{tag}" for tag in self.removed])
+
+    def apply(self, tags):
+        """What `tags` becomes after this edit."""
+        tags = [tag for tag in tags if tag not in self.removed]
+        return tags + [tag for tag in self.added if tag not in tags]
+
+    def params(self, base=None):
+        """With `base`, the post as we last saw it, the whole new tag string."""
+        params = {}
+        if self.added or self.removed:
+            if base is None:
+                params["post[old_tag_string]"] = ""
+                params["post[tag_string]"] = self.tag_string()
+            else:
+                tags = base["tag_string"].split()
+                params["post[old_tag_string]"] = " ".join(tags)
+                params["post[tag_string]"] = " ".join(self.apply(tags))
+        if self.source is not None:
+            params["post[source]"] = self.source
+        if self.rating:
+            params["post[rating]"] = self.rating
+        return params
+
+    def send(self, api_url, api_key, api_user, base=None, timeout=30):
+        """Apply the edit. Returns the updated post, raises on HTTP errors."""
+        resp = requests.put(
+            f"{api_url}/posts/{self.post_id}.json",
+            data=self.params(base),
+            auth=_auth(api_key, api_user),
+            timeout=timeout,
+        )
+        resp.raise_for_status()
+        return resp.json()
+
+
+def _auth(api_key, api_user):
+    return (api_user, api_key) if api_user and api_key else None
+
+
+def fetch_post(post_id, api_url, api_key, api_user, timeout=30):
+    resp = requests.get(
+        f"{api_url}/posts/{post_id}.json",
+        auth=_auth(api_key, api_user),
+        timeout=timeout,
+    )
+    resp.raise_for_status()
+    return resp.json()
+
+
+def edit_post(
+    edit, api_url, api_key, api_user, adjust=None, base=None, attempts=EDIT_ATTEMPTS
+):
+    """
+    Apply `edit` under the post's lock, returns the updated post.
+
+    `adjust(edit, post)` adds the changes that depend on the post's current state to
+    `edit`. `base` is the post as the caller last saw it, fetched if not given.
+    """
+    with post_locks.hold(edit.post_id):
+        if adjust is None and base is None:
+            # Nothing to decide, so no need to read the post first
+            return edit.send(api_url, api_key, api_user)
+
+        post = base
+        sent = None  # What adjust decided for the last edit we sent
+        for attempt in range(attempts + 1):
+            if post is None:
+                post = fetch_post(edit.post_id, api_url, api_key, api_user)
+
+            final = TagEdit(edit.post_id).merge(edit)
+            if adjust is not None:
+                adjust(final, post)
+            decided = _decisions(final, edit)
+            if sent is not None and (decided == sent or not _undone(final, edit, post)):
+                return post  # Our last write already holds, merged with theirs
+            if attempt == attempts:
+                break
+            if sent is not None:
+                logging.info(
+                    f"Post {edit.post_id} changed since version "
+                    f"{post.get('updated_at')}, checking the edit again"
+                )
+
+            post = final.send(api_url, api_key, api_user, base=post)
+            if adjust is None:
+                return post  # Plain adds and removes compose with theirs as is
+            sent = decided
+
+        raise VersionConflict(f"Post {edit.post_id} kept changing while we edited it")
+
+
+def _decisions(final, edit):
+    """What `adjust` put in `final` on top of the caller's `edit`."""
+    return (
+        frozenset(final.added) - frozenset(edit.added),
+        frozenset(final.removed) - frozenset(edit.removed),
+        final.source,
+        final.rating,
+    )
+
+
+def _undone(final, edit, post):
+    """
+    Whether any of adjust's decisions still has to be written. The caller's own adds
+    and removes aren't checked, Danbooru applies them (as rewritten by its aliases and
+    implications) to the merged post.
+    """
+    added, removed, _, _ = _decisions(final, edit)
+    tags = set(post["tag_string"].split())
+    return bool(added - tags or removed & tags) or _changes_fields(final, post)
+
+
+def _changes_fields(edit, post):
+    return (edit.source is not None and edit.source != post.get("source")) or (
+        edit.rating is not None and edit.rating != post.get("rating")
+    )
+
+
+def apply_edits(edits, send, concurrency=BULK_CONCURRENCY):
+    """
+    Send many edits concurrently. `send(edit)` sends one, e.g. `edit.send` wrapped in
+    the booru's rate limit. Returns {post_id: updated post or the exception}.
+    """
+    merged = {}
+    for edit in edits:
+        if edit.post_id in merged:
+            merged[edit.post_id].merge(edit)
+        elif edit:
+            merged[edit.post_id] = edit
+
+    def one(edit):
+        try:
+            return send(edit)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = pool.map(one, merged.values())
+        return dict(zip(merged, results))
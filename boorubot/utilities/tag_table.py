@@ -0,0 +1,113 @@
+import sys
+import bisect
+
+from array import array
+
+from .danbooru_db import RATING_NAMES
+
+"""
+Interned tags for in-memory post caches.
+
+A `TagTable` hands out a small int per tag name, and a `PostRecord` keeps its tags as a
+sorted `array('I')` of those ids, a few bytes per tag instead of a slice of a big
+`tag_string`. Membership is a binary search and a compiled `TagFilter` only ever compares
+ints, so nothing re-splits tag strings per check.
+"""
+
+_RATING_CODES = {name: code for code, name in RATING_NAMES.items()}
+
+
+class TagTable:
+    def __init__(self):
+        self._ids = {}
+        self._names = []
+
+    def __len__(self):
+        return len(self._names)
+
+    def intern(self, name):
+        """The id for `name`, adding it if it's new."""
+        tag_id = self._ids.get(name)
+        if tag_id is None:
+            tag_id = len(self._names)
+            name = sys.intern(name)
+            self._ids[name] = tag_id
+            self._names.append(name)
+        return tag_id
+
+    def lookup(self, name):
+        """The id for `name`, or None if we've never seen it."""
+        return self._ids.get(name)
+
+    def name(self, tag_id):
+        return self._names[tag_id]
+
+    def encode(self, tag_string):
+        """A space separated tag string as a sorted array of unique tag ids."""
+        return array("I", sorted({self.intern(tag) for tag in tag_string.split()}))
+
+    def decode(self, tags):
+        return " ".join(sorted(self._names[tag_id] for tag_id in tags))
+
+
+def has_tag(tags, tag_id):
+    i = bisect.bisect_left(tags, tag_id)
+    return i < len(tags) and tags[i] == tag_id
+
+
+class PostRecord:
+    __slots__ = ("id", "rating", "tags")
+
+    def __init__(self, post_id, rating, tags):
+        self.id = post_id
+        self.rating = rating
+        self.tags = tags  # Sorted array('I') of TagTable ids
+
+    def __repr__(self):
+        return f"<PostRecord {self.id} rating {self.rating}, {len(self.tags)} tags>"
+
+    @classmethod
+    def from_tag_string(cls, table, post_id, rating, tag_string):
+        return cls(post_id, rating, table.encode(tag_string))
+
+    def has(self, tag_id):
+        return has_tag(self.tags, tag_id)
+
+    def tag_string(self, table):
+        return table.decode(self.tags)
+
+
+class TagFilter:
+    """A filter query (see `danbooru_db.post_matches_filter`) compiled against a table."""
+
+    __slots__ = ("required", "excluded", "ratings", "excluded_ratings")
+
+    def __init__(self, table, filter_query):
+        self.required, self.excluded = [], []
+        self.ratings, self.excluded_ratings = set(), set()
+
+        for token in filter_query.split():
+            negate = token.startswith("-")
+            term = token[1:] if negate else token
+
+            if term.startswith("rating:"):
+                value = term[7:]
+                code = value if value in RATING_NAMES else _RATING_CODES.get(value)
+                (self.excluded_ratings if negate else self.ratings).add(code or value)
+            else:
+                # Interning unknown tags keeps the filter right once posts use them
+                (self.excluded if negate else self.required).append(table.intern(term))
+
+    def matches(self, record):
+        if self.ratings and record.rating not in self.ratings:
+            return False
+        if record.rating in self.excluded_ratings:
+            return False
+        tags = record.tags
+        for tag_id in self.excluded:
+            if has_tag(tags, tag_id):
+                return False
+        for tag_id in self.required:
+            if not has_tag(tags, tag_id):
+                return False
+        return True
@@ -0,0 +1,270 @@
+import time
+import asyncio
+import logging
+import threading
+
+import aiohttp
+import requests
+
+"""
+Client side limits on the services the bot calls.
+
+Each service has a token bucket (requests per second, with some burst) and a circuit
+breaker. Calls wait for a token, so a burst of uploads queues up on our side instead of
+piling onto the booru. After `failure_threshold` failed calls in a row the breaker
+opens, and calls fail straight away with `ServiceUnavailable` for `reset_timeout`
+seconds. After that a single trial call goes through, and its outcome closes the
+breaker or opens it again.
+
+Optional work (SauceNAO lookups) passes `optional=True`. It never waits for a token and
+is skipped (`ServiceUnavailable`) while the service is rate limited or failing.
+
+The bot's event loop and the job worker threads share these, so the state is locked.
+Every process has its own limits.
+"""
+
+BOORU_READ = "booru_read"
+BOORU_WRITE = "booru_write"
+SAUCENAO = "saucenao"
+DISCORD_CDN = "discord_cdn"
+
+# name -> (requests per second, burst)
+DEFAULT_LIMITS = {
+    BOORU_READ: (20, 40),
+    BOORU_WRITE: (10, 10),  # Danbooru's own limit on updates
+    SAUCENAO: (4 / 30, 4),  # The free tier allows 4 searches per 30 seconds
+    DISCORD_CDN: (10, 20),
+}
+
+# Failing to reach the service at all
+NETWORK_ERRORS = (
+    ConnectionError,
+    TimeoutError,
+    requests.ConnectionError,
+    requests.Timeout,
+    aiohttp.ClientConnectionError,
+)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class ServiceUnavailable(Exception):
+    """The call wasn't made, the service's breaker is open or optional work was shed."""
+
+    def __init__(self, service, reason):
+        super().__init__(f"{service} unavailable: {reason}")
+        self.service = service
+        self.reason = reason
+
+
+def is_outage(error):
+    """
+    Whether an exception says the service is in trouble: it couldn't be reached, timed
+    out, or answered 5xx or 429. None if the exception isn't a response from the
+    service at all (a file over our size limit, a bug on our side), which says nothing
+    about its health either way. 404s and the like are False.
+    """
+    status = getattr(error, "status", None)  # aiohttp
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return status >= 500 or status == 429
+    if isinstance(error, NETWORK_ERRORS):
+        return True
+    return None
+
+
+class TokenBucket:
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.tokens = burst
+        self.updated = clock()
+        self.waited = 0.0  # Seconds callers have spent waiting, in total
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self):
+        """Take a token, which may not have refilled yet. Returns seconds to wait."""
+        with self._lock:
+            self._refill()
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            self.waited += wait
+            return wait
+
+    def try_acquire(self):
+        """Take a token if one is free right now."""
+        with self._lock:
+            self._refill()
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=5, reset_timeout=30, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0  # In a row
+        self.opened_at = None
+        self._trial_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return CLOSED
+        if self.clock() - self.opened_at < self.reset_timeout:
+            return OPEN
+        return HALF_OPEN
+
+    def retry_in(self):
+        if self.opened_at is None:
+            return 0.0
+        return max(self.opened_at + self.reset_timeout - self.clock(), 0.0)
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == CLOSED:
+                return True
+            if state == OPEN:
+                return False
+            # One trial at a time. A trial that never reported back (cancelled, say)
+            # gives up its turn after another timeout.
+            now = self.clock()
+            if self._trial_at is None or now - self._trial_at >= self.reset_timeout:
+                self._trial_at = now
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_at = None
+
+    def record_failure(self):
+        """Returns True if this failure opened the breaker."""
+        with self._lock:
+            self.failures += 1
+            trial = self._trial_at is not None
+            self._trial_at = None
+            if trial or self.failures >= self.failure_threshold:
+                opened = self.opened_at is None
+                self.opened_at = self.clock()
+                return opened
+            return False
+
+
+class Service:
+    def __init__(
+        self, name, rate, burst, failure_threshold=5, reset_timeout=30, clock=None
+    ):
+        clock = clock or time.monotonic
+        self.name = name
+        self.limiter = TokenBucket(rate, burst, clock)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout, clock)
+        self.calls = 0
+        self.failed = 0
+        self.shed = 0  # Calls not made, breaker open or optional work skipped
+
+    def _admit(self, optional):
+        """Seconds to wait before the call can go out. Raises if it shouldn't."""
+        if optional and self.breaker.state != CLOSED:
+            self.shed += 1
+            raise ServiceUnavailable(self.name, f"circuit {self.breaker.state}")
+        if not self.breaker.allow():
+            self.shed += 1
+            raise ServiceUnavailable(
+                self.name, f"circuit open, retrying in {self.breaker.retry_in():.0f}s"
+            )
+        if optional:
+            if not self.limiter.try_acquire():
+                self.shed += 1
+                raise ServiceUnavailable(self.name, "rate limited")
+            return 0.0
+        return self.limiter.reserve()
+
+    def _record(self, error=None):
+        self.calls += 1
+        outage = False if error is None else is_outage(error)
+        if outage is None:
+            return  # Our problem, not the service's
+        if not outage:
+            self.breaker.record_success()
+            return
+        self.failed += 1
+        if self.breaker.record_failure():
+            logging.warning(
+                f"{self.name} failing ({error!r}), pausing calls for "
+                f"{self.breaker.reset_timeout}s"
+            )
+
+    async def call(self, func, *args, optional=False, **kwargs):
+        """Await `func(*args, **kwargs)` within this service's limits."""
+        wait = self._admit(optional)
+        if wait:
+            await asyncio.sleep(wait)
+        try:
+            result = await func(*args, **kwargs)
+        except Exception as e:
+            self._record(e)
+            raise
+        self._record()
+        return result
+
+    async def call_in_thread(self, func, *args, optional=False, **kwargs):
+        """`call` for a blocking function, run on a worker thread."""
+        return await self.call(
+            asyncio.to_thread, func, *args, optional=optional, **kwargs
+        )
+
+    def call_sync(self, func, *args, **kwargs):
+        """`call` from a thread that can block, like a job handler."""
+        wait = self._admit(False)
+        if wait:
+            time.sleep(wait)
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            self._record(e)
+            raise
+        self._record()
+        return result
+
+    def status(self):
+        line = (
+            f"{self.name}: {self.breaker.state}, {self.calls} calls, "
+            f"{self.failed} failed, {self.shed} shed, "
+            f"{self.limiter.waited:.1f}s waited"
+        )
+        if self.breaker.state == OPEN:
+            line += f", retrying in {self.breaker.retry_in():.0f}s"
+        return line
+
+
+_services = {}
+_services_lock = threading.Lock()
+
+
+def service(name):
+    """The process wide limits for `name`, one of the names in DEFAULT_LIMITS."""
+    with _services_lock:
+        if name not in _services:
+            _services[name] = Service(name, *DEFAULT_LIMITS[name])
+        return _services[name]
+
+
+def status_lines():
+    return [service(name).status() for name in DEFAULT_LIMITS]
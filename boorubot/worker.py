@@ -0,0 +1,69 @@
+# Booru Bot job worker
+#
+# Runs the booru side of the job queue (uploads, tag edits, maintenance and deletion
+# sweeps) without a Discord connection, so the gateway process only has to ingest
+# events and post results. Run as many of these as you like, on as many hosts as
+# can reach the database; they coordinate through the jobs table.
+
+import os
+import sys
+import signal
+import logging
+import threading
+
+from .utilities.migrations import init_migrations
+from .utilities.job_handlers import HANDLERS, run_next
+
+POLL_SECONDS = 2
+
+
+def _work(stop, kinds):
+    while not stop.is_set():
+        try:
+            job = run_next(kinds)
+        except Exception:
+            logging.exception("Job worker error")
+            job = None
+
+        if job is None:
+            stop.wait(POLL_SECONDS)
+
+
+def run_worker():
+    debug = str(os.environ.get("DEBUG")).lower() in ("true", "1", "t")
+    logging.basicConfig(
+        stream=sys.stderr,
+        level=logging.DEBUG if debug else logging.INFO,
+        format="%(levelname)s:%(name)s: %(message)s",  # Include logger name in output
+    )
+
+    # Which job kinds this worker takes, defaults to all of them
+    kinds = [
+        kind.strip()
+        for kind in os.environ.get("BOORU_WORKER_KINDS", "").split(",")
+        if kind.strip()
+    ] or list(HANDLERS)
+    thread_count = int(os.environ.get("BOORU_WORKER_THREADS", 4))
+
+    logging.info(f"Using version {os.environ.get('GIT_COMMIT')}")
+    init_migrations()
+
+    stop = threading.Event()
+
+    def shutdown(signum, frame):
+        logging.info("Worker shutting down after current jobs...")
+        stop.set()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    threads = [
+        threading.Thread(target=_work, args=(stop, kinds), name=f"worker-{i}")
+        for i in range(thread_count)
+    ]
+    for thread in threads:
+        thread.start()
+    logging.info(f"Worker running {thread_count} threads for {', '.join(kinds)}")
+
+    for thread in threads:
+        thread.join()
@@ -0,0 +1,68 @@
+import asyncio
+
+from types import SimpleNamespace
+
+import pytest
+
+from cogs import booru_background
+from cogs.booru_background import BackgroundBooru
+
+
+class FakeOutbox:
+    """Fails to send anything mentioning one of `failing`."""
+
+    def __init__(self, failing=()):
+        self.failing = failing
+        self.sent = []
+
+    def send(self, channel, content):
+        async def send():
+            if any(f"\n{body}\n" in content for body in self.failing):
+                raise OSError("down")
+            self.sent.append(content)
+
+        return send()
+
+
+@pytest.fixture
+def comments(monkeypatch):
+    """Three new comments, newest first, past a cursor at 10. Records the cursor."""
+    stored = {}
+    new = [
+        {"id": 13, "post_id": 3, "creator_name": "c", "body": "third"},
+        {"id": 12, "post_id": 2, "creator_name": "b", "body": "second"},
+        {"id": 11, "post_id": 1, "creator_name": "a", "body": "first"},
+    ]
+
+    async def fetch_new_comments(last_comment_id):
+        return new
+
+    monkeypatch.setattr(booru_background, "retrieve_key", lambda key, default: 10)
+    monkeypatch.setattr(booru_background, "store_key", stored.__setitem__)
+    monkeypatch.setattr(booru_background.danbooru_db, "db_reads_enabled", lambda: True)
+    monkeypatch.setattr(
+        booru_background.danbooru_db, "fetch_new_comments", fetch_new_comments
+    )
+    return stored
+
+
+def check(monkeypatch, outbox):
+    monkeypatch.setattr(booru_background, "shared_outbox", lambda: outbox)
+    cog = BackgroundBooru(SimpleNamespace(get_channel=lambda channel_id: object()))
+    asyncio.run(cog.check_new_comments.coro(cog))
+
+
+class TestCheckNewComments:
+    def test_moves_past_every_posted_comment(self, comments, monkeypatch):
+        outbox = FakeOutbox()
+        check(monkeypatch, outbox)
+        assert len(outbox.sent) == 3
+        assert comments == {"last_comment_id": 13}
+
+    def test_stops_before_the_oldest_that_failed(self, comments, monkeypatch):
+        check(monkeypatch, FakeOutbox(failing=["second"]))
+        assert comments == {"last_comment_id": 11}
+
+    def test_stays_put_when_the_oldest_failed(self, comments, monkeypatch):
+        check(monkeypatch, FakeOutbox(failing=["first"]))
+        assert comments == {"last_comment_id": 10}
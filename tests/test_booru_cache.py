@@ -0,0 +1,131 @@
+import asyncio
+
+from utilities.booru_cache import BooruCache, cache_key, endpoint_pattern
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class RecordingCache(BooruCache):
+    """Answers from `responses` instead of the network, recording each request."""
+
+    def __init__(self, responses, **kwargs):
+        super().__init__("https://booru.example", clock=FakeClock(), **kwargs)
+        self.responses = responses
+        self.requests = []
+
+    async def _request(self, endpoint, params, headers):
+        self.requests.append((endpoint, params, headers))
+        await asyncio.sleep(0.01)
+        return self.responses[endpoint](headers)
+
+
+def _post(tags, etag='"v1"'):
+    def respond(headers):
+        if headers.get("If-None-Match") == etag:
+            return 304, None, {"ETag": etag}
+        return 200, {"id": 1, "tag_string": tags}, {"ETag": etag}
+
+    return respond
+
+
+class TestKeys:
+    def test_endpoint_pattern(self):
+        assert endpoint_pattern("posts/123") == "posts/{id}"
+        assert endpoint_pattern("tags") == "tags"
+
+    def test_param_order_does_not_matter(self):
+        assert cache_key("posts", {"a": 1, "b": 2}) == cache_key(
+            "posts", {"b": 2, "a": 1}
+        )
+
+
+class TestBooruCache:
+    def test_fresh_entry_is_served_from_cache(self):
+        cache = RecordingCache({"posts/1": _post("cat dog")})
+
+        async def run():
+            first = await cache.post_tags(1)
+            second = await cache.post_tags(1)
+            return first, second
+
+        assert asyncio.run(run()) == (["cat", "dog"], ["cat", "dog"])
+        assert len(cache.requests) == 1
+        assert cache.hits == 1
+
+    def test_stale_entry_is_revalidated(self):
+        cache = RecordingCache({"posts/1": _post("cat dog")})
+
+        async def run():
+            await cache.post(1)
+            cache.clock.now += cache.ttl_for("posts/1") + 1
+            return await cache.post_tags(1)
+
+        assert asyncio.run(run()) == ["cat", "dog"]
+        assert cache.requests[1][2] == {"If-None-Match": '"v1"'}
+        assert cache.revalidated == 1
+
+    def test_identical_requests_are_coalesced(self):
+        cache = RecordingCache({"users/7": lambda h: (200, {"name": "fops"}, {})})
+
+        async def run():
+            return await asyncio.gather(*(cache.username(7) for _ in range(10)))
+
+        assert asyncio.run(run()) == ["fops"] * 10
+        assert len(cache.requests) == 1
+        assert cache.coalesced == 9
+
+    def test_invalidate_post_forces_a_refetch(self):
+        cache = RecordingCache({"posts/1": _post("cat")})
+
+        async def run():
+            await cache.post(1)
+            cache.responses["posts/1"] = _post("cat dog", etag='"v2"')
+            cache.invalidate_post(1)
+            return await cache.post_tags(1)
+
+        assert asyncio.run(run()) == ["cat", "dog"]
+        assert cache.requests[1][2] == {}
+
+    def test_random_pool_is_shared_between_calls(self):
+        posts = [{"id": i} for i in range(3)]
+        cache = RecordingCache({"posts": lambda h: (200, list(posts), {})})
+
+        async def run():
+            return [await cache.random_post("cat", exclude=["gore"]) for _ in range(4)]
+
+        picked = asyncio.run(run())
+        assert sorted(p["id"] for p in picked[:3]) == [0, 1, 2]
+        assert len(cache.requests) == 2
+        assert cache.requests[0][1]["tags"] == "cat -gore"
+
+    def test_oldest_entries_are_evicted(self):
+        cache = RecordingCache(
+            {f"users/{i}": lambda h: (200, {"name": "x"}, {}) for i in range(3)},
+            max_entries=2,
+        )
+
+        async def run():
+            for i in range(3):
+                await cache.username(i)
+
+        asyncio.run(run())
+        assert cache.stats()["entries"] == 2
+        assert cache_key("users/0") not in cache._entries
+
+    def test_oldest_random_pools_are_evicted(self):
+        cache = RecordingCache(
+            {"posts": lambda h: (200, [{"id": 1}, {"id": 2}], {})}, max_entries=2
+        )
+
+        async def run():
+            for tags in ("cat", "dog", "cat", "fox"):
+                await cache.random_post(tags)
+
+        asyncio.run(run())
+        assert list(cache._random_pools) == ["cat", "fox"]
@@ -0,0 +1,125 @@
+import os
+import zlib
+import hashlib
+
+import pytest
+
+from utilities import booru_upload
+from utilities.booru_upload import (
+    HashingStream,
+    UploadFailed,
+    multipart,
+    scratch_file,
+    source_upload,
+    stream_upload,
+)
+
+
+def _chunk(kind, payload):
+    crc = zlib.crc32(kind + payload).to_bytes(4, "big")
+    return len(payload).to_bytes(4, "big") + kind + payload + crc
+
+
+class FakeResponse:
+    def __init__(self, body=b"", headers=None, json=None):
+        self.body = body
+        self.headers = headers or {}
+        self._json = json
+
+    def iter_content(self, size):
+        for i in range(0, len(self.body), size):
+            yield self.body[i : i + size]
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self._json
+
+
+class TestScratchFile:
+    def test_removed_with_what_was_made_next_to_it(self):
+        with pytest.raises(RuntimeError):
+            with scratch_file("image.png") as path:
+                assert path.endswith(".png") and os.path.exists(path)
+                open(f"{path}.thumb.jpg", "wb").close()
+                raise RuntimeError("upload failed")
+        assert not os.path.exists(path)
+        assert not os.path.exists(f"{path}.thumb.jpg")
+
+    def test_same_name_twice(self):
+        with scratch_file("image.png") as first, scratch_file("image.png") as second:
+            assert first != second
+
+
+class TestMultipart:
+    def test_body(self):
+        body = b"".join(
+            multipart("upload[files][0]", 'a"b.png', "image/png", [b"12", b"34"], "xx")
+        )
+        assert body == (
+            b"--xx\r\n"
+            b'Content-Disposition: form-data; name="upload[files][0]"; '
+            b'filename="ab.png"\r\n'
+            b"Content-Type: image/png\r\n\r\n"
+            b"1234\r\n--xx--\r\n"
+        )
+
+    def test_hashing_stream(self):
+        stream = HashingStream(iter([b"ab", b"cd"]))
+        assert b"".join(stream) == b"abcd"
+        assert stream.size == 4
+        assert stream.md5 == hashlib.md5(b"abcd").hexdigest()
+
+
+class TestStreamUpload:
+    def test_streams_the_stripped_file(self, monkeypatch):
+        sent = {}
+
+        def post(url, data, headers, auth, timeout):
+            sent["body"] = b"".join(data)  # Consumed as requests would
+            sent["type"] = headers["Content-Type"]
+            return FakeResponse(json={"id": 3, "upload_media_assets": [{"id": 9}]})
+
+        monkeypatch.setattr(booru_upload.requests, "post", post)
+        pixels = _chunk(b"IDAT", b"\x00" * 100_000)
+        image = b"\x89PNG\r\n\x1a\n" + _chunk(b"tEXt", b"Author\x00someone") + pixels
+        resp = FakeResponse(image, {"Content-Type": "image/png"})
+
+        upload_id, md5 = stream_upload(resp, "x.png", "http://booru", "key", "user")
+        assert upload_id == 9
+        assert b"someone" not in sent["body"]
+        assert md5 == hashlib.md5(b"\x89PNG\r\n\x1a\n" + pixels).hexdigest()
+        assert sent["type"].startswith("multipart/form-data; boundary=")
+
+    def test_source_upload_waits_for_processing(self, monkeypatch):
+        polls = []
+
+        def get(url, auth, timeout):
+            polls.append(url)
+            asset = {"id": 9, "media_asset": {"md5": "abc"}}
+            return FakeResponse(json={"id": 3, "upload_media_assets": [asset]})
+
+        monkeypatch.setattr(booru_upload.time, "sleep", lambda s: None)
+        monkeypatch.setattr(
+            booru_upload.requests,
+            "post",
+            lambda url, data, auth, timeout: FakeResponse(
+                json={"id": 3, "status": "pending", "upload_media_assets": []}
+            ),
+        )
+        monkeypatch.setattr(booru_upload.requests, "get", get)
+
+        assert source_upload("http://cdn/x.png", "http://booru", "k", "u") == (9, "abc")
+        assert polls == ["http://booru/uploads/3.json"]
+
+    def test_failed_upload(self, monkeypatch):
+        monkeypatch.setattr(
+            booru_upload.requests,
+            "post",
+            lambda url, data, auth, timeout: FakeResponse(
+                json={"id": 3, "status": "error", "error": "bad source"}
+            ),
+        )
+        with pytest.raises(UploadFailed):
+            source_upload("http://cdn/x.png", "http://booru", "k", "u")
@@ -0,0 +1,103 @@
+import os
+
+import pytest
+import yaml
+
+from cogs.config import ConfigCog
+from utilities import config as bot_config
+from utilities import spoiler
+from utilities.config import DEFAULT_DELETIONS, Config, config_path
+
+ENVIRON = {
+    "BOORU_URL": "https://booru.example",
+    "BOORU_AUTO_UPLOAD": "111,222",
+    "BOORU_MAINTENANCE": "333",
+    "CONTRIBUTOR_ROLES": "10, 20,",
+}
+
+
+def _write_deletions(directory, deletions):
+    path = directory / "deletions.yaml"
+    path.write_text(yaml.safe_dump({"deletions": deletions}))
+    return path
+
+
+class TestConfig:
+    def test_parses_ids_once(self, tmp_path):
+        settings = Config(ENVIRON, dirs=[str(tmp_path)])
+        assert settings.auto_upload_channel_ids == {111, 222}
+        assert settings.fav_channel_id == 111
+        assert settings.maintenance_channel_id == 333
+        assert settings.contributor_role_ids == {10, 20}
+        assert settings.alert_channel_id is None
+
+    def test_missing_env(self, tmp_path):
+        settings = Config({}, dirs=[str(tmp_path)])
+        assert settings.fav_channel_id is None
+        assert settings.maintenance_channel_id is None
+        assert settings.contributor_role_ids == frozenset()
+
+    def test_deletions_from_first_config_dir(self, tmp_path):
+        first, second = tmp_path / "a", tmp_path / "b"
+        first.mkdir()
+        second.mkdir()
+        _write_deletions(second, {"loser": "Ignored."})
+        _write_deletions(first, {"fayanna": "Requested."})
+
+        settings = Config({}, dirs=["", str(first), str(second)])
+        assert dict(settings.deletions) == {"fayanna": "Requested."}
+        with pytest.raises(TypeError):
+            settings.deletions["new"] = "Read only."
+
+    def test_config_path_skips_missing(self, tmp_path):
+        assert config_path("spoilers.yaml", dirs=["", str(tmp_path)]) is None
+
+    def test_default_deletions(self, tmp_path):
+        assert dict(Config({}, dirs=[str(tmp_path)]).deletions) == DEFAULT_DELETIONS
+
+    def test_files_changed(self, tmp_path):
+        path = _write_deletions(tmp_path, {"fayanna": "Requested."})
+        settings = Config({}, dirs=[str(tmp_path)])
+        assert not settings.files_changed()
+
+        os.utime(path, (0, 0))
+        assert settings.files_changed()
+
+
+class TestReload:
+    def test_swaps_settings(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(bot_config, "_config", None)
+        _write_deletions(tmp_path, {"fayanna": "Requested."})
+        old = bot_config.reload({}, dirs=[str(tmp_path)])
+
+        _write_deletions(tmp_path, {"fayanna": "Requested.", "vixi": "Requested."})
+        new = bot_config.reload(ENVIRON, dirs=[str(tmp_path)])
+        assert new is not old
+        assert bot_config.config() is new
+        assert len(new.deletions) == 2
+
+    def test_keeps_old_settings_on_error(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(bot_config, "_config", None)
+        _write_deletions(tmp_path, {"fayanna": "Requested."})
+        old = bot_config.reload({}, dirs=[str(tmp_path)])
+
+        (tmp_path / "deletions.yaml").write_text("deletions: [unclosed")
+        with pytest.raises(yaml.YAMLError):
+            bot_config.reload({}, dirs=[str(tmp_path)])
+        assert bot_config.config() is old
+
+    def test_broken_spoilers_keep_old_settings_too(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(bot_config, "_config", None)
+        monkeypatch.setattr(spoiler, "_policies", None)
+        monkeypatch.setattr(bot_config, "CONFIG_DIRS", [str(tmp_path)])
+        monkeypatch.setenv("SPOILER_CONFIG", str(tmp_path / "spoilers.yaml"))
+        _write_deletions(tmp_path, {"fayanna": "Requested."})
+        old_settings = bot_config.config()
+        old_policies = spoiler.policies()
+
+        _write_deletions(tmp_path, {"fayanna": "Requested.", "vixi": "Requested."})
+        (tmp_path / "spoilers.yaml").write_text("default: [unclosed")
+        with pytest.raises(bot_config.RELOAD_ERRORS):
+            ConfigCog(None).reload()
+        assert bot_config.config() is old_settings
+        assert spoiler.policies() is old_policies
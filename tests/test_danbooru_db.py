@@ -1,4 +1,6 @@
-from utilities.danbooru_db import post_matches_filter
+from datetime import datetime, timedelta
+
+from utilities.danbooru_db import db_reads_enabled, post_matches_filter, rewind
 
 
 class TestPostMatchesFilter:
@@ -17,3 +19,23 @@ class TestPostMatchesFilter:
         tags = "cute vore"
         assert post_matches_filter(tags, "g", "vore -gore") is True
         assert post_matches_filter("cute", "g", "vore -gore") is False
+
+
+class TestDbReadsEnabled:
+    def test_off_by_default(self, monkeypatch):
+        monkeypatch.delenv("DANBOORU_DB_READS", raising=False)
+        assert db_reads_enabled() is False
+
+    def test_truthy_values(self, monkeypatch):
+        for value in ("true", "1", "YES"):
+            monkeypatch.setenv("DANBOORU_DB_READS", value)
+            assert db_reads_enabled() is True
+        monkeypatch.setenv("DANBOORU_DB_READS", "no")
+        assert db_reads_enabled() is False
+
+
+class TestRewind:
+    def test_goes_back_over_the_overlap(self):
+        cursor = (datetime(2026, 1, 1, 12, 0), 42)
+        overlap = timedelta(minutes=2)
+        assert rewind(cursor, overlap) == (datetime(2026, 1, 1, 11, 58), 0)
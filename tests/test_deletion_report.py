@@ -0,0 +1,54 @@
+import csv
+import io
+
+from utilities.deletion_report import REPORT_LINES, DeletionReport
+
+API_URL = "https://booru.snowsune.net"
+
+
+def _report(deleted, failed=0, expected=None):
+    report = DeletionReport(API_URL, expected=expected)
+    for post_id in range(deleted):
+        report.record(post_id, "solo", "requested")
+    for post_id in range(deleted, deleted + failed):
+        report.record(post_id, "solo", "requested", error="HTTP 500")
+    return report
+
+
+class TestDeletionReport:
+    def test_progress_counts_what_is_left(self):
+        report = _report(3, 1, expected=10)
+        assert not report.complete
+        assert "3 deleted, 1 failed, 6 to go" in report.render()
+
+    def test_complete_once_every_expected_result_is_in(self):
+        report = _report(2, expected=2)
+        assert report.complete
+        assert "to go" not in report.render(final=True)
+
+    def test_stray_deletions_never_complete(self):
+        assert not _report(5).complete
+
+    def test_small_report_shows_everything(self):
+        report = _report(2, 1)
+        content = report.render(final=True)
+        assert f"<{API_URL}/posts/0>" in content
+        assert "Failed to delete" in content
+        assert not report.needs_attachment()
+
+    def test_large_report_stays_under_the_limit(self):
+        report = DeletionReport(API_URL)
+        for post_id in range(500):
+            report.record(post_id, "x" * 80, "y" * 80)
+        content = report.render(final=True)
+        assert len(content) <= 2000
+        assert report.needs_attachment()
+        assert content.endswith("(see the attached list)")
+
+    def test_csv_has_every_result(self):
+        report = _report(REPORT_LINES * 3, 2)
+        rows = list(csv.DictReader(io.StringIO(report.to_csv().decode())))
+        assert len(rows) == REPORT_LINES * 3 + 2
+        assert rows[0]["url"] == f"{API_URL}/posts/0"
+        assert rows[-1]["status"] == "failed"
+        assert rows[-1]["error"] == "HTTP 500"
@@ -1,9 +1,13 @@
+import asyncio
+
 from utilities.fav_announcements import (
+    announce_fav,
     format_fav_announcement,
     format_fav_message,
     merge_fav_announcement,
     parse_fav_message,
 )
+from utilities.outbox import Outbox
 
 POST_URL = "https://booru.snowsune.net/posts/21944"
 SPOILER_LINK = f"## CW: bones, skull\n|| {POST_URL} ||"
@@ -82,3 +86,36 @@ class TestMergeFavAnnouncement:
     def test_skips_duplicate_username(self):
         parsed = (21944, ["Vixi", "Tirga"], POST_URL)
         assert merge_fav_announcement(parsed, "Tirga") is None
+
+
+class TestAnnounceFav:
+    def test_merges_into_queued_announcement(self):
+        class Channel:
+            id = 1
+
+            def __init__(self):
+                self.sent = []
+
+            async def history(self, limit):
+                return
+                yield
+
+            async def send(self, content):
+                self.sent.append(content)
+
+        channel = Channel()
+        outbox = Outbox(window=0.01)
+        api_url = "https://booru.snowsune.net"
+
+        async def run():
+            future = await announce_fav(
+                channel, 0, api_url, "Vixi", 21944, outbox=outbox
+            )
+            again = await announce_fav(
+                channel, 0, api_url, "Tirga", 21944, outbox=outbox
+            )
+            assert again is future
+            await future
+
+        asyncio.run(run())
+        assert channel.sent == [format_fav_message(["Vixi", "Tirga"], POST_URL)]
@@ -0,0 +1,143 @@
+import asyncio
+
+from types import SimpleNamespace
+
+import pytest
+
+from cogs.booru_deletions import BooruDeletions
+from utilities import danbooru_db, job_handlers, jobs, post_mirror
+
+
+@pytest.fixture
+def db_sweep(monkeypatch):
+    """A deletion sweep with DB reads on, and a fresh mirror. Records the scans."""
+    scans = []
+
+    def scan_posts_sync(all_tags, none_tags, pending=None):
+        scans.append((all_tags, none_tags, pending))
+        return iter([(1, "spam", "e")])
+
+    monkeypatch.setattr(post_mirror, "find_posts", lambda *a, **kw: [{"id": 2}])
+    monkeypatch.setattr(danbooru_db, "db_reads_enabled", lambda: True)
+    monkeypatch.setattr(danbooru_db, "scan_posts_sync", scan_posts_sync)
+    monkeypatch.setattr(jobs, "enqueue_many", lambda kind, entries: len(list(entries)))
+    return scans
+
+
+class TestDeletionSweep:
+    def test_pending_only_rules_stay_pending_only(self, db_sweep):
+        job_handlers.handle_deletion_sweep({"deletions": {"status:pending spam": "x"}})
+        assert db_sweep == [(["spam"], [], True)]
+
+    def test_plain_rules_match_every_post(self, db_sweep):
+        job_handlers.handle_deletion_sweep({"deletions": {"spam -solo": "x"}})
+        assert db_sweep == [(["spam"], ["solo"], None)]
+
+    def test_queues_in_one_batch_call_per_rule(self, db_sweep, monkeypatch):
+        calls = []
+
+        def enqueue_many(kind, entries):
+            calls.append([key for _, key in entries])
+            return len(calls[-1])
+
+        monkeypatch.setattr(jobs, "enqueue_many", enqueue_many)
+        result = job_handlers.handle_deletion_sweep({"deletions": {"spam": "x"}})
+        assert calls == [["delete:1"]]
+        assert result == {"queued": 1}
+
+    def test_report_expects_what_the_sweep_queued(self, db_sweep):
+        result = job_handlers.handle_deletion_sweep({"deletions": {"spam": "x"}}, 7)
+        job = jobs.Job(7, jobs.DELETION_SWEEP, {}, status="done", result=result)
+
+        cog = BooruDeletions(SimpleNamespace())
+        asyncio.run(cog.on_job_done(job))
+        assert cog.reports[7].report.expected == 1
+
+    def test_deletes_done_before_their_sweep_wait_for_it(self, db_sweep, monkeypatch):
+        queued = []
+
+        def enqueue_many(kind, entries):
+            queued.extend(entries)
+            return len(queued)
+
+        monkeypatch.setattr(jobs, "enqueue_many", enqueue_many)
+        result = job_handlers.handle_deletion_sweep({"deletions": {"spam": "x"}}, 7)
+        ((payload, _),) = queued
+        assert payload["sweep_id"] == 7
+
+        cog = BooruDeletions(SimpleNamespace(get_channel=lambda channel_id: None))
+
+        async def run():
+            await cog.on_job_done(jobs.Job(9, jobs.DELETE, payload, status="done"))
+            await cog.send_deletion_report()
+            await cog.send_deletion_report()  # Quiet, but the sweep hasn't reported
+            assert 7 in cog.reports
+
+            sweep = jobs.Job(7, jobs.DELETION_SWEEP, {}, status="done", result=result)
+            await cog.on_job_done(sweep)
+            assert cog.reports[7].report.complete
+            await cog.send_deletion_report()
+            assert not cog.reports
+
+        asyncio.run(run())
+
+
+@pytest.fixture
+def maintenance(monkeypatch):
+    """A maintenance sweep over two posts. Records the retries it queues."""
+    posts = [
+        {
+            "id": 1,
+            "tag_string": "missing_source solo",
+            "source": "https://example.com",
+            "tag_string_artist": "",
+        },
+        {
+            "id": 2,
+            "tag_string": "missing_artist duo",
+            "source": "",
+            "tag_string_artist": "someone",
+        },
+    ]
+    queued = []
+
+    def enqueue(kind, payload, idempotency_key=None):
+        queued.append((kind, payload, idempotency_key))
+
+    monkeypatch.setattr(post_mirror, "find_posts", lambda *a, **kw: posts)
+    monkeypatch.setattr(jobs, "enqueue", enqueue)
+    return queued
+
+
+class TestMaintenanceSweep:
+    def test_failed_edits_are_retried_not_reported(self, maintenance, monkeypatch):
+        def send_edit(edit, adjust=None, base=None):
+            if edit.post_id == 2:
+                raise OSError("down")
+            adjust(edit, base)
+            return {"id": 1, "tag_string": "solo"}
+
+        monkeypatch.setattr(job_handlers, "_send_edit", send_edit)
+        result = job_handlers.handle_maintenance_sweep({}, 7)
+        assert result == {"changes": ["Removed `missing_source` from </posts/1>"]}
+        assert maintenance == [
+            (
+                jobs.TAG_EDIT,
+                {"post_id": 2, "add": "", "remove": ["missing_artist"]},
+                "maint:2:7",
+            )
+        ]
+
+    def test_reports_what_the_post_changed_into(self, maintenance, monkeypatch):
+        def send_edit(edit, adjust=None, base=None):
+            # Someone fixed post 2 already, so there's nothing left to do to it
+            post = dict(base, tag_string="duo") if edit.post_id == 2 else base
+            adjust(edit, post)
+            return dict(
+                post, tag_string=" ".join(edit.apply(post["tag_string"].split()))
+            )
+
+        monkeypatch.setattr(job_handlers, "_send_edit", send_edit)
+        result = job_handlers.handle_maintenance_sweep({})
+        assert result == {"changes": ["Removed `missing_source` from </posts/1>"]}
+        assert maintenance == []
@@ -0,0 +1,69 @@
+from datetime import datetime
+
+from utilities import jobs
+from utilities.jobs import Job, backoff_delay
+
+
+class FakeCursor:
+    """Matches as many rows as `rowcount` says, records the last statement."""
+
+    def __init__(self, rowcount):
+        self.rowcount = rowcount
+        self.executed = None
+
+    def execute(self, sql, params):
+        self.executed = (sql, params)
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class TestBackoffDelay:
+    def test_doubles_each_attempt(self):
+        no_jitter = lambda: 1.0
+        assert backoff_delay(1, base=5, jitter=no_jitter) == 5
+        assert backoff_delay(2, base=5, jitter=no_jitter) == 10
+        assert backoff_delay(4, base=5, jitter=no_jitter) == 40
+
+    def test_capped(self):
+        assert backoff_delay(30, base=5, cap=3600, jitter=lambda: 1.0) == 3600
+
+    def test_jitter_keeps_at_least_half(self):
+        assert backoff_delay(3, base=5, jitter=lambda: 0.0) == 10
+
+
+class TestJob:
+    def test_defaults(self):
+        job = Job(1, "upload", None)
+        assert job.payload == {}
+        assert job.status == "pending"
+        assert "upload" in repr(job)
+
+
+class TestLease:
+    LEASE = datetime(2026, 1, 1, 12, 5)
+
+    def _job(self, monkeypatch, rowcount):
+        cur = FakeCursor(rowcount)
+        monkeypatch.setattr(jobs, "getCur", lambda: (cur, FakeConnection()))
+        return cur, Job(1, "upload", None, "running", 1, locked_until=self.LEASE)
+
+    def test_outcome_is_written_under_our_lease(self, monkeypatch):
+        cur, job = self._job(monkeypatch, 1)
+        assert jobs.complete(job, {"post_id": 3})
+        sql, params = cur.executed
+        assert "locked_until = %s" in sql and params[-2:] == (1, self.LEASE)
+
+    def test_outcome_after_the_lease_ran_out_is_dropped(self, monkeypatch):
+        cur, job = self._job(monkeypatch, 0)
+        assert not jobs.complete(job, {})
+        assert not jobs.fail(job, RuntimeError("timeout"))
+        assert cur.executed[1][-2:] == (1, self.LEASE)
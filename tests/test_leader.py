@@ -0,0 +1,95 @@
+import asyncio
+
+from utilities.leader import LeaderElection
+
+
+class FakeLockServer:
+    """Session advisory locks, released when the session that holds them closes."""
+
+    def __init__(self):
+        self.holder = None
+
+
+class FakeCursor:
+    def __init__(self, row):
+        self.row = row
+
+    async def fetchone(self):
+        return self.row
+
+
+class FakeConnection:
+    def __init__(self, server):
+        self.server = server
+        self.closed = False
+
+    async def execute(self, query, params=None):
+        if "pg_try_advisory_lock" in query:
+            if self.server.holder is None:
+                self.server.holder = self
+            return FakeCursor((self.server.holder is self,))
+        if "pg_advisory_unlock" in query and self.server.holder is self:
+            self.server.holder = None
+        return FakeCursor((1,))
+
+    async def close(self):
+        self.closed = True
+        if self.server.holder is self:
+            self.server.holder = None
+
+
+def _election(server, events, name):
+    async def elected():
+        events.append((name, "elected"))
+
+    async def deposed():
+        events.append((name, "deposed"))
+
+    election = LeaderElection(elected, deposed)
+
+    async def connect():
+        return FakeConnection(server)
+
+    election._connect = connect
+    return election
+
+
+class TestLeaderElection:
+    def test_one_leader_and_handover(self):
+        server, events = FakeLockServer(), []
+        first = _election(server, events, "first")
+        second = _election(server, events, "second")
+
+        async def run():
+            await first.campaign()
+            await second.campaign()
+            assert first.is_leader and not second.is_leader
+
+            await first.stop()
+            await second.campaign()
+
+        asyncio.run(run())
+        assert events == [
+            ("first", "elected"),
+            ("first", "deposed"),
+            ("second", "elected"),
+        ]
+
+    def test_steps_down_when_its_connection_is_lost(self):
+        server, events = FakeLockServer(), []
+        first = _election(server, events, "first")
+        second = _election(server, events, "second")
+
+        async def run():
+            await first.campaign()
+            await first._conn.close()  # Server side, the lock goes with the session
+            await second.campaign()
+            await first.campaign()
+
+        asyncio.run(run())
+        assert events == [
+            ("first", "elected"),
+            ("second", "elected"),
+            ("first", "deposed"),
+        ]
+        assert second.is_leader and not first.is_leader
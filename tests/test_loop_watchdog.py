@@ -0,0 +1,112 @@
+import time
+import asyncio
+import traceback
+
+from types import SimpleNamespace
+
+from cogs.loop_watchdog import LoopWatchdogCog
+from utilities.loop_watchdog import (
+    BlockReport,
+    LoopWatchdog,
+    ReportLimiter,
+    attribute_stack,
+    percentile,
+)
+
+COGS_DIR = "/app/boorubot/cogs"
+
+
+def _frame(filename, name, lineno=1):
+    return traceback.FrameSummary(filename, lineno, name)
+
+
+class TestAttributeStack:
+    def test_outermost_cog_frame_wins(self):
+        stack = [
+            _frame("/usr/lib/python3/asyncio/events.py", "_run"),
+            _frame(f"{COGS_DIR}/booru_uploads.py", "on_message"),
+            _frame(f"{COGS_DIR}/booru_uploads.py", "get_sauce_info"),
+            _frame("/usr/lib/python3/site-packages/requests/api.py", "get"),
+        ]
+        assert attribute_stack(stack, COGS_DIR) == "booru_uploads.on_message"
+
+    def test_falls_back_to_innermost_frame(self):
+        stack = [
+            _frame("/usr/lib/python3/asyncio/events.py", "_run"),
+            _frame("/usr/lib/python3/socket.py", "recv", 42),
+        ]
+        assert attribute_stack(stack, COGS_DIR) == "socket.py:42 (recv)"
+
+    def test_empty_stack(self):
+        assert attribute_stack([], COGS_DIR) == "unknown"
+
+
+class TestReportLimiter:
+    def test_limits_per_key(self):
+        now = [0.0]
+        limiter = ReportLimiter(60, clock=lambda: now[0])
+        assert limiter.allow("a") is True
+        assert limiter.allow("a") is False
+        assert limiter.allow("b") is True
+        now[0] = 61
+        assert limiter.allow("a") is True
+
+    def test_ready_leaves_the_turn(self):
+        limiter = ReportLimiter(60, clock=lambda: 0.0)
+        assert limiter.ready("a") is True
+        assert limiter.allow("a") is True
+        assert limiter.ready("a") is False
+
+
+class TestReportBlocks:
+    def test_owner_held_back_by_the_channel_keeps_its_turn(self):
+        now = [0.0]
+        cog = LoopWatchdogCog(None)
+        cog.owner_limiter = ReportLimiter(600, clock=lambda: now[0])
+        cog.channel_limiter = ReportLimiter(60, clock=lambda: now[0])
+        sent = []
+
+        async def send_report(report):
+            sent.append(report.owner)
+
+        def drain(*owners):
+            reports = [BlockReport(owner, 1.0, [], 0.0) for owner in owners]
+            cog.watchdog = SimpleNamespace(drain=lambda: reports)
+            asyncio.run(cog.report_blocks.coro(cog))
+
+        cog.send_report = send_report
+        drain("a", "b")
+        now[0] = 61
+        drain("b")
+        assert sent == ["a", "b"]
+
+
+class TestPercentile:
+    def test_nearest_rank(self):
+        samples = list(range(1, 101))
+        assert percentile(samples, 50) == 50
+        assert percentile(samples, 99) == 99
+        assert percentile([], 50) == 0.0
+
+
+class TestLoopWatchdog:
+    def test_catches_blocking_callback(self):
+        def blocking_handler():
+            time.sleep(0.3)
+
+        async def run():
+            watchdog = LoopWatchdog(threshold=0.1, interval=0.02)
+            watchdog.start()
+            await asyncio.sleep(0.05)
+            blocking_handler()
+            await asyncio.sleep(0.1)
+            watchdog.stop()
+            return watchdog
+
+        watchdog = asyncio.run(run())
+        reports = watchdog.drain()
+
+        assert len(reports) == 1
+        assert reports[0].duration >= 0.1
+        assert "blocking_handler" in reports[0].format_stack()
+        assert watchdog.stats()["max_ms"] >= 100
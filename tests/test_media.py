@@ -0,0 +1,194 @@
+import threading
+import zlib
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from utilities import media
+from utilities.media import (
+    MediaPool,
+    MediaQueueFull,
+    exif_orientation,
+    inspect_media,
+    prepare_upload,
+    sniff,
+    strip_jpeg,
+    strip_png,
+    strip_stream,
+)
+
+
+def _segment(marker, payload):
+    return bytes([0xFF, marker]) + (len(payload) + 2).to_bytes(2, "big") + payload
+
+
+def _chunk(kind, payload):
+    crc = zlib.crc32(kind + payload).to_bytes(4, "big")
+    return len(payload).to_bytes(4, "big") + kind + payload + crc
+
+
+JFIF = _segment(0xE0, b"JFIF\x00")
+EXIF = _segment(0xE1, b"Exif\x00\x00GPS here")
+SCAN = _segment(0xDA, b"\x00") + b"pixels\xff\xd9"
+JPEG = b"\xff\xd8" + JFIF + EXIF + _segment(0xDB, b"quant") + SCAN
+
+IHDR = _chunk(b"IHDR", b"\x00" * 13)
+TEXT = _chunk(b"tEXt", b"Author\x00someone")
+PNG = (
+    b"\x89PNG\r\n\x1a\n" + IHDR + TEXT + _chunk(b"IDAT", b"data") + _chunk(b"IEND", b"")
+)
+
+
+def _tiff(orientation):
+    """Little endian EXIF with a GPS pointer and the orientation."""
+    entries = [(0x8825, 4, 1, 1234), (0x0112, 3, 1, orientation)]
+    ifd = len(entries).to_bytes(2, "little")
+    for tag, kind, count, value in entries:
+        ifd += b"".join(n.to_bytes(2, "little") for n in (tag, kind))
+        ifd += count.to_bytes(4, "little") + value.to_bytes(4, "little")
+    return b"II\x2a\x00\x08\x00\x00\x00" + ifd + b"\x00" * 4 + b"GPS here"
+
+
+class TestSniff:
+    def test_formats(self):
+        assert sniff(PNG[:16]) == "png"
+        assert sniff(JPEG[:16]) == "jpeg"
+        assert sniff(b"RIFF\x00\x00\x00\x00WEBPVP8 ") == "webp"
+        assert sniff(b"\x00\x00\x00\x18ftypmp42") == "mp4"
+        assert sniff(b"<html>") is None
+
+
+class TestStripMetadata:
+    def test_jpeg_drops_exif_keeps_the_rest(self):
+        stripped = strip_jpeg(JPEG)
+        assert b"GPS here" not in stripped
+        assert JFIF in stripped and stripped.endswith(SCAN)
+
+    def test_jpeg_keeps_the_orientation(self):
+        rotated = JPEG.replace(EXIF, _segment(0xE1, b"Exif\x00\x00" + _tiff(6)))
+        stripped = strip_jpeg(rotated)
+        assert b"GPS here" not in stripped and stripped.endswith(SCAN)
+        exif = stripped[len(b"\xff\xd8" + JFIF) :]
+        assert exif[:2] == b"\xff\xe1" and exif[4:10] == b"Exif\x00\x00"
+        assert exif_orientation(exif[10:]) == 6
+
+        upright = JPEG.replace(EXIF, _segment(0xE1, b"Exif\x00\x00" + _tiff(1)))
+        assert strip_jpeg(upright) == strip_jpeg(JPEG)
+
+    def test_png_keeps_the_orientation(self):
+        rotated = strip_png(PNG.replace(TEXT, _chunk(b"eXIf", _tiff(8))))
+        assert b"GPS here" not in rotated
+        start = len(PNG[:8] + IHDR)
+        exif = rotated[start : rotated.index(b"IDAT") - 4]
+        assert exif[4:8] == b"eXIf" and exif_orientation(exif[8:-4]) == 8
+        assert zlib.crc32(exif[4:-4]) == int.from_bytes(exif[-4:], "big")
+
+    def test_png_drops_text(self):
+        stripped = strip_png(PNG)
+        assert b"someone" not in stripped
+        assert stripped == PNG.replace(TEXT, b"")
+
+    def test_garbage_is_left_alone(self):
+        assert strip_jpeg(b"\xff\xd8nonsense") == b"\xff\xd8nonsense"
+
+    def test_prepare_upload_strips_in_place(self, tmp_path):
+        path = tmp_path / "upload.jpg"
+        path.write_bytes(JPEG)
+        result = prepare_upload(str(path))
+        assert result == {
+            "path": str(path),
+            "format": "jpeg",
+            "stripped": True,
+            "transcoded": False,
+        }
+        assert b"GPS here" not in path.read_bytes()
+
+    def test_prepare_upload_keeps_the_original_if_it_cannot_re_encode(
+        self, tmp_path, monkeypatch
+    ):
+        class Image:
+            class DecompressionBombError(Exception):
+                pass
+
+        def reencode(Image, path):
+            raise Image.DecompressionBombError("too many pixels")
+
+        monkeypatch.setattr(media, "_pillow", lambda: Image)
+        monkeypatch.setattr(media, "_reencode", reencode)
+        path = tmp_path / "upload.png"
+        path.write_bytes(PNG)
+        result = prepare_upload(str(path), max_bytes=10)
+        assert result["path"] == str(path) and not result["transcoded"]
+
+
+def _pieces(data, size):
+    return [data[i : i + size] for i in range(0, len(data), size)]
+
+
+class TestStripStream:
+    @pytest.mark.parametrize("size", [1, 3, 7, 1000])
+    def test_same_as_stripping_the_whole_file(self, size):
+        for data in (JPEG, PNG):
+            tail = b"more image data" * 20
+            if data is PNG:
+                data = data.replace(_chunk(b"IEND", b""), _chunk(b"IDAT", tail))
+            else:
+                data = data + tail
+            streamed = b"".join(strip_stream(_pieces(data, size)))
+            expected = (
+                strip_jpeg(data) if data.startswith(b"\xff\xd8") else strip_png(data)
+            )
+            assert streamed == expected
+
+    def test_only_buffers_the_head(self):
+        chunks = iter(_pieces(PNG, 4) + [b"after"] * 1000)
+        stream = strip_stream(chunks)
+        assert b"someone" not in next(stream)
+        assert len(list(chunks)) > 1000 - 10  # Nothing past the head was read yet
+
+    def test_gives_up_past_the_limit(self):
+        data = b"\xff\xd8" + EXIF * 100 + SCAN
+        streamed = b"".join(strip_stream(_pieces(data, 16), limit=64))
+        assert streamed == data
+
+    def test_other_formats_pass_through(self):
+        gif = b"GIF89a" + b"\x00" * 20
+        assert list(strip_stream([gif, b"rest"])) == [gif, b"rest"]
+
+
+class TestInspect:
+    def test_hashes_and_format(self, tmp_path):
+        path = tmp_path / "image.png"
+        path.write_bytes(PNG)
+        info = inspect_media(str(path))
+        assert info["format"] == "png"
+        assert info["bytes"] == len(PNG)
+        assert len(info["sha256"]) == 64
+
+
+class TestMediaPool:
+    def test_bounded_queue(self):
+        release = threading.Event()
+        pool = MediaPool(max_pending=1, executor=ThreadPoolExecutor(2))
+        future = pool.submit(release.wait)
+        with pytest.raises(MediaQueueFull):
+            pool.submit(release.wait)
+        release.set()
+        future.result()
+        pool.run_sync(sniff, PNG[:16])  # Room again
+
+    def test_usable_after_shutdown(self, monkeypatch):
+        pool = MediaPool(executor=ThreadPoolExecutor(1))
+        pool.shutdown()
+        monkeypatch.setattr(
+            media,
+            "ProcessPoolExecutor",
+            lambda workers, mp_context: ThreadPoolExecutor(),
+        )
+        assert pool.run_sync(sniff, PNG[:16]) == "png"
+
+    def test_timings(self):
+        pool = MediaPool(executor=ThreadPoolExecutor(1))
+        assert pool.run_sync(sniff, PNG[:16]) == "png"
+        assert pool.stats()["sniff"]["jobs"] == 1
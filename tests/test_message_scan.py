@@ -0,0 +1,67 @@
+from types import SimpleNamespace
+
+from utilities.message_scan import ATTACHMENT, LINK, image_url, scan
+
+BOT_ID = 1
+
+
+def _message(content="", attachments=(), reply_to=None, bot=False):
+    reference = None
+    if reply_to is not None:
+        author = SimpleNamespace(id=reply_to)
+        reference = SimpleNamespace(resolved=SimpleNamespace(author=author))
+    return SimpleNamespace(
+        author=SimpleNamespace(bot=bot),
+        content=content,
+        attachments=list(attachments),
+        reference=reference,
+    )
+
+
+def _attachment(content_type="image/png"):
+    return SimpleNamespace(
+        url="https://cdn/a.png", filename="a.png", content_type=content_type
+    )
+
+
+class TestScan:
+    def test_chat_is_nothing(self):
+        assert scan(_message("just chatting"), BOT_ID) is None
+        assert scan(_message("https://example.com/page"), BOT_ID) is None
+        assert scan(_message(reply_to=42), BOT_ID) is None
+
+    def test_bots_are_ignored(self):
+        assert scan(_message(attachments=[_attachment()], bot=True), BOT_ID) is None
+
+    def test_attachment(self):
+        found = scan(_message(attachments=[_attachment()]), BOT_ID)
+        assert found.image == ATTACHMENT
+        assert (found.url, found.filename) == ("https://cdn/a.png", "a.png")
+        assert not found.reply_to_bot
+
+    def test_non_image_attachment_falls_back_to_a_link(self):
+        message = _message(
+            " https://x.org/b.JPG?width=10 ", attachments=[_attachment(None)]
+        )
+        found = scan(message, BOT_ID)
+        assert found.image == LINK
+        assert found.url == "https://x.org/b.JPG?width=10"
+        assert found.filename == "b.JPG"
+
+    def test_reply_to_the_bot(self):
+        found = scan(_message("cute canine", reply_to=BOT_ID), BOT_ID)
+        assert found.reply_to_bot and found.image is None
+
+        # Tags and an image in one reply, both cogs get it
+        found = scan(_message(attachments=[_attachment()], reply_to=BOT_ID), BOT_ID)
+        assert found.reply_to_bot and found.image == ATTACHMENT
+
+    def test_reply_to_a_deleted_message(self):
+        message = _message("cute")
+        message.reference = SimpleNamespace(resolved=SimpleNamespace(id=5))
+        assert scan(message, BOT_ID) is None
+
+    def test_image_url(self):
+        assert image_url("look at this https://x.org/a.png") is None
+        assert image_url("https://x.org/a.png and this") is None
+        assert image_url("https://x.org/a.webm") == "https://x.org/a.webm"
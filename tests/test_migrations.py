@@ -0,0 +1,46 @@
+import pytest
+
+from utilities.migrations import load_migrations, pending_migrations
+
+
+def _write(directory, filename, sql="SELECT 1;"):
+    (directory / filename).write_text(sql)
+
+
+class TestLoadMigrations:
+    def test_version_order(self, tmp_path):
+        _write(tmp_path, "0010_add_index.sql")
+        _write(tmp_path, "0002_create_jobs_table.sql")
+        _write(tmp_path, "0001_create_key_value_table.sql")
+        _write(tmp_path, "README.md")
+
+        migrations = load_migrations(str(tmp_path))
+        assert [(m.version, m.name) for m in migrations] == [
+            (1, "create_key_value_table"),
+            (2, "create_jobs_table"),
+            (10, "add_index"),
+        ]
+
+    def test_duplicate_versions(self, tmp_path):
+        _write(tmp_path, "0001_one.sql")
+        _write(tmp_path, "0001_other.sql")
+        with pytest.raises(ValueError):
+            load_migrations(str(tmp_path))
+
+    def test_bundled_migrations(self):
+        names = [m.name for m in load_migrations()]
+        assert names[:3] == [
+            "create_key_value_table",
+            "create_jobs_table",
+            "create_post_mirror_table",
+        ]
+
+
+class TestPendingMigrations:
+    def test_skips_applied_by_name(self, tmp_path):
+        _write(tmp_path, "0001_create_key_value_table.sql")
+        _write(tmp_path, "0002_create_jobs_table.sql")
+        migrations = load_migrations(str(tmp_path))
+
+        pending = pending_migrations(migrations, {"create_key_value_table"})
+        assert [m.name for m in pending] == ["create_jobs_table"]
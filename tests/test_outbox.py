@@ -0,0 +1,92 @@
+import asyncio
+import time
+
+import pytest
+
+from utilities.outbox import Outbox, Pending, pack, truncate
+
+
+class FakeChannel:
+    def __init__(self, id=1, fail=False):
+        self.id = id
+        self.fail = fail
+        self.sent = []
+
+    async def send(self, content):
+        if self.fail:
+            raise RuntimeError("Missing Permissions")
+        self.sent.append((time.monotonic(), content))
+        return f"message {len(self.sent)}"
+
+
+def _pending(*contents):
+    return [Pending(content, None, None) for content in contents]
+
+
+class TestPack:
+    def test_packs_what_fits(self):
+        assert pack(_pending("a" * 10, "b" * 10, "c" * 10), limit=22) == 2
+
+    def test_always_takes_one(self):
+        assert pack(_pending("a" * 50, "b"), limit=20) == 1
+
+    def test_keyed_messages_go_alone(self):
+        pending = _pending("a", "b", "c", "d")
+        pending[1].key = pending[2].key = ("fav", 1)
+        assert [pack(pending[i:]) for i in range(4)] == [1, 1, 1, 1]
+        assert pack(_pending("a", "b") + pending[1:]) == 2
+
+    def test_truncates_oversized(self):
+        content = truncate("a" * 30, limit=20)
+        assert len(content) == 20 and content.endswith("…")
+
+
+class TestOutbox:
+    def test_coalesces_within_window(self):
+        channel = FakeChannel()
+        outbox = Outbox(window=0.01)
+
+        async def run():
+            futures = [outbox.send(channel, f"comment {i}") for i in range(3)]
+            return await asyncio.gather(*futures)
+
+        assert asyncio.run(run()) == ["message 1"] * 3
+        assert [content for _, content in channel.sent] == [
+            "comment 0\n\ncomment 1\n\ncomment 2"
+        ]
+
+    def test_spreads_sends_over_the_bucket(self):
+        channel = FakeChannel()
+        outbox = Outbox(window=0, rate=2, per=0.2)
+
+        async def run():
+            futures = [outbox.send(channel, "x" * 1500) for i in range(3)]
+            await asyncio.gather(*futures)
+
+        asyncio.run(run())
+        times = [at for at, _ in channel.sent]
+        assert len(times) == 3
+        assert times[2] - times[0] >= 0.2
+
+    def test_failed_send_reaches_the_caller(self):
+        channel = FakeChannel(fail=True)
+        outbox = Outbox(window=0)
+
+        async def run():
+            await outbox.send(channel, "hello")
+
+        with pytest.raises(RuntimeError):
+            asyncio.run(run())
+
+    def test_pending_content_can_change_before_send(self):
+        channel = FakeChannel()
+        outbox = Outbox(window=0.01)
+
+        async def run():
+            future = outbox.send(channel, "first", key="k")
+            outbox.pending(channel, "k").content = "changed"
+            await future
+            assert outbox.pending(channel, "k") is None
+
+        asyncio.run(run())
+        assert channel.sent[0][1] == "changed"
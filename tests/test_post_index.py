@@ -0,0 +1,95 @@
+import random
+from array import array
+from datetime import datetime
+
+from utilities.post_index import PostIndex, difference, intersect
+
+
+def _row(post_id, tags, rating="e", deleted=False, minute=0):
+    return (post_id, tags, rating, deleted, datetime(2024, 1, 1, 0, minute))
+
+
+class TestSetOps:
+    def test_intersect_merge_and_search_paths(self):
+        big = array("I", range(0, 2000, 2))
+        assert list(intersect(array("I", [2, 3, 4]), big)) == [2, 4]
+        assert list(intersect(big, array("I", range(0, 2000, 3)))) == list(
+            range(0, 2000, 6)
+        )
+
+    def test_difference(self):
+        a = array("I", [1, 2, 3, 4])
+        assert list(difference(a, array("I", [2, 4]))) == [1, 3]
+        assert list(difference(a, array("I", range(2, 100)))) == [1]
+        assert list(difference(a, array("I"))) == [1, 2, 3, 4]
+
+
+class TestPostIndex:
+    def _index(self):
+        index = PostIndex()
+        index.apply(
+            [
+                _row(1, "canine cute", "e"),
+                _row(2, "canine gore", "e"),
+                _row(3, "feline cute", "s"),
+                _row(4, "canine cute outdoors", "g"),
+            ]
+        )
+        return index
+
+    def test_search_with_tags_rating_and_exclusions(self):
+        index = self._index()
+        assert list(index.search("canine cute")) == [1, 4]
+        assert list(index.search("canine", exclude=["gore"])) == [1, 4]
+        assert list(index.search("cute rating:explicit")) == [1]
+        assert list(index.search("cute -rating:e")) == [3, 4]
+        assert list(index.search("", exclude=["cute"])) == [2]
+        assert list(index.search("dragon")) == []
+
+    def test_unsupported_syntax_is_left_to_the_booru(self):
+        index = self._index()
+        assert index.search("canine*") is None
+        assert index.search("order:score") is None
+        assert index.search("~canine ~feline") is None
+
+    def test_changes_replace_old_tags(self):
+        index = self._index()
+        index.apply([_row(1, "feline", "s", minute=1), _row(2, "", "e", True, 1)])
+
+        assert list(index.search("canine")) == [4]
+        assert list(index.search("feline")) == [1, 3]
+        assert list(index.search("rating:e")) == []
+        assert len(index) == 3
+        assert index.cursor == (datetime(2024, 1, 1, 0, 1), 2)
+
+    def test_rows_read_again_change_nothing(self):
+        index = self._index()
+        index.apply([_row(3, "feline cute", "s"), _row(4, "canine cute outdoors", "g")])
+        assert list(index.search("cute")) == [1, 3, 4]
+        assert list(index.search("rating:g")) == [4]
+        assert len(index) == 4
+
+    def test_bulk_batches_match_in_place_updates(self):
+        rng = random.Random(5)
+        rows = [_row(i, f"t{rng.randrange(4)} t{rng.randrange(4)}") for i in range(500)]
+
+        bulk, trickle = PostIndex(), PostIndex()
+        bulk.apply(rows)
+        for row in rows:
+            trickle.apply([row])
+
+        for tag in ("t0", "t1", "t2", "t3"):
+            assert list(bulk.search(tag)) == list(trickle.search(tag))
+
+    def test_random_post_id(self):
+        index = self._index()
+        assert index.random_post_id("canine cute", rng=random.Random(0)) in (1, 4)
+        assert index.random_post_id("dragon") == 0
+        assert index.random_post_id("canine*") is None
+
+    def test_remove_keeps_cursor(self):
+        index = self._index()
+        cursor = index.cursor
+        index.remove(1)
+        assert list(index.search("cute")) == [3, 4]
+        assert index.cursor == cursor
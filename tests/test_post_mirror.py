@@ -0,0 +1,19 @@
+from utilities.post_mirror import parse_query
+
+
+class TestParseQuery:
+    def test_tags_and_exclusions(self):
+        assert parse_query("fayanna solo -gore") == (
+            ["fayanna", "solo"],
+            ["gore"],
+            False,
+        )
+
+    def test_status_metatags(self):
+        assert parse_query("fayanna -status:deleted") == (["fayanna"], [], False)
+        assert parse_query("status:pending") == ([], [], True)
+
+    def test_unsupported_syntax(self):
+        assert parse_query("order:score") is None
+        assert parse_query("fay*") is None
+        assert parse_query("~canine ~feline") is None
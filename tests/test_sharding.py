@@ -0,0 +1,93 @@
+import pytest
+
+from utilities import config as bot_config
+from utilities.config import Config
+from utilities.sharding import (
+    ShardMetrics,
+    home_shard,
+    runs_singletons,
+    shard_for_guild,
+    shard_latencies,
+)
+
+GUILD_ID = 1135293329297903757
+
+
+class FakeBot:
+    def __init__(self, shard_count=None, shard_ids=None, latencies=None):
+        self.shard_count = shard_count
+        self.shard_ids = shard_ids
+        self.shard_id = None
+        self.latency = 0.05
+        if latencies is not None:
+            self.latencies = latencies
+
+
+@pytest.fixture
+def home_guild(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        bot_config, "_config", Config({"HOME_GUILD_ID": str(GUILD_ID)}, [str(tmp_path)])
+    )
+
+
+class TestShardForGuild:
+    def test_discord_formula(self):
+        assert shard_for_guild(GUILD_ID, 4) == (GUILD_ID >> 22) % 4
+
+    def test_unsharded_and_dms(self):
+        assert shard_for_guild(GUILD_ID, None) == 0
+        assert shard_for_guild(None, 4) == 0
+
+
+class TestRunsSingletons:
+    def test_unsharded_or_all_shards(self):
+        assert runs_singletons(FakeBot())
+        assert runs_singletons(FakeBot(shard_count=4))
+
+    def test_home_shard_owner_only(self, home_guild):
+        home = home_shard(4)
+        assert home == shard_for_guild(GUILD_ID, 4)
+        assert runs_singletons(FakeBot(shard_count=4, shard_ids=[home]))
+        others = [shard for shard in range(4) if shard != home]
+        assert not runs_singletons(FakeBot(shard_count=4, shard_ids=others))
+
+
+class TestShardLatencies:
+    def test_plain_bot(self):
+        assert shard_latencies(FakeBot()) == [(0, 0.05)]
+
+    def test_sharded_bot(self):
+        bot = FakeBot(shard_count=2, latencies=[(1, 0.2), (0, 0.1)])
+        assert shard_latencies(bot) == [(0, 0.1), (1, 0.2)]
+
+
+class TestShardMetrics:
+    def test_rates_reset_each_sample(self):
+        now = [0.0]
+        metrics = ShardMetrics(clock=lambda: now[0])
+        for _ in range(30):
+            metrics.count(0)
+        metrics.count(1)
+
+        now[0] = 10.0
+        assert metrics.rates() == {0: 3.0, 1: 0.1}
+        now[0] = 20.0
+        assert metrics.rates() == {}
+
+
+class TestShardConfig:
+    def test_shard_id_ranges(self, tmp_path):
+        settings = Config(
+            {
+                "BOORU_SHARDED": "true",
+                "BOORU_SHARD_COUNT": "8",
+                "BOORU_SHARD_IDS": "0-2, 6",
+            },
+            [str(tmp_path)],
+        )
+        assert settings.sharded
+        assert settings.shard_ids == [0, 1, 2, 6]
+
+    def test_shard_ids_need_count(self, tmp_path):
+        with pytest.raises(ValueError):
+            Config({"BOORU_SHARD_IDS": "0-1"}, [str(tmp_path)])
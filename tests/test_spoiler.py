@@ -1,4 +1,15 @@
-from utilities.spoiler import format_link_with_cw, spoiler_tags_for
+import pytest
+import yaml
+
+from utilities import spoiler
+from utilities.spoiler import (
+    CwPolicies,
+    CwPolicy,
+    format_link_with_cw,
+    load_policies,
+    reload_policies,
+    spoiler_tags_for,
+)
 
 POST_URL = "https://booru.snowsune.net/posts/42"
 
@@ -19,3 +30,81 @@ class TestFormatLinkWithCw:
 
     def test_returns_plain_url_when_no_match(self):
         assert format_link_with_cw(POST_URL, "cute canine") == POST_URL
+
+
+class TestCwPolicies:
+    def _policies(self):
+        return CwPolicies.from_config(
+            {
+                "default": {"tags": ["gore"], "patterns": ["*_gore"]},
+                "channels": {
+                    "10": {"rating": "questionable"},
+                    "20": {"tags": [], "patterns": []},
+                },
+            }
+        )
+
+    def test_wildcard_rules(self):
+        policies = self._policies()
+        assert policies.cw_for("cute light_gore gore") == ["gore", "light_gore"]
+        assert policies.cw_for("cute gore_adjacent") == []
+
+    def test_rating_threshold(self):
+        policies = self._policies()
+        assert policies.cw_for("cute", "e", channel_id=10) == ["explicit"]
+        assert policies.cw_for("cute", "s", channel_id=10) == []
+        # Channel policies inherit the default's tags
+        assert policies.cw_for("gore", "g", channel_id=10) == ["gore"]
+
+    def test_per_channel_override(self):
+        policies = self._policies()
+        assert policies.cw_for("gore", channel_id=20) == []
+        assert policies.cw_for("gore", channel_id=30) == ["gore"]
+
+    def test_results_cached_per_post(self):
+        policies = self._policies()
+        calls = []
+        evaluate = CwPolicy.evaluate
+
+        def counting(self, tags, rating=None):
+            calls.append(self)
+            return evaluate(self, tags, rating)
+
+        CwPolicy.evaluate = counting
+        try:
+            for _ in range(3):
+                assert policies.cw_for("gore", "e", post_id=1) == ["gore"]
+            assert policies.cw_for("cute", "e", post_id=1) == []
+        finally:
+            CwPolicy.evaluate = evaluate
+        assert len(calls) == 2
+
+    def test_missing_config_uses_spoiler_tags(self):
+        assert CwPolicies.from_config(None).cw_for("bones cute") == ["bones"]
+
+
+class TestReloadPolicies:
+    def test_broken_file_falls_back_on_first_load(self, tmp_path):
+        path = tmp_path / "spoilers.yaml"
+        path.write_text("default: [unclosed")
+        assert load_policies(str(path)).cw_for("bones cute") == ["bones"]
+        path.write_text("channels:\n  123: gore\n")
+        assert load_policies(str(path)).cw_for("bones cute") == ["bones"]
+
+    def test_broken_file_keeps_the_old_policies(self, tmp_path, monkeypatch):
+        path = tmp_path / "spoilers.yaml"
+        path.write_text("default:\n  tags: [cute]\n")
+        monkeypatch.setattr(spoiler, "_policies", None)
+        old = reload_policies(str(path))
+
+        path.write_text("default: [unclosed")
+        with pytest.raises(yaml.YAMLError):
+            reload_policies(str(path))
+        path.write_text("channels:\n  not_an_id: {}\n")
+        with pytest.raises(ValueError):
+            reload_policies(str(path))
+        for shape in ("channels:\n  123: gore\n", "- gore\n", "default: [gore]\n"):
+            path.write_text(shape)
+            with pytest.raises(ValueError):
+                reload_policies(str(path))
+        assert spoiler.policies() is old
@@ -0,0 +1,114 @@
+import asyncio
+
+import discord
+from discord import app_commands
+
+from utilities import startup
+from utilities.startup import StartupTimer, command_signature, sync_tree
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _tree(*commands):
+    tree = app_commands.CommandTree(discord.Client(intents=discord.Intents.none()))
+    for command in commands:
+        tree.add_command(command)
+    return tree
+
+
+def _command(name, description="Does a thing."):
+    async def callback(interaction: discord.Interaction, tags: str):
+        pass
+
+    return app_commands.Command(name=name, description=description, callback=callback)
+
+
+class TestStartupTimer:
+    def test_records_phases(self):
+        clock = FakeClock()
+        timer = StartupTimer(clock)
+
+        with timer.phase("migrations"):
+            clock.now += 0.25
+        clock.now += 1
+
+        assert timer.phases == [("migrations", 0.25)]
+        assert timer.report() == "Ready 1.25s after start (migrations 250ms)"
+
+    def test_timed_awaitable(self):
+        clock = FakeClock()
+        timer = StartupTimer(clock)
+
+        async def login():
+            clock.now += 0.5
+            return "ok"
+
+        assert asyncio.run(timer.timed("login", login())) == "ok"
+        assert timer.phases == [("login", 0.5)]
+
+
+class TestCommandSignature:
+    def test_stable_across_registration_order(self):
+        first = _tree(_command("random"), _command("reload_config"))
+        second = _tree(_command("reload_config"), _command("random"))
+        assert command_signature(first) == command_signature(second)
+
+    def test_changes_with_commands(self):
+        before = command_signature(_tree(_command("random")))
+        assert command_signature(_tree(_command("random", "Other."))) != before
+        assert command_signature(_tree(_command("random"), _command("fav"))) != before
+
+    def test_includes_context_menus(self):
+        async def upload(interaction: discord.Interaction, message: discord.Message):
+            pass
+
+        menu = app_commands.ContextMenu(name="Upload to BixiBooru", callback=upload)
+        assert command_signature(_tree(_command("random"), menu)) != command_signature(
+            _tree(_command("random"))
+        )
+
+
+class TestSyncTree:
+    def _tree(self, monkeypatch, store):
+        tree = _tree(_command("random"))
+        tree.client._connection.application_id = 1234
+        synced = []
+
+        async def sync(guild=None):
+            synced.append(guild.id if guild else None)
+
+        monkeypatch.setattr(tree, "sync", sync)
+        monkeypatch.setattr(startup, "retrieve_key", lambda key: store.get(key))
+        monkeypatch.setattr(startup, "store_key", store.__setitem__)
+        return tree, synced
+
+    def test_skips_unchanged_commands(self, monkeypatch):
+        store = {}
+        tree, synced = self._tree(monkeypatch, store)
+
+        assert asyncio.run(sync_tree(tree))
+        assert not asyncio.run(sync_tree(tree))
+        assert synced == [None]
+        assert list(store) == ["app_commands_signature:1234"]
+
+        tree.add_command(_command("fav"))
+        assert asyncio.run(sync_tree(tree))
+        assert asyncio.run(sync_tree(tree, force=True))
+        assert synced == [None, None, None]
+
+    def test_guild_sync_tracked_separately(self, monkeypatch):
+        store = {}
+        tree, synced = self._tree(monkeypatch, store)
+        guild = discord.Object(id=42)
+
+        assert asyncio.run(sync_tree(tree))
+        assert asyncio.run(sync_tree(tree, guild))
+        assert not asyncio.run(sync_tree(tree, guild))
+        assert synced == [None, 42]
+        assert "app_commands_signature:1234:42" in store
@@ -0,0 +1,183 @@
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from utilities import tag_edit
+from utilities.tag_edit import KeyedLock, TagEdit, apply_edits, edit_post, post_locks
+
+
+class TestTagEdit:
+    def test_single_partial_tag_string(self):
+        edit = TagEdit(5).add("cute canine").remove("tagme").set_source("https://x")
+        assert edit.params() == {
+            "post[old_tag_string]": "",
+            "post[tag_string]": "cute canine -tagme",
+            "post[source]": "https://x",
+        }
+
+    def test_later_change_wins(self):
+        edit = TagEdit(5).add("tagme").remove("tagme")
+        assert edit.added == [] and edit.removed == ["tagme"]
+        edit.add("tagme")
+        assert edit.added == ["tagme"] and edit.removed == []
+
+    def test_source_only_leaves_tags_alone(self):
+        assert TagEdit(5).set_source("https://x").params() == {
+            "post[source]": "https://x"
+        }
+
+    def test_apply(self):
+        edit = TagEdit(5).add("canine", "solo").remove("tagme")
+        assert edit.apply(["tagme", "solo", "cute"]) == ["solo", "cute", "canine"]
+
+    def test_empty(self):
+        assert not TagEdit(5)
+        assert TagEdit(5).set_rating("s")
+
+
+class TestApplyEdits:
+    def test_merges_edits_per_post_and_keeps_errors(self):
+        sent = []
+
+        def send(edit):
+            if edit.post_id == 2:
+                raise RuntimeError("booru down")
+            sent.append(edit.tag_string())
+            return {"id": edit.post_id}
+
+        results = apply_edits(
+            [
+                TagEdit(1).add("vore"),
+                TagEdit(2).remove("missing_source"),
+                TagEdit(1).remove("missing_artist"),
+                TagEdit(3),
+            ],
+            send,
+        )
+        assert sent == ["vore -missing_artist"]
+        assert results[1] == {"id": 1}
+        assert isinstance(results[2], RuntimeError)
+        assert 3 not in results
+
+
+class FakeBooru:
+    """Danbooru's `old_tag_string` merge, with a hook for a writer that gets in first."""
+
+    def __init__(self, tags, aliases=None):
+        self.tags = tags.split()
+        self.aliases = aliases or {}
+        self.version = 0
+        self.puts = 0
+        self.interlopers = []
+
+    def post(self):
+        return {"id": 1, "tag_string": " ".join(self.tags), "updated_at": self.version}
+
+    def fetch(self, post_id, *creds):
+        return self.post()
+
+    def send(self, edit, *creds, base=None):
+        if self.interlopers:
+            self.interlopers.pop(0)(self)
+        params = edit.params(base)
+        new, old = params["post[tag_string]"].split(), params["post[old_tag_string]"]
+        old = old.split()
+        kept = [t for t in self.tags if t in new]
+        merged = [t for t in self.tags + new if t not in old] + kept
+        removed = {t[1:] for t in merged if t.startswith("-")}
+        self.tags = list(
+            dict.fromkeys(
+                self.aliases.get(t, t)
+                for t in merged
+                if t[0] != "-" and t not in removed
+            )
+        )
+        self.version += 1
+        self.puts += 1
+        return self.post()
+
+
+def _clear_tagme_over(threshold):
+    def adjust(edit, post):
+        tags = edit.apply(post["tag_string"].split())
+        if "tagme" in tags and len(tags) > threshold:
+            edit.remove("tagme")
+
+    return adjust
+
+
+@pytest.fixture
+def booru(monkeypatch):
+    booru = FakeBooru("tagme solo")
+    monkeypatch.setattr(tag_edit, "fetch_post", booru.fetch)
+    monkeypatch.setattr(
+        TagEdit, "send", lambda edit, *creds, base=None: booru.send(edit, base=base)
+    )
+    return booru
+
+
+class TestEditPost:
+    def test_no_conflict_is_one_put(self, booru):
+        edit_post(TagEdit(1).add("canine"), "url", "key", "user")
+        assert booru.tags == ["tagme", "solo", "canine"] and booru.puts == 1
+
+    def test_decision_is_remade_after_a_conflicting_write(self, booru):
+        # Someone else adds tags between our read and our write, so the post is now
+        # over the threshold and `tagme` has to go after all
+        booru.interlopers.append(lambda b: b.tags.extend(["cute", "outdoors"]))
+        edit_post(
+            TagEdit(1).add("canine"),
+            "url",
+            "key",
+            "user",
+            adjust=_clear_tagme_over(4),
+        )
+        assert set(booru.tags) == {"solo", "canine", "cute", "outdoors"}
+        assert booru.puts == 2
+
+    def test_aliased_tags_are_not_a_conflict(self, booru):
+        booru.aliases["dog"] = "canine"
+        edit_post(
+            TagEdit(1).add("dog", "cute", "outdoors"),
+            "url",
+            "key",
+            "user",
+            adjust=_clear_tagme_over(4),
+        )
+        assert set(booru.tags) == {"solo", "canine", "cute", "outdoors"}
+        assert booru.puts == 1
+
+    def test_concurrent_edits_to_one_post_compose(self, booru):
+        edits = [TagEdit(1).add(f"tag_{i}") for i in range(8)]
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(
+                pool.map(
+                    lambda edit: edit_post(
+                        edit, "url", "key", "user", adjust=_clear_tagme_over(100)
+                    ),
+                    edits,
+                )
+            )
+        assert set(booru.tags) == {"tagme", "solo"} | {f"tag_{i}" for i in range(8)}
+        assert len(post_locks) == 0
+
+
+class TestKeyedLock:
+    def test_serializes_per_key_only(self):
+        locks, entered = KeyedLock(), []
+
+        def take(key):
+            with locks.hold(key):
+                entered.append(key)
+
+        with locks.hold(1):
+            same, other = (threading.Thread(target=take, args=(k,)) for k in (1, 2))
+            same.start()
+            other.start()
+            other.join(timeout=1)
+            assert entered == [2]  # A different post doesn't wait
+        same.join(timeout=1)
+        assert entered == [2, 1]
+        assert len(locks) == 0
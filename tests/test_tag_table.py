@@ -0,0 +1,58 @@
+from array import array
+
+from utilities.danbooru_db import post_matches_filter
+from utilities.tag_table import PostRecord, TagFilter, TagTable
+
+
+class TestTagTable:
+    def test_intern_is_stable(self):
+        table = TagTable()
+        assert table.intern("canine") == table.intern("canine")
+        assert table.lookup("feline") is None
+        assert table.name(table.intern("feline")) == "feline"
+        assert len(table) == 2
+
+    def test_encode_sorts_and_dedupes(self):
+        table = TagTable()
+        tags = table.encode("cute canine cute outdoors")
+        assert isinstance(tags, array) and list(tags) == sorted(set(tags))
+        assert len(tags) == 3
+        assert table.decode(tags) == "canine cute outdoors"
+
+
+class TestPostRecord:
+    def test_membership(self):
+        table = TagTable()
+        record = PostRecord.from_tag_string(table, 1, "e", "cute canine")
+        assert record.has(table.lookup("canine"))
+        assert not record.has(table.intern("vore"))
+        assert record.tag_string(table) == "canine cute"
+
+
+class TestTagFilter:
+    def test_matches_like_post_matches_filter(self):
+        table = TagTable()
+        cases = [
+            ("cute canine", "g"),
+            ("vore cute", "g"),
+            ("cute", "e"),
+            ("cute vore", "q"),
+        ]
+        queries = [
+            "rating:general -vore -gore",
+            "-vore -rating:general",
+            "vore -gore",
+        ]
+        for query in queries:
+            compiled = TagFilter(table, query)
+            for tag_string, rating in cases:
+                record = PostRecord.from_tag_string(table, 1, rating, tag_string)
+                assert compiled.matches(record) == post_matches_filter(
+                    tag_string, rating, query
+                ), (query, tag_string, rating)
+
+    def test_tags_seen_after_compiling(self):
+        table = TagTable()
+        compiled = TagFilter(table, "-gore")
+        record = PostRecord.from_tag_string(table, 1, "e", "gore")
+        assert not compiled.matches(record)
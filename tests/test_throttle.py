@@ -0,0 +1,142 @@
+import asyncio
+
+import pytest
+import requests
+
+from utilities.booru_upload import UploadTooLarge
+from utilities.throttle import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    Service,
+    ServiceUnavailable,
+    TokenBucket,
+    is_outage,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class HTTPError(Exception):
+    def __init__(self, status):
+        self.status = status
+
+
+class TestTokenBucket:
+    def test_burst_then_waits_for_refill(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2, burst=2, clock=clock)
+        assert [bucket.reserve() for _ in range(4)] == [0.0, 0.0, 0.5, 1.0]
+
+    def test_try_acquire_does_not_borrow(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=1, burst=1, clock=clock)
+        assert bucket.try_acquire()
+        assert not bucket.try_acquire()
+        clock.now = 1.0
+        assert bucket.try_acquire()
+
+
+class TestCircuitBreaker:
+    def test_opens_after_threshold_then_trials(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=clock)
+        breaker.record_failure()
+        assert breaker.state == CLOSED
+        assert breaker.record_failure()
+        assert breaker.state == OPEN and not breaker.allow()
+
+        clock.now = 10
+        assert breaker.state == HALF_OPEN
+        assert breaker.allow()
+        assert not breaker.allow()  # One trial at a time
+
+        breaker.record_success()
+        assert breaker.state == CLOSED and breaker.allow()
+
+    def test_failed_trial_reopens(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock)
+        breaker.record_failure()
+        clock.now = 10
+        assert breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == OPEN
+
+
+class TestIsOutage:
+    def test_client_errors_are_not_outages(self):
+        assert not is_outage(HTTPError(404))
+        assert is_outage(HTTPError(503))
+        assert is_outage(HTTPError(429))
+        assert is_outage(TimeoutError())
+
+    def test_our_own_errors_say_nothing(self):
+        assert is_outage(requests.ConnectionError()) is True
+        assert is_outage(KeyError("id")) is None
+        assert is_outage(UploadTooLarge("60 MB")) is None
+
+
+class TestService:
+    def test_fails_fast_once_open(self):
+        service = Service("booru", rate=100, burst=100, failure_threshold=2)
+        calls = []
+
+        def broken():
+            calls.append(1)
+            raise HTTPError(502)
+
+        for _ in range(2):
+            with pytest.raises(HTTPError):
+                service.call_sync(broken)
+        with pytest.raises(ServiceUnavailable):
+            service.call_sync(broken)
+        assert len(calls) == 2
+        assert service.shed == 1
+        assert "open" in service.status()
+
+    def test_not_found_keeps_the_circuit_closed(self):
+        service = Service("booru", rate=100, burst=100, failure_threshold=1)
+
+        async def missing():
+            raise HTTPError(404)
+
+        with pytest.raises(HTTPError):
+            asyncio.run(service.call(missing))
+        assert service.breaker.state == CLOSED
+
+    def test_our_own_errors_leave_the_circuit_alone(self):
+        service = Service("booru", rate=100, burst=100, failure_threshold=2)
+        service.breaker.record_failure()
+
+        def too_large():
+            raise UploadTooLarge("60 MB")
+
+        for _ in range(3):
+            with pytest.raises(UploadTooLarge):
+                service.call_sync(too_large)
+        assert service.breaker.state == CLOSED
+        assert service.breaker.failures == 1
+
+    def test_optional_work_is_shed_instead_of_waiting(self):
+        clock = FakeClock()
+        service = Service("saucenao", rate=0.1, burst=1, clock=clock)
+
+        async def lookup():
+            return "sauce"
+
+        async def run():
+            first = await service.call(lookup, optional=True)
+            with pytest.raises(ServiceUnavailable):
+                await service.call(lookup, optional=True)
+            return first
+
+        assert asyncio.run(run()) == "sauce"
+        assert service.shed == 1